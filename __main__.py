@@ -0,0 +1,7 @@
+# コマンドラインの入口（python -m <プラグインのフォルダ名>）
+
+import sys
+
+from .processing_provider.cli import main
+
+sys.exit(main())
@@ -0,0 +1,354 @@
+"""コマンドラインからのダウンロード
+
+QGIS の GUI を起動せずに、cron やコンテナからダウンロードを実行する。
+プラグインのフォルダの親をカレントディレクトリ（または PYTHONPATH）にして
+python -m <プラグインのフォルダ名> で実行する。
+
+- download: 範囲（またはポリゴン）を GeoPackage にダウンロードする（QGIS が必要）
+- batch: 範囲のレイヤの地物ごとにダウンロードする（QGIS が必要）
+- prefetch: タイルをキャッシュへ取得・再検証するだけで変換はしない（QGIS は不要）
+
+--progress json を指定すると、進捗とメッセージを JSON Lines で標準出力へ書き出す。
+"""
+
+import argparse
+import signal
+import sys
+
+from .. import settings
+from .log_feedback import LogFeedback
+from .progress_reporter import ProgressReporter
+from .run_metrics import RunMetrics
+from .tile_download import create_tile_cache, create_tile_fetcher, fetch_tiles
+from .tile_index import bbox_tile_cover, split_into_blocks
+
+try:
+    from qgis.core import (
+        QgsApplication,
+        QgsProcessingContext,
+        QgsProcessingFeedback,
+        QgsProject,
+    )
+except ImportError:
+    QgsApplication = None
+
+# 終了コード
+EXIT_OK = 0
+EXIT_FAILED = 1  # エラーが報告された（取得できなかったタイルを含む）
+EXIT_USAGE = 2  # 引数やパラメータの誤り
+EXIT_NO_QGIS = 3  # QGIS が必要なコマンドを QGIS の無い環境で実行した
+EXIT_CANCELED = 130  # SIGINT / SIGTERM で中断した
+
+
+if QgsApplication is not None:
+
+    class _ReporterFeedback(QgsProcessingFeedback):
+        """アルゴリズムのメッセージと進捗を ProgressReporter へ渡す"""
+
+        def __init__(self, reporter):
+            super().__init__()
+            self.reporter = reporter
+            self.progressChanged.connect(reporter.progress)
+
+        def pushInfo(self, info):
+            self.reporter.info(info)
+
+        def pushWarning(self, warning):
+            self.reporter.warning(warning)
+
+        def setProgressText(self, text):
+            self.reporter.info(text)
+
+        def reportError(self, error, fatalError=False):
+            self.reporter.error(error)
+
+
+class _PlainFeedback:
+    """QGIS を使わない処理のための feedback（tile_download.fetch_tiles() 用）"""
+
+    def __init__(self, reporter, steps=1):
+        self.reporter = reporter
+        self.steps = max(1, steps)
+        self.step = 0
+
+    def pushInfo(self, info):
+        self.reporter.info(info)
+
+    def setProgress(self, progress):
+        self.reporter.progress((self.step * 100 + progress) / self.steps)
+
+    def isCanceled(self):
+        return self.reporter.is_canceled()
+
+
+def _layer_keys(value):
+    keys = [key.strip() for key in value.split(",") if key.strip()]
+    unknown = [key for key in keys if key not in settings.SOURCE_LAYERS]
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"unknown source layers: {', '.join(unknown)} "
+            f"(available: {', '.join(settings.SOURCE_LAYERS)})"
+        )
+    return keys
+
+
+def _field_names(value):
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def _extent(value):
+    try:
+        xmin, ymin, xmax, ymax = (float(v) for v in value.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError("extent must be xmin,ymin,xmax,ymax")
+    if xmin >= xmax or ymin >= ymax:
+        raise argparse.ArgumentTypeError("extent must be xmin,ymin,xmax,ymax")
+    return xmin, ymin, xmax, ymax
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Download GSI vector tiles without the QGIS GUI"
+    )
+    parser.add_argument(
+        "--progress",
+        choices=("text", "json"),
+        default="text",
+        help="progress and message format on stdout",
+    )
+    parser.add_argument(
+        "--log-level",
+        choices=("summary", "debug"),
+        help="summary: aggregate per-tile messages, debug: write every message "
+        "(default: settings.LOG_LEVEL)",
+    )
+    parser.add_argument(
+        "--decode-workers",
+        type=int,
+        help="decode tiles in this many processes with the builtin decoder",
+    )
+    parser.add_argument(
+        "--index-fields",
+        type=_field_names,
+        help="comma separated fields to index in the GeoPackage "
+        "(default: settings.GPKG_INDEX_FIELDS, empty for none)",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_output_options(subparser):
+        subparser.add_argument("--zoom", type=int, default=14, help="zoom level")
+        subparser.add_argument("--output", required=True, help="destination folder")
+        subparser.add_argument(
+            "--overzoom",
+            action="store_true",
+            help="fill missing tiles from lower zoom levels",
+        )
+        subparser.add_argument(
+            "--clip", action="store_true", help="clip features to the area"
+        )
+        subparser.add_argument(
+            "--stitch",
+            action="store_true",
+            help="merge features split at tile boundaries",
+        )
+
+    download = subparsers.add_parser("download", help="download an area")
+    area = download.add_mutually_exclusive_group(required=True)
+    area.add_argument("--extent", type=_extent, help="xmin,ymin,xmax,ymax")
+    area.add_argument("--aoi", help="polygon layer of the area (any OGR format)")
+    download.add_argument(
+        "--crs", default="EPSG:4326", help="CRS of --extent (default: EPSG:4326)"
+    )
+    download.add_argument(
+        "--layers", type=_layer_keys, required=True, help="comma separated layers"
+    )
+    download.add_argument(
+        "--incremental",
+        action="store_true",
+        help="update the previous output, rewriting only changed tiles",
+    )
+    download.add_argument(
+        "--max-zoom",
+        type=int,
+        help="export every zoom level from --zoom up to this into one GeoPackage",
+    )
+    add_output_options(download)
+
+    batch = subparsers.add_parser("batch", help="download each area of a layer")
+    batch.add_argument("--input", required=True, help="polygon layer of the areas")
+    batch.add_argument("--name-field", default="", help="area name field")
+    batch.add_argument("--zoom-field", default="", help="zoom level field")
+    batch.add_argument("--layers-field", default="", help="source layers field")
+    batch.add_argument(
+        "--layers",
+        type=_layer_keys,
+        default=[],
+        help="comma separated layers for areas without the layers field",
+    )
+    add_output_options(batch)
+
+    prefetch = subparsers.add_parser(
+        "prefetch", help="download tiles into the tile cache (QGIS not required)"
+    )
+    prefetch.add_argument(
+        "--extent", type=_extent, required=True, help="lon_min,lat_min,lon_max,lat_max"
+    )
+    prefetch.add_argument("--zoom", type=int, default=14, help="zoom level")
+
+    return parser
+
+
+def algorithm_parameters(args):
+    """引数をアルゴリズムのパラメータにする
+
+    Returns:
+        tuple: (アルゴリズムの ID, パラメータの dict)
+    """
+    layer_keys = list(settings.SOURCE_LAYERS.keys())
+    parameters = {
+        "SOURCE_LAYER": [layer_keys.index(key) for key in args.layers],
+        "ZOOM_LEVEL": args.zoom,
+        "OVERZOOM_FALLBACK": args.overzoom,
+        "CLIP_TO_EXTENT": args.clip,
+        "STITCH_FEATURES": args.stitch,
+        "OUTPUT_FOLDER": args.output,
+    }
+    if args.index_fields is not None:
+        parameters["INDEX_FIELDS"] = ",".join(args.index_fields)
+    if args.command == "batch":
+        parameters.update(
+            {
+                "INPUT": args.input,
+                "NAME_FIELD": args.name_field,
+                "ZOOM_FIELD": args.zoom_field,
+                "LAYERS_FIELD": args.layers_field,
+            }
+        )
+        return "gsi_vt_batch_downloader", parameters
+
+    parameters["INCREMENTAL"] = args.incremental
+    if args.max_zoom is not None:
+        parameters["MAX_ZOOM_LEVEL"] = args.max_zoom
+    if args.aoi:
+        parameters["INPUT_AOI"] = args.aoi
+    else:
+        xmin, ymin, xmax, ymax = args.extent
+        # QGIS の範囲パラメータの文字列は xmin,xmax,ymin,ymax [CRS] の順
+        parameters["INPUT_EXTENT"] = f"{xmin},{xmax},{ymin},{ymax} [{args.crs}]"
+    return "gsi_vt_downloader", parameters
+
+
+def _handle_signals(callback):
+    """SIGINT / SIGTERM を受けたら callback を呼び、処理を中断させる"""
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: callback())
+
+
+def run_algorithm(algorithm_id, parameters, reporter):
+    """スタンドアロンの QgsApplication でアルゴリズムを実行し、終了コードを返す"""
+    if QgsApplication is None:
+        reporter.error("QGIS Python bindings are not available")
+        return EXIT_NO_QGIS
+
+    from .gsi_vt_dl_provider import GSIVectorTileProvider
+
+    app = QgsApplication([], False)
+    app.initQgis()
+    try:
+        provider = GSIVectorTileProvider()
+        QgsApplication.processingRegistry().addProvider(provider)
+        algorithm = QgsApplication.processingRegistry().createAlgorithmById(
+            f"{provider.id()}:{algorithm_id}"
+        )
+
+        context = QgsProcessingContext()
+        context.setProject(QgsProject.instance())
+        feedback = _ReporterFeedback(reporter)
+
+        def cancel():
+            reporter.cancel()
+            feedback.cancel()
+
+        _handle_signals(cancel)
+
+        ok, message = algorithm.checkParameterValues(parameters, context)
+        if not ok:
+            reporter.error(message)
+            return EXIT_USAGE
+
+        results, ok = algorithm.run(parameters, context, feedback)
+        if results and "METRICS" in results:
+            reporter.metrics(results["METRICS"])
+        if feedback.isCanceled():
+            return EXIT_CANCELED
+        if not ok or reporter.errors:
+            return EXIT_FAILED
+        return EXIT_OK
+    finally:
+        app.exitQgis()
+
+
+def prefetch(args, reporter):
+    """範囲のタイルをキャッシュへ取得・再検証し、終了コードを返す"""
+    _handle_signals(reporter.cancel)
+    xmin, ymin, xmax, ymax = args.extent
+    tileindex = bbox_tile_cover([xmin, ymin], [xmax, ymax], args.zoom)
+    blocks = split_into_blocks(tileindex, settings.TILE_BLOCK_SIZE)
+    reporter.info(f"Prefetching {len(tileindex)} tiles in {len(blocks)} blocks")
+
+    plain_feedback = _PlainFeedback(reporter, len(blocks))
+    feedback = LogFeedback(
+        plain_feedback, settings.LOG_LEVEL, settings.LOG_SUMMARY_INTERVAL
+    )
+    metrics = RunMetrics()
+    failed = set()
+    prefetched = 0
+    cache = create_tile_cache()
+    fetcher = create_tile_fetcher()
+    try:
+        for block_number, block in enumerate(blocks):
+            if reporter.is_canceled():
+                break
+            plain_feedback.step = block_number
+            with metrics.phase("fetch"):
+                failed |= fetch_tiles(block, cache, feedback, fetcher, metrics=metrics)
+            metrics.add("tiles_processed", len(block))
+            cache.touch(block)
+            cache.evict(protect=block)
+            prefetched += len(block)
+            feedback.pushSummary(
+                f"Prefetched {prefetched}/{len(tileindex)} tiles",
+                force=block_number == len(blocks) - 1,
+            )
+    finally:
+        metrics.add("retries", fetcher.retries)
+        fetcher.close()
+        cache.close()
+
+    reporter.metrics(metrics.report(tiles=len(tileindex), failed_tiles=len(failed)))
+
+    if reporter.is_canceled():
+        return EXIT_CANCELED
+    if failed:
+        reporter.error(f"{len(failed)} tiles could not be downloaded")
+        return EXIT_FAILED
+    reporter.progress(100)
+    return EXIT_OK
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.log_level:
+        settings.LOG_LEVEL = args.log_level
+    if args.decode_workers:
+        settings.MVT_DECODER = "python"
+        settings.DECODE_WORKERS = args.decode_workers
+    reporter = ProgressReporter(sys.stdout, json_lines=args.progress == "json")
+
+    if args.command == "prefetch":
+        exit_code = prefetch(args, reporter)
+    else:
+        exit_code = run_algorithm(*algorithm_parameters(args), reporter)
+
+    reporter.finished(exit_code)
+    return exit_code
@@ -0,0 +1,64 @@
+"""内蔵デコーダ（mvt_decoder）によるタイルの並列デコード
+
+ワーカーは spawn で起動する（QGIS のスレッドを fork で複製しないため）。
+"""
+
+import concurrent.futures
+import multiprocessing
+import os
+import shutil
+import sys
+
+from .mvt_decoder import decode_tile
+
+
+def _decode(args):
+    """ワーカーで1タイルをデコードする。例外は文字列にして返す"""
+    data, xyz, layer_names = args
+    try:
+        return decode_tile(data, xyz, layer_names), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def _python_executable():
+    """ワーカーを起動する Python の実行ファイル
+
+    QGIS に組み込まれた Python では sys.executable が QGIS 本体を指すため、
+    同じ環境の Python を探す。
+    """
+    if os.path.basename(sys.executable).lower().startswith("python"):
+        return sys.executable
+    candidates = [
+        os.path.join(sys.exec_prefix, "python.exe"),
+        os.path.join(sys.exec_prefix, "bin", "python3"),
+        shutil.which("python3"),
+    ]
+    for candidate in candidates:
+        if candidate and os.path.exists(candidate):
+            return candidate
+    return sys.executable
+
+
+class DecodePool:
+    def __init__(self, workers):
+        context = multiprocessing.get_context("spawn")
+        context.set_executable(_python_executable())
+        self.workers = workers
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=context
+        )
+
+    def decode(self, tiles, layer_names=None):
+        """(xyz, bytes) のリストをデコードし、(xyz, レイヤ, エラー) を入力の順に返す"""
+        if layer_names is not None:
+            layer_names = list(layer_names)
+        jobs = [(data, xyz, layer_names) for xyz, data in tiles]
+        # 1タイルごとのやり取りの負荷を減らすため、ワーカーあたり数回に分けて渡す
+        chunksize = max(1, len(jobs) // (self.workers * 4))
+        results = self._executor.map(_decode, jobs, chunksize=chunksize)
+        for (xyz, _), (layers, error) in zip(tiles, results):
+            yield xyz, layers, error
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
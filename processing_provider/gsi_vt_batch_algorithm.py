@@ -0,0 +1,422 @@
+import os
+import re
+
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransform,
+    QgsProcessing,
+    QgsProcessingOutputFile,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterField,
+    QgsProcessingParameterFolderDestination,
+    QgsProcessingParameterNumber,
+    QgsWkbTypes,
+)
+
+from .. import settings
+from .gsi_vt_dl_algorithm import (
+    DEFAULT_MAX_ZOOM,
+    DEFAULT_MIN_ZOOM,
+    SOURCE_LAYERS,
+    GSIVectorTileDownloadAlgorithm,
+)
+from .layer_sink import SinkGroup
+from .run_metrics import RunMetrics
+from .tile_download import create_tile_fetcher
+from .tile_index import TileSet, polygon_tile_cover, tile_size
+
+
+class GSIVectorTileBatchDownloadAlgorithm(GSIVectorTileDownloadAlgorithm):
+    """範囲のレイヤの地物ごとにベクトルタイルをダウンロードする
+
+    近くの範囲をまとめたグループごとに、タイルの和集合を1度だけ取得・デコードし、
+    地物を範囲ごとの出力へ振り分ける。グループ内で範囲が重なっていても共通の
+    タイルは1回しか処理しない。同時に開く出力ファイルは settings.BATCH_MAX_OPEN_SINKS
+    までに抑え、グループの処理を終えるごとに閉じる。
+    """
+
+    INPUT = "INPUT"
+    NAME_FIELD = "NAME_FIELD"
+    ZOOM_FIELD = "ZOOM_FIELD"
+    LAYERS_FIELD = "LAYERS_FIELD"
+
+    def initAlgorithm(self, config=None):
+        # Download-areas (one output per feature)
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(
+                self.INPUT,
+                self.tr("Download areas"),
+                [QgsProcessing.TypeVectorPolygon],
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterField(
+                self.NAME_FIELD,
+                self.tr("Area name field"),
+                parentLayerParameterName=self.INPUT,
+                optional=True,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterField(
+                self.ZOOM_FIELD,
+                self.tr("Zoom level field"),
+                parentLayerParameterName=self.INPUT,
+                type=QgsProcessingParameterField.Numeric,
+                optional=True,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterField(
+                self.LAYERS_FIELD,
+                self.tr("Source layers field (comma separated layer names)"),
+                parentLayerParameterName=self.INPUT,
+                type=QgsProcessingParameterField.String,
+                optional=True,
+            )
+        )
+
+        # Defaults for areas without zoom level or source layers
+        layer_options = [self._get_display_name(key) for key in SOURCE_LAYERS]
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.SOURCE_LAYER,
+                self.tr("Source layers"),
+                allowMultiple=True,
+                optional=True,
+                options=layer_options,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.ZOOM_LEVEL,
+                self.tr("Zoom level"),
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=4,
+                maxValue=16,
+                defaultValue=14,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.OVERZOOM_FALLBACK,
+                self.tr("Fill missing tiles from lower zoom levels"),
+                defaultValue=False,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.CLIP_TO_EXTENT,
+                self.tr("Clip features to the download areas"),
+                defaultValue=False,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.STITCH_FEATURES,
+                self.tr("Merge features split at tile boundaries"),
+                defaultValue=False,
+            )
+        )
+        self.add_index_fields_parameter()
+
+        # Output folder. A subfolder is created for each area
+        self.addParameter(
+            QgsProcessingParameterFolderDestination(
+                "OUTPUT_FOLDER", self.tr("Destination folder"), optional=False
+            )
+        )
+
+        # Run report (phase timings and counters as JSON)
+        self.addOutput(QgsProcessingOutputFile(self.REPORT, self.tr("Run report")))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        self.metrics = RunMetrics()
+
+        # parameters
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        name_field = self.parameterAsString(parameters, self.NAME_FIELD, context)
+        zoom_field = self.parameterAsString(parameters, self.ZOOM_FIELD, context)
+        layers_field = self.parameterAsString(parameters, self.LAYERS_FIELD, context)
+        layer_keys = list(SOURCE_LAYERS.keys())
+        default_layer_keys = [
+            layer_keys[i]
+            for i in self.parameterAsEnums(parameters, self.SOURCE_LAYER, context)
+        ]
+        default_zoom = self.parameterAsInt(parameters, self.ZOOM_LEVEL, context)
+        overzoom = self.parameterAsBoolean(parameters, self.OVERZOOM_FALLBACK, context)
+        stitch = self.parameterAsBoolean(parameters, self.STITCH_FEATURES, context)
+        clip = self.parameterAsBoolean(parameters, self.CLIP_TO_EXTENT, context)
+        self.index_fields = self.read_index_fields(parameters, context)
+
+        output_folder = self.parameterAsString(parameters, "OUTPUT_FOLDER", context)
+        os.makedirs(output_folder, exist_ok=True)
+
+        sites = self.read_sites(
+            source,
+            name_field,
+            zoom_field,
+            layers_field,
+            default_zoom,
+            default_layer_keys,
+            context,
+            feedback,
+        )
+        if not sites:
+            feedback.reportError("No download areas to process")
+            return {}
+
+        # ズームレベルごとに全範囲のタイルの和集合を1度だけ処理する
+        zoom_levels = sorted({site["zoom_level"] for site in sites})
+        cache = self.create_tile_cache()
+        fetcher = create_tile_fetcher()
+        self.decode_pool = self.create_decode_pool(feedback)
+        failed = 0
+        try:
+            for zoom_level in zoom_levels:
+                for site_group in self.group_sites(
+                    [site for site in sites if site["zoom_level"] == zoom_level],
+                    settings.BATCH_MAX_OPEN_SINKS,
+                ):
+                    if feedback.isCanceled():
+                        break
+                    failed += self.download_sites(
+                        site_group,
+                        zoom_level,
+                        output_folder,
+                        cache,
+                        fetcher,
+                        feedback,
+                        overzoom,
+                        clip,
+                        stitch,
+                    )
+        finally:
+            self.metrics.add("retries", fetcher.retries)
+            fetcher.close()
+            self.close_decode_pool()
+            cache.close()
+
+        return self.write_report(
+            output_folder,
+            feedback,
+            zoom_levels=zoom_levels,
+            sites=len(sites),
+            failed_tiles=failed,
+        )
+
+    def read_sites(
+        self,
+        source,
+        name_field,
+        zoom_field,
+        layers_field,
+        default_zoom,
+        default_layer_keys,
+        context,
+        feedback,
+    ):
+        """範囲の地物を読み、範囲ごとの名前・ポリゴン・ズームレベル・レイヤを返す
+
+        Returns:
+            list: dict(name, aoi, zoom_level, layer_keys) のリスト。
+                aoi は EPSG:3857 の QgsGeometry
+        """
+        transform = QgsCoordinateTransform(
+            source.sourceCrs(),
+            QgsCoordinateReferenceSystem("EPSG:3857"),
+            context.transformContext(),
+        )
+
+        sites = []
+        names = set()
+        for feature in source.getFeatures():
+            geometry = feature.geometry()
+            if geometry.isNull() or geometry.type() != QgsWkbTypes.PolygonGeometry:
+                continue
+            geometry.transform(transform)
+            geometry.convertToMultiType()
+
+            name = str(feature[name_field]) if name_field else ""
+            # 出力フォルダ名に使えない文字は置き換え、重複する名前には ID を付ける
+            name = re.sub(r'[\\/:*?"<>|]', "_", name).strip() or str(feature.id())
+            if name in names:
+                name = f"{name}_{feature.id()}"
+            names.add(name)
+
+            zoom_level = default_zoom
+            if zoom_field and feature[zoom_field] not in (None, ""):
+                try:
+                    zoom_level = int(feature[zoom_field])
+                except (TypeError, ValueError):
+                    feedback.reportError(
+                        f"{name}: invalid zoom level '{feature[zoom_field]}', "
+                        f"using z{default_zoom}"
+                    )
+
+            layer_keys = default_layer_keys
+            if layers_field and feature[layers_field]:
+                layer_keys = [
+                    key.strip()
+                    for key in str(feature[layers_field]).split(",")
+                    if key.strip()
+                ]
+
+            target_layer_keys = []
+            for layer_key in layer_keys:
+                if layer_key not in SOURCE_LAYERS:
+                    feedback.reportError(f"{name}: unknown source layer '{layer_key}'")
+                    continue
+                layer_info = SOURCE_LAYERS[layer_key]
+                min_zoom = layer_info.get("minzoom", DEFAULT_MIN_ZOOM)
+                max_zoom = layer_info.get("maxzoom", DEFAULT_MAX_ZOOM)
+                if zoom_level < min_zoom or zoom_level > max_zoom:
+                    feedback.reportError(
+                        f"{name}: zoom level z{zoom_level} is not available "
+                        f"for '{layer_key}' (available: {min_zoom}-{max_zoom})"
+                    )
+                    continue
+                target_layer_keys.append(layer_key)
+
+            if not target_layer_keys:
+                feedback.reportError(f"{name}: no source layers to download")
+                continue
+
+            sites.append(
+                {
+                    "name": name,
+                    "aoi": geometry,
+                    "zoom_level": zoom_level,
+                    "layer_keys": target_layer_keys,
+                }
+            )
+
+        return sites
+
+    def group_sites(self, sites, max_sinks):
+        """範囲を、出力先の数の合計が max_sinks 以下のグループに分ける
+
+        共通のタイルが同じグループに入るよう、範囲の中心の位置の順に並べてから分ける。
+        """
+        cell = tile_size(8)
+
+        def position(site):
+            center = site["aoi"].boundingBox().center()
+            return (round(-center.y() / cell), center.x())
+
+        groups = []
+        group = []
+        group_sinks = 0
+        for site in sorted(sites, key=position):
+            sink_count = len(site["layer_keys"])
+            if group and group_sinks + sink_count > max_sinks:
+                groups.append(group)
+                group = []
+                group_sinks = 0
+            group.append(site)
+            group_sinks += sink_count
+        if group:
+            groups.append(group)
+        return groups
+
+    def download_sites(
+        self,
+        sites,
+        zoom_level,
+        output_folder,
+        cache,
+        fetcher,
+        feedback,
+        overzoom=False,
+        clip=False,
+        stitch=False,
+    ):
+        """同じズームレベルの範囲をまとめてダウンロードし、範囲ごとに書き出す
+
+        Returns:
+            int: 取得できなかったタイルの数
+        """
+        tiles = TileSet()
+        site_tiles = 0
+        sinks = {}
+        for site in sites:
+            with self.metrics.phase("tile_index"):
+                site_tileindex = polygon_tile_cover(
+                    self.aoi_polygons(site["aoi"]), zoom_level
+                )
+            site_tiles += len(site_tileindex)
+            tiles |= TileSet.from_tiles(site_tileindex)
+
+            site_folder = os.path.join(output_folder, site["name"])
+            os.makedirs(site_folder, exist_ok=True)
+            rect = site["aoi"].boundingBox()
+            bbox = [rect.xMinimum(), rect.xMaximum(), rect.yMinimum(), rect.yMaximum()]
+            for layer_key in site["layer_keys"]:
+                layer_name = f"{layer_key}_z{zoom_level}"
+                try:
+                    sink = self.create_sink(
+                        layer_key,
+                        layer_name,
+                        bbox,
+                        os.path.join(site_folder, f"{layer_name}.gpkg"),
+                        clip=clip,
+                        aoi=site["aoi"],
+                    )
+                except RuntimeError as e:
+                    feedback.reportError(
+                        f"{site['name']}: failed to save {layer_name}. Result : {e}"
+                    )
+                    continue
+                sinks.setdefault(layer_key, []).append(sink)
+
+        groups = {
+            layer_key: SinkGroup(layer_key, layer_sinks)
+            for layer_key, layer_sinks in sinks.items()
+        }
+        tileindex = tiles.tiles()
+        feedback.pushInfo(
+            f"z{zoom_level}: {len(sites)} areas, {site_tiles} tiles "
+            f"({len(tileindex)} unique tiles)"
+        )
+        if not groups or not tileindex:
+            return 0
+
+        failed_tiles = self.download_tiles(
+            tileindex, groups, cache, feedback, overzoom=overzoom, fetcher=fetcher
+        )
+        if failed_tiles:
+            self.report_failed_tiles(failed_tiles, feedback, False)
+
+        if stitch and not feedback.isCanceled():
+            if failed_tiles:
+                feedback.reportError(
+                    "Skipped merging features split at tile boundaries "
+                    "because some tiles are missing"
+                )
+            else:
+                self.stitch_sinks(groups, zoom_level, feedback)
+
+        for group in groups.values():
+            for sink in group.sinks:
+                self.metrics.add("features_written", sink.feature_count)
+                if sink.feature_count == 0:
+                    sink.discard()
+                    continue
+                sink.close()
+                feedback.pushInfo(
+                    f"File saved : {sink.output_path} ({sink.feature_count} features)"
+                )
+
+        return len(failed_tiles)
+
+    def name(self):
+        return "gsi_vt_batch_downloader"
+
+    def displayName(self):
+        return self.tr("GSI Vector Tiles Batch Downloader")
+
+    def createInstance(self):
+        return GSIVectorTileBatchDownloadAlgorithm()
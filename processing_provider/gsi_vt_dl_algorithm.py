@@ -1,27 +1,51 @@
-import math
+import contextlib
+import hashlib
 import os
-import tempfile
-import urllib.error
-import urllib.request
 
-import processing
+from osgeo import gdal
 from qgis.core import (
     QgsCoordinateReferenceSystem,
     QgsCoordinateTransform,
+    QgsGeometry,
+    QgsProcessing,
     QgsProcessingAlgorithm,
+    QgsProcessingMultiStepFeedback,
+    QgsProcessingOutputFile,
+    QgsProcessingParameterBoolean,
     QgsProcessingParameterEnum,
     QgsProcessingParameterExtent,
+    QgsProcessingParameterFeatureSource,
     QgsProcessingParameterFolderDestination,
     QgsProcessingParameterNumber,
+    QgsProcessingParameterString,
     QgsProject,
-    QgsVectorFileWriter,
+    QgsRectangle,
     QgsVectorLayer,
+    QgsWkbTypes,
 )
-from qgis.PyQt.QtCore import QCoreApplication, QVariant
+from qgis.PyQt.QtCore import QCoreApplication
 
 from .. import settings
+from .decode_pool import DecodePool
+from .job_manifest import MANIFEST_FILENAME, JobManifest, tile_key
+from .layer_sink import GeoPackageSink, LayerSink
+from .log_feedback import BufferedFeedback, LogFeedback
+from .mvt_decoder import decode_tile
+from .pipeline import Stage
+from .run_metrics import REPORT_FILENAME, RunMetrics
+from .stitching import TileGrid
+from .tile_download import create_tile_cache, create_tile_fetcher, fetch_tiles
+from .tile_index import (
+    TileSet,
+    bbox_tile_cover,
+    lonlat_to_webmercator,
+    parent_tile,
+    polygon_tile_cover,
+    split_into_blocks,
+    tile_bounds,
+    tile_size,
+)
 
-TMP_PATH = os.path.join(tempfile.gettempdir(), "vtdownloader")
 SOURCE_LAYERS = settings.SOURCE_LAYERS
 DEFAULT_MIN_ZOOM = settings.DEFAULT_MIN_ZOOM
 DEFAULT_MAX_ZOOM = settings.DEFAULT_MAX_ZOOM
@@ -42,9 +66,26 @@ TILES_LIMIT = settings.TILES_LIMIT
 
 class GSIVectorTileDownloadAlgorithm(QgsProcessingAlgorithm):
     INPUT_EXTENT = "INPUT_EXTENT"
+    INPUT_AOI = "INPUT_AOI"
     SOURCE_LAYER = "SOURCE_LAYER"
     ZOOM_LEVEL = "ZOOM_LEVEL"
+    MAX_ZOOM_LEVEL = "MAX_ZOOM_LEVEL"
+    OVERZOOM_FALLBACK = "OVERZOOM_FALLBACK"
+    STITCH_FEATURES = "STITCH_FEATURES"
+    CLIP_TO_EXTENT = "CLIP_TO_EXTENT"
+    INCREMENTAL = "INCREMENTAL"
+    INDEX_FIELDS = "INDEX_FIELDS"
     OUTPUT = "OUTPUT"
+    REPORT = "REPORT"
+
+    # DecodePool。ジョブの間だけ create_decode_pool() で作る
+    decode_pool = None
+    # 出力の GeoPackage に属性索引を作るフィールド名。None の場合は settings の既定値
+    index_fields = None
+
+    def __init__(self):
+        super().__init__()
+        self.metrics = RunMetrics()
 
     def _get_display_name(self, layer_key):
         layer_value = SOURCE_LAYERS[layer_key]
@@ -66,7 +107,17 @@ class GSIVectorTileDownloadAlgorithm(QgsProcessingAlgorithm):
             QgsProcessingParameterExtent(
                 self.INPUT_EXTENT,
                 self.tr("Download extent"),
-                optional=False,
+                optional=True,
+            )
+        )
+
+        # Download-area as polygons (takes precedence over the extent)
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(
+                self.INPUT_AOI,
+                self.tr("Download area (polygons)"),
+                [QgsProcessing.TypeVectorPolygon],
+                optional=True,
             )
         )
 
@@ -98,6 +149,57 @@ class GSIVectorTileDownloadAlgorithm(QgsProcessingAlgorithm):
             )
         )
 
+        # Export every zoom level from ZOOM_LEVEL up to this into one GeoPackage
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MAX_ZOOM_LEVEL,
+                self.tr("Maximum zoom level (export a pyramid of zoom levels)"),
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=4,
+                maxValue=16,
+                optional=True,
+            )
+        )
+
+        # Fill tiles missing at the zoom level from a lower zoom level
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.OVERZOOM_FALLBACK,
+                self.tr("Fill missing tiles from lower zoom levels"),
+                defaultValue=False,
+            )
+        )
+
+        # Cut features crossing the extent boundary
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.CLIP_TO_EXTENT,
+                self.tr("Clip features to the download extent"),
+                defaultValue=False,
+            )
+        )
+
+        # Merge features split at tile boundaries and remove duplicated points
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.STITCH_FEATURES,
+                self.tr("Merge features split at tile boundaries"),
+                defaultValue=False,
+            )
+        )
+
+        # Update the output of the previous run, rewriting only changed tiles
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.INCREMENTAL,
+                self.tr("Update the previous output (rewrite only changed tiles)"),
+                defaultValue=False,
+            )
+        )
+
+        # Fields to index in the output GeoPackages (comma separated)
+        self.add_index_fields_parameter()
+
         # Output folder. If not specified, output is added as temporary layers
         self.addParameter(
             QgsProcessingParameterFolderDestination(
@@ -105,23 +207,82 @@ class GSIVectorTileDownloadAlgorithm(QgsProcessingAlgorithm):
             )
         )
 
+        # Run report (phase timings and counters as JSON)
+        self.addOutput(QgsProcessingOutputFile(self.REPORT, self.tr("Run report")))
+
+    def add_index_fields_parameter(self):
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.INDEX_FIELDS,
+                self.tr("Fields to index in the output (comma separated)"),
+                defaultValue=",".join(settings.GPKG_INDEX_FIELDS),
+                optional=True,
+            )
+        )
+
+    def read_index_fields(self, parameters, context):
+        """INDEX_FIELDS パラメータのフィールド名のリスト"""
+        value = self.parameterAsString(parameters, self.INDEX_FIELDS, context)
+        return [name.strip() for name in value.split(",") if name.strip()]
+
     def processAlgorithm(self, parameters, context, feedback):
+        self.metrics = RunMetrics()
+
         # parameters
         extent = self.parameterAsExtent(parameters, self.INPUT_EXTENT, context)
         source_layer_indices = self.parameterAsEnums(
             parameters, self.SOURCE_LAYER, context
         )
         zoom_level = self.parameterAsInt(parameters, self.ZOOM_LEVEL, context)
+        max_zoom_level = zoom_level
+        if parameters.get(self.MAX_ZOOM_LEVEL) not in (None, ""):
+            max_zoom_level = self.parameterAsInt(
+                parameters, self.MAX_ZOOM_LEVEL, context
+            )
+        overzoom = self.parameterAsBoolean(parameters, self.OVERZOOM_FALLBACK, context)
+        stitch = self.parameterAsBoolean(parameters, self.STITCH_FEATURES, context)
+        clip = self.parameterAsBoolean(parameters, self.CLIP_TO_EXTENT, context)
+        incremental = self.parameterAsBoolean(parameters, self.INCREMENTAL, context)
+        self.index_fields = self.read_index_fields(parameters, context)
 
         output_folder = self.parameterAsString(parameters, "OUTPUT_FOLDER", context)
         if output_folder:
             os.makedirs(output_folder, exist_ok=True)
 
+        # 差分更新は地物をタイル単位で置き換えるため、複数のタイルにまたがる
+        # 地物を作る結合・親タイルからの補完とは併用できない
+        if incremental and (stitch or overzoom or not output_folder):
+            feedback.reportError(
+                "Updating the previous output requires a destination folder and "
+                "cannot be combined with merging features or filling missing tiles"
+            )
+            return {}
+
+        # ポリゴンの範囲（EPSG:3857）。指定された場合は外接矩形を範囲とする
+        aoi = None
+        aoi_source = self.parameterAsSource(parameters, self.INPUT_AOI, context)
+        if aoi_source is not None:
+            aoi = self.read_aoi(aoi_source, context)
+            if aoi is None:
+                feedback.reportError("The download area has no polygons")
+                return {}
+            transform = QgsCoordinateTransform(
+                QgsCoordinateReferenceSystem("EPSG:3857"),
+                QgsCoordinateReferenceSystem("EPSG:4326"),
+                context.transformContext(),
+            )
+            extent = transform.transformBoundingBox(aoi.boundingBox())
+            feedback.pushInfo("Using the polygons as the download area")
+        elif extent.isNull():
+            feedback.reportError("Specify a download extent or a download area")
+            return {}
+
         # convert extent to EPSG: 4326
         extent_crs = self.parameterAsExtentCrs(parameters, self.INPUT_EXTENT, context)
-        feedback.pushInfo(f"Input extent CRS: {extent_crs.authid()}")
+        if aoi is None:
+            feedback.pushInfo(f"Input extent CRS: {extent_crs.authid()}")
 
-        if extent_crs.authid() != "EPSG:4326":
+        if aoi is None and extent_crs.authid() != "EPSG:4326":
             transform = QgsCoordinateTransform(
                 extent_crs, QgsCoordinateReferenceSystem("EPSG:4326"), context.project()
             )
@@ -139,6 +300,11 @@ class GSIVectorTileDownloadAlgorithm(QgsProcessingAlgorithm):
 
         error_reported = []
 
+        # ピラミッド出力では指定範囲を各レイヤの minzoom / maxzoom に収める
+        zoom_levels = range(zoom_level, max(zoom_level, max_zoom_level) + 1)
+        pyramid = len(zoom_levels) > 1
+
+        targets = {}
         for source_layer_index in source_layer_indices:
             layer_key = layer_keys[source_layer_index]
 
@@ -148,149 +314,331 @@ class GSIVectorTileDownloadAlgorithm(QgsProcessingAlgorithm):
             layer_info = SOURCE_LAYERS[layer_key]
             min_zoom = layer_info.get("minzoom", DEFAULT_MIN_ZOOM)
             max_zoom = layer_info.get("maxzoom", DEFAULT_MAX_ZOOM)
-            if zoom_level < min_zoom or zoom_level > max_zoom:
+            layer_zoom_levels = [z for z in zoom_levels if min_zoom <= z <= max_zoom]
+            if not layer_zoom_levels:
+                if pyramid:
+                    specified = f"z{zoom_levels[0]}-{zoom_levels[-1]}"
+                else:
+                    specified = f"z{zoom_level}"
                 message = (
-                    f"Specified zoom level (z{zoom_level}) is not available "
+                    f"Specified zoom level ({specified}) is not available "
                     f"for data '{layer_key} ({data_name})' \n"
                     f"Available zoom levels: {min_zoom}-{max_zoom} \n"
                 )
                 feedback.reportError(message)
                 error_reported.append(f"{layer_key} : {message}\n")
                 continue
+            if len(layer_zoom_levels) < len(zoom_levels):
+                feedback.pushInfo(
+                    f"'{layer_key}' is available at z{min_zoom}-{max_zoom}: "
+                    f"exporting z{layer_zoom_levels[0]}-{layer_zoom_levels[-1]}"
+                )
 
-            feedback.pushInfo(f"Downloading {layer_key} at zoom level {zoom_level}")
+            for z in layer_zoom_levels:
+                targets.setdefault(z, []).append(layer_key)
 
-            # タイルインデックス
-            tileindex = self.create_tile_index_from_bbox(
-                leftbottom_lonlat, righttop_lonlat, zoom_level
+        # タイルインデックス（ズームレベルごとに全レイヤ共通）
+        tileindexes = {}
+        for z, target_layer_keys in sorted(targets.items()):
+            feedback.pushInfo(
+                f"Downloading {', '.join(target_layer_keys)} at zoom level {z}"
             )
+            with self.metrics.phase("tile_index"):
+                if aoi is not None:
+                    tileindex = polygon_tile_cover(self.aoi_polygons(aoi), z)
+                else:
+                    tileindex = self.create_tile_index_from_bbox(
+                        leftbottom_lonlat, righttop_lonlat, z
+                    )
 
             if not tileindex:
                 message = "No tiles found for the specified extent"
                 feedback.reportError(message)
+                for layer_key in target_layer_keys:
+                    error_reported.append(f"{layer_key} : {message}\n")
+            else:
+                feedback.pushInfo(f"Found {len(tileindex)} tiles to download")
+                tileindexes[z] = tileindex
+        targets = {z: targets[z] for z in tileindexes}
+
+        # 出力フォルダがあればブロックごとに書き出すのでタイル数の上限は無い
+        total_tiles = sum(len(tileindex) for tileindex in tileindexes.values())
+        if not output_folder and total_tiles > TILES_LIMIT:
+            message = (
+                f"Too many tiles to download (Tiles limit: {TILES_LIMIT}).\n"
+                "Please specify a destination folder, "
+                f"a zoom level lower than z{zoom_levels[-1]} "
+                "or a smaller extent.\nProcess stopping..."
+            )
+            feedback.reportError(message)
+            for layer_key in {key for keys in targets.values() for key in keys}:
                 error_reported.append(f"{layer_key} : {message}\n")
-                continue
-
-            feedback.pushInfo(f"Found {len(tileindex)} tiles to download")
-
-            if len(tileindex) > TILES_LIMIT:
-                message = (
-                    f"Too many tiles to download (Tiles limit: {TILES_LIMIT}).\n"
-                    f"Please specified a zoom level lower than z{zoom_level} "
-                    "or a smaller extent.\nProcess stopping..."
+            targets = {}
+
+        # 出力ファイル（ピラミッド出力では全ズームレベルのレイヤを1つの GeoPackage にまとめる）
+        def output_path_of(layer_name):
+            if not output_folder:
+                return None
+            if pyramid:
+                filename = f"gsi_vt_z{zoom_levels[0]}-{zoom_levels[-1]}.gpkg"
+            else:
+                filename = f"{layer_name}.gpkg"
+            return os.path.join(output_folder, filename)
+
+        # ジョブマニフェスト（同じパラメータで中断したジョブがあれば再開する）
+        manifest = None
+        if output_folder and targets:
+            manifest = JobManifest(
+                os.path.join(output_folder, MANIFEST_FILENAME),
+                self.job_params(
+                    leftbottom_lonlat,
+                    righttop_lonlat,
+                    zoom_level,
+                    sorted({key for keys in targets.values() for key in keys}),
+                    overzoom,
+                    clip,
+                    aoi,
+                    zoom_levels[-1],
+                    incremental,
+                ),
+            )
+            # 地物が無く削除した出力は、無くても前回の出力が失われたとはみなさない
+            outputs_exist = all(
+                os.path.exists(output_path_of(f"{layer_key}_z{z}"))
+                for z, target_layer_keys in targets.items()
+                for layer_key in target_layer_keys
+                if f"{layer_key}_z{z}" not in manifest.empty_layers
+            )
+            if manifest.resumed and not outputs_exist:
+                manifest.restart()
+            if manifest.resumed:
+                feedback.pushInfo(
+                    f"Resuming job: {len(manifest.completed)} tiles already completed"
                 )
-                feedback.reportError(message)
-                error_reported.append(f"{layer_key} : {message}\n")
-                continue
 
-            # ダウンロード実行
-            os.makedirs(TMP_PATH, exist_ok=True)
-            mergedlayer = self.download_tiles(tileindex, layer_key, feedback)
-
-            if mergedlayer is None:
-                message = "No valid features found in the specified area"
-                feedback.reportError(message)
-                error_reported.append(f"{layer_key} : {message}\n")
-                continue
-
-            # クリップ処理
-            bbox = self.make_bbox(leftbottom_lonlat, righttop_lonlat)
-            mergedlayer = self.clip_vlayer(bbox, mergedlayer)
-            feedback.pushInfo("✓ Successfully clipped features to specified extent")
-            feedback.pushInfo(f"Final feature count: {mergedlayer.featureCount()}")
-
-            layer_name = f"{layer_key}_z{zoom_level}"
-
-            if output_folder:
-                # Save output to geopackage
-                output_path = os.path.join(output_folder, f"{layer_name}.gpkg")
+        # 差分更新（前回の出力を開き、変更のあったタイルの地物だけを置き換える）。
+        # 中断した差分更新の再開では、未処理のタイルを全て置き換え対象とする
+        previous_digests = None
+        update = False
+        if incremental and manifest is not None:
+            previous_digests = manifest.previous_digests if outputs_exist else {}
+            update = manifest.resumed or bool(previous_digests)
+            if previous_digests:
+                feedback.pushInfo(
+                    "Updating the previous output: "
+                    f"{len(previous_digests)} tiles to compare"
+                )
 
-                options = QgsVectorFileWriter.SaveVectorOptions()
-                options.driverName = "GPKG"
+        # 出力先（GeoPackage へは地物を溜めずにタイルごとに追記する）
+        bbox = self.make_bbox(leftbottom_lonlat, righttop_lonlat)
+        resume = manifest is not None and manifest.resumed
+        tile_id_field = settings.TILE_ID_FIELD if incremental else None
+        sinks = {}
+        created_paths = set()
+        for z, target_layer_keys in targets.items():
+            for layer_key in target_layer_keys:
+                layer_name = f"{layer_key}_z{z}"
+                output_path = output_path_of(layer_name)
+                # 前回地物が無く削除したレイヤは作り直す。既存のファイルは上書きしない
+                append = (resume or update) and layer_name not in manifest.empty_layers
+                try:
+                    sink = self.create_sink(
+                        layer_key,
+                        layer_name,
+                        bbox,
+                        output_path,
+                        append=append,
+                        clip=clip,
+                        aoi=aoi,
+                        new_file=not (resume or update)
+                        and output_path not in created_paths,
+                        tile_id_field=tile_id_field,
+                    )
+                    created_paths.add(output_path)
+                    if resume and not update:
+                        # 最後のチェックポイントより後に書かれた地物は再処理するので消す
+                        sink.truncate(manifest.last_fids.get(layer_name, 0))
+                    sinks.setdefault(z, {})[layer_key] = sink
+                except RuntimeError as e:
+                    feedback.reportError(f"Failed to save {layer_name}. Result : {e}")
+                    error_reported.append(f"{layer_key} : {e}\n")
+
+        # ダウンロード実行（各タイルは1度だけ取得し、全レイヤに振り分ける）。
+        # キャッシュと接続はズームレベルをまたいで使い回す
+        failed_tiles = {}
+        if sinks:
+            cache = self.create_tile_cache()
+            fetcher = create_tile_fetcher()
+            self.decode_pool = self.create_decode_pool(feedback)
+            multi_feedback = QgsProcessingMultiStepFeedback(len(sinks), feedback)
+            try:
+                for step, z in enumerate(sorted(sinks)):
+                    if feedback.isCanceled():
+                        break
+                    multi_feedback.setCurrentStep(step)
+                    tileindex = tileindexes[z]
+                    if manifest is not None and manifest.completed:
+                        tileindex = (
+                            TileSet.from_tiles(tileindex)
+                            - TileSet.from_tiles(manifest.completed)
+                        ).tiles()
+                    if not tileindex:
+                        continue
+                    if pyramid:
+                        feedback.pushInfo(f"Zoom level {z}: {len(tileindex)} tiles")
+                    failed = self.download_tiles(
+                        tileindex,
+                        sinks[z],
+                        cache,
+                        multi_feedback,
+                        manifest,
+                        overzoom,
+                        fetcher,
+                        previous_digests,
+                        update,
+                    )
+                    if failed:
+                        failed_tiles[z] = failed
+            finally:
+                self.metrics.add("retries", fetcher.retries)
+                fetcher.close()
+                self.close_decode_pool()
+                cache.close()
+
+        if failed_tiles:
+            self.report_failed_tiles(
+                sum(failed_tiles.values(), []), feedback, manifest is not None
+            )
+            for z, failed in failed_tiles.items():
+                for layer_key in sinks[z]:
+                    error_reported.append(
+                        f"{layer_key}_z{z} : {len(failed)} tiles "
+                        "could not be downloaded\n"
+                    )
 
-                # Return result tuple
-                writer_result_tuple = QgsVectorFileWriter.writeAsVectorFormatV3(
-                    mergedlayer,
-                    output_path,
-                    QgsProject.instance().transformContext(),
-                    options,
+        # 地物の無いレイヤは出力を削除するので、再開・差分更新のために記録しておく
+        empty_layers = [
+            f"{layer_key}_z{z}"
+            for z, zoom_sinks in sinks.items()
+            for layer_key, sink in zoom_sinks.items()
+            if sink.feature_count == 0
+        ]
+        if manifest is not None and empty_layers:
+            manifest.record_empty_layers(empty_layers)
+
+        # 取得できなかったタイルがあればジョブを完了にせず、再実行で取り直せるようにする
+        if manifest is not None and not feedback.isCanceled() and not failed_tiles:
+            manifest.finish()
+
+        # 結合は地物を削除・追加するため、再開する可能性のない完了したジョブにだけ行う
+        if stitch and sinks and not feedback.isCanceled():
+            if failed_tiles:
+                feedback.reportError(
+                    "Skipped merging features split at tile boundaries "
+                    "because some tiles are missing"
                 )
+            else:
+                for z, zoom_sinks in sorted(sinks.items()):
+                    self.stitch_sinks(zoom_sinks, z, feedback)
+
+        for z, zoom_sinks in sorted(sinks.items()):
+            for layer_key, sink in zoom_sinks.items():
+                layer_name = f"{layer_key}_z{z}"
+                self.metrics.add("features_written", sink.feature_count)
+
+                if sink.feature_count == 0:
+                    sink.discard()
+                    message = "No valid features found in the specified area"
+                    feedback.reportError(message)
+                    error_reported.append(f"{layer_name} : {message}\n")
+                    continue
+
+                sink.close()
+                feedback.pushInfo(f"Final feature count: {sink.feature_count}")
 
-                # Check the tuple first element which is status to validate
-                if writer_result_tuple[0] == QgsVectorFileWriter.NoError:
-                    feedback.pushInfo(f"File saved : {output_path}")
+                if output_folder:
+                    feedback.pushInfo(f"File saved : {sink.output_path}")
 
-                    layer = QgsVectorLayer(output_path, layer_name, "ogr")
+                    layer = QgsVectorLayer(
+                        f"{sink.output_path}|layername={layer_name}", layer_name, "ogr"
+                    )
                     if layer.isValid():
                         QgsProject.instance().addMapLayer(layer)
                 else:
-                    feedback.reportError(
-                        f"Failed to save {layer_name}. Result : {writer_result_tuple}"
-                    )
-
-            else:
-                # Load output as temporary layer
-                mergedlayer.setName(layer_name)
-                context.project().addMapLayer(mergedlayer)
+                    # Load output as temporary layer
+                    sink.layer.setName(layer_name)
+                    context.project().addMapLayer(sink.layer)
 
         if error_reported:
             feedback.reportError("The following layers could not be downloaded:\n")
             for error in error_reported:
                 feedback.reportError(error)
 
-        return {}
-
-    def create_tile_index_from_bbox(
-        self, leftbottom_lonlat, righttop_lonlat, zoom_level
-    ):
-        """指定されたBBoxとズームレベルをカバーするタイルインデックスを作成"""
-        lon_min, lat_min = leftbottom_lonlat
-        lon_max, lat_max = righttop_lonlat
-
-        x_start_float, y_start_float = self._lonlat_to_tile_xy(
-            lon_min, lat_max, zoom_level
+        return self.write_report(
+            output_folder,
+            feedback,
+            zoom_levels=sorted(sinks),
+            layers=sorted({key for keys in targets.values() for key in keys}),
+            tiles=total_tiles,
+            failed_tiles=sum(len(failed) for failed in failed_tiles.values()),
+            incremental=update,
         )
 
-        x_end_float, y_end_float = self._lonlat_to_tile_xy(lon_max, lat_min, zoom_level)
-
-        x_start = math.floor(x_start_float)
-        x_end = math.floor(x_end_float)
-        y_start = math.floor(y_start_float)
-        y_end = math.floor(y_end_float)
-
-        # タイルインデックスのリストを生成
-        covering_tiles = []
-        z = zoom_level
-
-        for x in range(x_start, x_end + 1):
-            for y in range(y_start, y_end + 1):
-                covering_tiles.append([x, y, z])
-
-        return covering_tiles
-
-    def _lonlat_to_tile_xy(self, lon, lat, zoom_level):
-        """緯度経度からタイル座標を計算"""
-        lat_rad = math.radians(lat)
-        n = 2.0**zoom_level
-
-        tile_x = (lon + 180.0) / 360.0 * n
-        tile_y = (
-            (1.0 - math.log(math.tan(lat_rad) + (1 / math.cos(lat_rad))) / math.pi)
-            / 2.0
-            * n
+    def write_report(self, output_folder, feedback, **extra):
+        """計測結果を実行レポートとして出力フォルダに書き出し、アルゴリズムの結果を返す"""
+        report = self.metrics.report(
+            algorithm=self.name(), canceled=feedback.isCanceled(), **extra
+        )
+        results = {"METRICS": report}
+        if output_folder:
+            path = os.path.join(output_folder, REPORT_FILENAME)
+            self.metrics.write(path, report)
+            results[self.REPORT] = path
+        feedback.pushInfo(
+            f"Finished in {report['elapsed']:.1f} s: "
+            + ", ".join(f"{name} {t:.1f} s" for name, t in report["phases"].items())
         )
+        return results
+
+    def read_aoi(self, source, context):
+        """ソースのポリゴンを1つにまとめた EPSG:3857 の QgsGeometry。無ければ None"""
+        transform = QgsCoordinateTransform(
+            source.sourceCrs(),
+            QgsCoordinateReferenceSystem("EPSG:3857"),
+            context.transformContext(),
+        )
+        geometries = []
+        for feature in source.getFeatures():
+            geometry = feature.geometry()
+            if geometry.isNull() or geometry.type() != QgsWkbTypes.PolygonGeometry:
+                continue
+            geometry.transform(transform)
+            geometries.append(geometry)
+        if not geometries:
+            return None
 
-        return tile_x, tile_y
+        aoi = QgsGeometry.unaryUnion(geometries)
+        if aoi.isNull() or aoi.isEmpty():
+            return None
+        aoi.convertToMultiType()
+        return aoi
 
-    def lonlat_to_webmercator(self, lonlat):
+    def aoi_polygons(self, aoi):
+        """polygon_tile_cover() に渡すポリゴン（リングの座標のリスト）のリスト"""
         return [
-            lonlat[0] * 20037508.34 / 180,
-            math.log(math.tan((90 + lonlat[1]) * math.pi / 360))
-            / (math.pi / 180)
-            * 20037508.34
-            / 180,
+            [[(p.x(), p.y()) for p in ring] for ring in polygon]
+            for polygon in aoi.asMultiPolygon()
         ]
 
+    def create_tile_index_from_bbox(
+        self, leftbottom_lonlat, righttop_lonlat, zoom_level
+    ):
+        """指定されたBBoxとズームレベルをカバーするタイルインデックスを作成"""
+        return bbox_tile_cover(leftbottom_lonlat, righttop_lonlat, zoom_level)
+
+    def lonlat_to_webmercator(self, lonlat):
+        return list(lonlat_to_webmercator(*lonlat))
+
     def make_rectangle_of(self, leftbottom, righttop):
         x1 = leftbottom[0]
         y1 = leftbottom[1]
@@ -311,239 +659,585 @@ class GSIVectorTileDownloadAlgorithm(QgsProcessingAlgorithm):
         yMax = righttop_as_3857[1]
         return [xMin, xMax, yMin, yMax]
 
-    def download_tiles(self, tileindex, layer_key, feedback):
-        self.make_xyz_dirs(tileindex)
+    def job_params(
+        self,
+        leftbottom_lonlat,
+        righttop_lonlat,
+        zoom_level,
+        layer_keys,
+        overzoom=False,
+        clip=False,
+        aoi=None,
+        max_zoom_level=None,
+        incremental=False,
+    ):
+        """ジョブマニフェストで同じジョブかを判定するためのパラメータ"""
+        params = {
+            "extent": [*leftbottom_lonlat, *righttop_lonlat],
+            "zoom_level": zoom_level,
+            "layers": sorted(layer_keys),
+            "overzoom": overzoom,
+            "clip": clip,
+            "url": settings.GIS_VECTOR_TILE_URL,
+        }
+        if max_zoom_level is not None and max_zoom_level > zoom_level:
+            params["max_zoom_level"] = max_zoom_level
+        if incremental:
+            params["incremental"] = True
+        if aoi is not None:
+            params["aoi"] = hashlib.sha1(bytes(aoi.asWkb())).hexdigest()
+        return params
+
+    def create_sink(
+        self,
+        layer_key,
+        layer_name,
+        bbox,
+        output_path=None,
+        append=False,
+        clip=False,
+        aoi=None,
+        new_file=True,
+        tile_id_field=None,
+    ):
+        """ソースレイヤの出力先を作る。output_path が無い場合はメモリレイヤ"""
+        datatype = SOURCE_LAYERS[layer_key]["datatype"]
+        double_fields = getattr(settings, "DOUBLE_FIELDS", ())
+        extent = QgsRectangle(bbox[0], bbox[2], bbox[1], bbox[3])
+        if output_path:
+            index_fields = self.index_fields
+            if index_fields is None:
+                index_fields = settings.GPKG_INDEX_FIELDS
+            sink = GeoPackageSink(
+                layer_key,
+                datatype,
+                output_path,
+                layer_name,
+                double_fields,
+                extent,
+                batch_size=settings.WRITE_BATCH_SIZE,
+                append=append,
+                clip=clip,
+                aoi=aoi,
+                new_file=new_file,
+                tile_id_field=tile_id_field,
+                spatial_index=settings.GPKG_SPATIAL_INDEX,
+                index_fields=index_fields,
+                write_options=settings.GPKG_WRITE_OPTIONS,
+            )
+        else:
+            sink = LayerSink(
+                layer_key, datatype, double_fields, extent, clip, aoi, tile_id_field
+            )
+        sink.metrics = self.metrics
+        return sink
+
+    def download_tiles(
+        self,
+        tileindex,
+        sinks,
+        cache,
+        feedback,
+        manifest=None,
+        overzoom=False,
+        fetcher=None,
+        previous_digests=None,
+        replace=False,
+    ):
+        """各タイルを1度だけ取得・オープンし、ソースレイヤごとの出力先に振り分ける
 
-        pbflayers = []
+        タイルは TILE_BLOCK_SIZE 四方のブロックごとに処理するので、メモリに溜まる地物と
+        キャッシュから削除できないタイルはパイプラインに入っているブロック分に限られる。
+        ダウンロードできなかったタイルのリストを返す。
+        """
+        layer_keys = list(sinks.keys())
         total_tiles = len(tileindex)
+        min_zoom = min(
+            SOURCE_LAYERS[layer_key].get("minzoom", DEFAULT_MIN_ZOOM)
+            for layer_key in layer_keys
+        )
+        blocks = split_into_blocks(tileindex, settings.TILE_BLOCK_SIZE)
 
         feedback.pushInfo(
-            f"Starting download of {total_tiles} tiles for layer '{layer_key}'"
+            f"Starting download of {total_tiles} tiles in {len(blocks)} blocks "
+            f"for layers: {', '.join(layer_keys)}"
         )
 
-        for i, xyz in enumerate(tileindex):
+        # 各ブロックをダウンロードと変換の2ステップとして進捗を配分する。
+        # タイルごとのメッセージは settings.LOG_LEVEL に従って間引く
+        multi_feedback = LogFeedback(
+            QgsProcessingMultiStepFeedback(len(blocks) * 2, feedback),
+            settings.LOG_LEVEL,
+            settings.LOG_SUMMARY_INTERVAL,
+        )
+
+        # 存在しなかった親タイル。ブロックをまたいで取得し直さない
+        missing_parents = set()
+
+        def fetch_block(block):
+            # 取得の段階（別スレッド）。メッセージはブロックを処理するときに書き出す
+            block_feedback = BufferedFeedback(feedback.isCanceled)
+            failed = self.fetch_tiles(
+                block, cache, block_feedback, fetcher, previous_digests is not None
+            )
+            parents = {}
+            if overzoom:
+                parents, failed_children = self.find_parent_tiles(
+                    block,
+                    cache,
+                    failed,
+                    block_feedback,
+                    min_zoom,
+                    fetcher,
+                    missing_parents,
+                )
+                failed |= failed_children
+            # 存在しない（404 の）タイル。これ以外でキャッシュに無いタイルは取得の失敗とする
+            absent = {
+                tuple(xyz)
+                for xyz in block
+                if tuple(xyz) not in failed and cache.lookup(xyz) is None
+            }
+            return block, failed, absent, parents, block_feedback
+
+        def decode_block(fetched):
+            # デコードの段階（デコード用のプロセスがある場合だけ別スレッド）
+            block = fetched[0]
+            return (*fetched, self.decode_block(block, cache, sinks, previous_digests))
+
+        # 取得→デコード→変換・書き出しを段階ごとに同時に進める。
+        # 変換・切り取り・書き出しは QGIS のオブジェクトを扱うので処理のスレッドで行う
+        depth = settings.PIPELINE_DEPTH
+        fetch_stage = Stage(blocks, fetch_block, depth, feedback.isCanceled)
+        decode_stage = Stage(
+            fetch_stage,
+            decode_block,
+            depth if self.decode_pool is not None else 0,
+            feedback.isCanceled,
+        )
+        processed = 0
+        failed_tiles = []
+        try:
+            for block_number, fetched in enumerate(decode_stage):
+                if feedback.isCanceled():
+                    break
+                block, failed, absent, parents, block_feedback, decoded = fetched
+
+                if len(blocks) > 1:
+                    multi_feedback.pushDebugInfo(
+                        f"Block {block_number + 1}/{len(blocks)}: {len(block)} tiles"
+                    )
+                multi_feedback.setCurrentStep(block_number * 2)
+                block_feedback.replay(multi_feedback)
+
+                multi_feedback.setCurrentStep(block_number * 2 + 1)
+                if overzoom:
+                    # 子タイルを処理済みとする前に親タイルから地物を流し込む
+                    self.read_parent_tiles(parents, cache, sinks, multi_feedback)
+
+                processed = self.read_block(
+                    block,
+                    sinks,
+                    cache,
+                    multi_feedback,
+                    manifest,
+                    processed,
+                    total_tiles,
+                    failed,
+                    previous_digests,
+                    replace,
+                    decoded,
+                    absent,
+                )
+                failed_tiles.extend(xyz for xyz in block if tuple(xyz) in failed)
+
+                # キャンセル時も処理済みのタイルまでは書き出して再開できるようにする
+                self.flush_sinks(sinks, manifest)
+
+                # このブロックと先に取得したブロックのタイルは残し、
+                # 上限を超えた分を古い順に削除する。削除を終えるまでは次のブロックの
+                # 取得を始めさせない（キャッシュにあると判断したタイルを消さないため）
+                used_tiles = block + [list(xyz) for xyz in parents]
+                cache.touch(used_tiles)
+                with fetch_stage.paused(), decode_stage.paused():
+                    protected = used_tiles + self.in_flight_tiles(
+                        fetch_stage, decode_stage, overzoom and min_zoom
+                    )
+                    evicted = cache.evict(protect=protected)
+                if evicted:
+                    multi_feedback.count("evicted from cache", evicted)
+                    multi_feedback.pushDebugInfo(f"Evicted {evicted} tiles from cache")
+
+                multi_feedback.pushSummary(
+                    f"Processed {processed}/{total_tiles} tiles",
+                    force=block_number == len(blocks) - 1,
+                )
+        finally:
+            decode_stage.close()
+
+        for layer_key, sink in sinks.items():
+            feedback.pushInfo(
+                f"Download completed. Total features for '{layer_key}': "
+                f"{sink.feature_count}"
+            )
+
+        feedback.setProgress(100)
+        return failed_tiles
+
+    def read_block(
+        self,
+        block,
+        sinks,
+        cache,
+        feedback,
+        manifest,
+        processed,
+        total_tiles,
+        failed=None,
+        previous_digests=None,
+        replace=False,
+        decoded=None,
+        absent=None,
+    ):
+        """ブロック内のキャッシュ済みタイルを出力先へ流し込み、処理済みタイル数を返す
+
+        failed のタイルはマニフェストに記録しない。absent（404 のタイル）を渡すと、
+        それ以外でキャッシュに無いタイルは空のタイルとせず failed に加える。
+        previous_digests と同じ内容のタイルは読み飛ばす（差分更新）。
+        """
+        failed = set() if failed is None else failed
+        decoded = decoded or {}
+        block_tiles = len(block)
+        for i, xyz in enumerate(block):
             if feedback.isCanceled():
                 break
 
-            # ダウンロードフェーズ
-            download_progress = int(i * 70 / total_tiles)
-            feedback.setProgress(download_progress)
+            feedback.setProgress(int(i * 100 / block_tiles))
 
             x, y, z = xyz
-            current_tileurl = settings.GIS_VECTOR_TILE_URL.format(z=z, x=x, y=y)
-            target_path = os.path.join(TMP_PATH, str(z), str(x), f"{y}.pbf")
-
-            feedback.pushInfo(f"Processing tile {i + 1}/{total_tiles}: {x}/{y}/{z}")
-            feedback.pushInfo(f"URL: {current_tileurl}")
-
-            if os.path.exists(target_path):
-                if os.path.getsize(target_path) == 0:
-                    feedback.pushInfo(f"Removing empty file: {target_path}")
-                    os.remove(target_path)
-                else:
-                    feedback.pushInfo(
-                        f"File already exists: {target_path} (size: {os.path.getsize(target_path)} bytes)"
-                    )
+            processed += 1
+            self.metrics.add("tiles_processed")
 
-            if not os.path.exists(target_path):
-                try:
-                    feedback.pushInfo(f"Downloading from: {current_tileurl}")
-                    response = urllib.request.urlopen(
-                        current_tileurl, timeout=settings.GIS_DOWNLOAD_TIMEOUT
-                    )
-                    pbfdata = response.read()
+            feedback.pushDebugInfo(
+                f"Processing tile {processed}/{total_tiles}: {x}/{y}/{z}"
+            )
 
-                    if len(pbfdata) > 0:
-                        with open(target_path, mode="wb") as f:
-                            f.write(pbfdata)
-                        feedback.pushInfo(
-                            f"Downloaded {len(pbfdata)} bytes to {target_path}"
-                        )
-                    else:
-                        feedback.pushInfo(f"Empty response for tile {x}/{y}/{z}")
-                        continue
+            entry = cache.lookup(xyz)
+            if entry is None and absent is not None and tuple(xyz) not in absent:
+                failed.add(tuple(xyz))
+            if entry is None and tuple(xyz) in failed:
+                # 取得できなかったタイルは既存の地物を残し、次回に取り直す
+                feedback.count("not available")
+                feedback.pushDebugInfo(f"Tile not available: {x}/{y}/{z}")
+                continue
 
-                except urllib.error.HTTPError as e:
-                    if e.code == 404:
-                        feedback.pushInfo(f"Tile not found (404): {x}/{y}/{z}")
-                    else:
-                        feedback.pushInfo(f"HTTP error {e.code} for tile {x}/{y}/{z}")
-                    continue
-                except Exception as e:
-                    feedback.pushInfo(f"Download error for tile {x}/{y}/{z}: {str(e)}")
+            digest = None
+            if previous_digests is not None:
+                digest = (
+                    "" if entry is None else hashlib.sha1(cache.read(xyz)).hexdigest()
+                )
+                tile_id = tile_key(xyz)
+                if previous_digests.get(tile_id) == digest:
+                    self.metrics.add("tiles_unchanged")
+                    feedback.count("unchanged")
+                    feedback.pushDebugInfo(f"Tile unchanged: {x}/{y}/{z}")
+                    manifest.add(xyz, digest)
                     continue
+                if replace:
+                    self.metrics.add("tiles_replaced")
+                    deleted = sum(
+                        sink.delete_tile_features(tile_id) for sink in sinks.values()
+                    )
+                    feedback.count("changed")
+                    feedback.pushDebugInfo(f"Tile changed: {deleted} features replaced")
 
-            if not os.path.exists(target_path):
-                feedback.pushInfo(
-                    f"File not found after download attempt: {target_path}"
-                )
+            if entry is None:
+                feedback.pushDebugInfo(f"Tile not available: {x}/{y}/{z}")
+                if manifest is not None:
+                    manifest.add(xyz, digest)
                 continue
 
             try:
-                feedback.pushInfo(f"Processing PBF file: {target_path}")
+                feedback.pushDebugInfo(f"PBF size: {entry.size} bytes")
+                self.read_tile(
+                    cache, xyz, sinks, feedback, decoded=decoded.get(tuple(xyz))
+                )
+            except Exception as e:
+                feedback.pushInfo(f"Error processing tile {x}/{y}/{z}: {str(e)}")
+                import traceback
 
-                file_size = os.path.getsize(target_path)
-                feedback.pushInfo(f"PBF file size: {file_size} bytes")
+                feedback.pushDebugInfo(f"Traceback: {traceback.format_exc()}")
 
-                if file_size == 0:
-                    feedback.pushInfo(f"Empty PBF file, skipping: {target_path}")
-                    continue
+            if manifest is not None:
+                manifest.add(xyz, digest)
+            if any(sink.needs_flush() for sink in sinks.values()):
+                self.flush_sinks(sinks, manifest)
 
-                if layer_key not in SOURCE_LAYERS:
-                    feedback.pushInfo(
-                        f"Layer key '{layer_key}' not found in SOURCE_LAYERS"
-                    )
-                    feedback.pushInfo(f"Available keys: {list(SOURCE_LAYERS.keys())}")
-                    continue
+        feedback.setProgress(100)
+        return processed
 
-                geometrytype = self.translate_gsitype_to_geometry(
-                    SOURCE_LAYERS[layer_key]["datatype"]
-                )
-                feedback.pushInfo(f"Geometry type for {layer_key}: {geometrytype}")
-
-                pbfuri = (
-                    target_path
-                    + "|layername="
-                    + layer_key
-                    + "|geometrytype="
-                    + geometrytype
+    def create_decode_pool(self, feedback):
+        """settings.DECODE_WORKERS が 1 以上なら内蔵デコーダ用のプロセスを起動する"""
+        if settings.DECODE_WORKERS <= 0:
+            return None
+        if settings.MVT_DECODER != "python":
+            feedback.pushWarning(
+                'DECODE_WORKERS requires MVT_DECODER = "python"; '
+                "decoding tiles in the processing thread"
+            )
+            return None
+        feedback.pushInfo(f"Decoding tiles in {settings.DECODE_WORKERS} processes")
+        return DecodePool(settings.DECODE_WORKERS)
+
+    def close_decode_pool(self):
+        if self.decode_pool is not None:
+            self.decode_pool.close()
+            self.decode_pool = None
+
+    def decode_block(self, block, cache, sinks, previous_digests=None):
+        """デコード用のプロセスがあれば、ブロック内のタイルをまとめて並列にデコードする
+
+        前回と同じ内容のタイル（差分更新）は read_block() が読み飛ばすのでデコードしない。
+        """
+        if self.decode_pool is None:
+            return {}
+        tiles = []
+        for xyz in block:
+            if cache.lookup(xyz) is None:
+                continue
+            data = cache.read(xyz)
+            if (
+                previous_digests is not None
+                and previous_digests.get(tile_key(xyz))
+                == hashlib.sha1(data).hexdigest()
+            ):
+                continue
+            tiles.append((xyz, data))
+
+        with self.metrics.phase("decode"):
+            return {
+                tuple(xyz): (layers, error)
+                for xyz, layers, error in self.decode_pool.decode(tiles, sinks.keys())
+            }
+
+    def in_flight_tiles(self, fetch_stage, decode_stage, min_zoom=None):
+        """取得済み・取得中で、まだ処理していないブロックのタイル（と min_zoom までの親）"""
+        blocks = fetch_stage.in_flight() + [
+            fetched[0] for fetched in decode_stage.in_flight()
+        ]
+        tiles = [xyz for block in blocks for xyz in block]
+        if min_zoom:
+            ancestors = set()
+            for xyz in tiles:
+                parent = parent_tile(xyz)
+                while parent[2] >= min_zoom and parent not in ancestors:
+                    ancestors.add(parent)
+                    parent = parent_tile(parent)
+            tiles += [list(xyz) for xyz in ancestors]
+        return tiles
+
+    def find_parent_tiles(
+        self, block, cache, failed, feedback, min_zoom, fetcher=None, missing=None
+    ):
+        """存在しないタイル（404）を含む親タイルを、存在するズームレベルまで遡って探す
+
+        (親タイル -> 補う子タイル, 親を取得できなかった子タイル) を返す。存在しなかった
+        親タイルは missing に記録し、以降のブロックでは取得し直さない。
+        """
+        pending = {}
+        for xyz in block:
+            if tuple(xyz) not in failed and cache.lookup(xyz) is None:
+                pending.setdefault(parent_tile(xyz), []).append(xyz)
+
+        parents = {}
+        failed_children = set()
+        while pending:
+            if all(xyz[2] < min_zoom for xyz in pending):
+                break
+            candidates = [
+                list(xyz)
+                for xyz in pending
+                if xyz[2] >= min_zoom and (missing is None or xyz not in missing)
+            ]
+            failed_parents = set()
+            if candidates:
+                feedback.pushDebugInfo(
+                    f"Looking for {len(candidates)} parent tiles at z{candidates[0][2]}"
                 )
-                feedback.pushInfo(f"PBF URI: {pbfuri}")
+                failed_parents = self.fetch_tiles(candidates, cache, feedback, fetcher)
 
-                pbflayer = QgsVectorLayer(pbfuri, "pbf", "ogr")
-
-                feedback.pushInfo(f"Layer valid: {pbflayer.isValid()}")
-                feedback.pushInfo(
-                    f"Data provider valid: {pbflayer.dataProvider().isValid()}"
-                )
-                feedback.pushInfo(f"Feature count: {pbflayer.featureCount()}")
-
-                if not pbflayer.isValid():
-                    feedback.pushInfo(f"Invalid layer for tile {x}/{y}/{z}")
-
-                    feedback.pushInfo("Trying to get layer info from PBF...")
-                    try:
-                        from osgeo import ogr
-
-                        ds = ogr.Open(target_path)
-                        if ds:
-                            feedback.pushInfo(
-                                f"OGR can open file. Layer count: {ds.GetLayerCount()}"
-                            )
-                            for i in range(ds.GetLayerCount()):
-                                layer = ds.GetLayer(i)
-                                feedback.pushInfo(
-                                    f"Layer {i}: {layer.GetName()}, features: {layer.GetFeatureCount()}"
-                                )
-                        else:
-                            feedback.pushInfo("OGR cannot open file")
-                    except Exception as e:
-                        feedback.pushInfo(f"OGR error: {str(e)}")
+            next_pending = {}
+            for xyz, children in pending.items():
+                if xyz[2] < min_zoom:
                     continue
+                if xyz in failed_parents:
+                    failed_children.update(tuple(child) for child in children)
+                elif cache.lookup(xyz) is not None:
+                    parents[xyz] = children
+                else:
+                    if missing is not None:
+                        missing.add(xyz)
+                    next_pending.setdefault(parent_tile(xyz), []).extend(children)
+            pending = next_pending
 
-                if pbflayer.dataProvider().isValid() and pbflayer.featureCount() > 0:
-                    feedback.pushInfo(
-                        f"Valid layer with {pbflayer.featureCount()} features"
-                    )
+        return parents, failed_children
 
-                    expressions = []
-                    fields = pbflayer.dataProvider().fields()
-                    feedback.pushInfo(f"Field count: {fields.count()}")
+    def read_parent_tiles(self, parents, cache, sinks, feedback):
+        """親タイルから、存在しない子タイルの範囲に掛かる地物だけを流し込む"""
+        for xyz, children in parents.items():
+            if feedback.isCanceled():
+                break
+            x, y, z = xyz
+            regions = [QgsRectangle(*tile_bounds(child)) for child in children]
+            feedback.count("filled from parent tiles", len(children))
+            feedback.pushDebugInfo(
+                f"Filling {len(children)} missing tiles from parent tile {x}/{y}/{z}"
+            )
+            try:
+                self.read_tile(cache, xyz, sinks, feedback, regions)
+            except Exception as e:
+                feedback.pushInfo(f"Error processing tile {x}/{y}/{z}: {str(e)}")
 
-                    for j in range(fields.count()):
-                        field = fields.at(j)
-                        feedback.pushInfo(
-                            f"Field {j}: {field.name()} ({field.typeName()})"
+    def read_tile(self, cache, xyz, sinks, feedback, regions=None, decoded=None):
+        """タイルを1度だけ開き、各レイヤの地物を出力先へ直接流し込む"""
+        x, y, z = xyz
+        tile_id = tile_key(xyz)
+        # タイルに掛かる出力先だけに振り分け、出力範囲に収まるタイルの地物は
+        # 範囲との判定も切り取りもしない
+        tile_rect = QgsRectangle(*tile_bounds(xyz))
+        targets = {}
+        for layer_key, sink in sinks.items():
+            receivers = [
+                (receiver, not receiver.covers(tile_rect))
+                for receiver in sink.receivers(tile_rect)
+            ]
+            if receivers:
+                targets[layer_key] = receivers
+        if not targets:
+            return
+
+        if decoded is None and settings.MVT_DECODER == "python":
+            # OGR のデータソースを作らずにタイルを直接デコードする
+            with self.metrics.phase("decode"):
+                decoded = decode_tile(cache.read(xyz), xyz, targets.keys()), None
+        if decoded is not None:
+            decoded_layers, error = decoded
+            if error is not None:
+                raise RuntimeError(error)
+            for layer_key, receivers in targets.items():
+                decoded_layer = decoded_layers.get(layer_key)
+                if decoded_layer is None:
+                    continue
+                with self.metrics.phase("convert"):
+                    added = sum(
+                        receiver.add_decoded_layer(
+                            decoded_layer, regions, check_extent, tile_id
                         )
-
-                        expression = {
-                            "expression": f'"{field.name()}"',
-                            "length": 0,
-                            "name": f"{field.name()}",
-                            "precision": 0,
-                            "type": field.type(),
-                        }
-                        if (
-                            hasattr(settings, "DOUBLE_FIELDS")
-                            and field.name() in settings.DOUBLE_FIELDS
-                        ):
-                            expression["type"] = QVariant.Double
-                        expressions.append(expression)
-
-                    refactored = processing.run(
-                        "qgis:refactorfields",
-                        {
-                            "INPUT": pbflayer,
-                            "OUTPUT": "TEMPORARY_OUTPUT",
-                            "FIELDS_MAPPING": expressions,
-                        },
-                    )["OUTPUT"]
-                    pbflayers.append(refactored)
-                    feedback.pushInfo(
-                        f"Added refactored layer to collection. Total layers: {len(pbflayers)}"
+                        for receiver, check_extent in receivers
                     )
-                else:
-                    feedback.pushInfo(
-                        f"Layer has no features or is invalid for tile {x}/{y}/{z}"
+                feedback.count("features", added)
+                feedback.pushDebugInfo(f"Added {added} features to '{layer_key}'")
+            return
+
+        with self.metrics.phase("decode"), self.open_tile(cache, xyz) as ds:
+            if ds is None:
+                feedback.pushDebugInfo(f"OGR cannot open tile: {x}/{y}/{z}")
+                return
+
+            for layer_key, receivers in targets.items():
+                ogr_layer = ds.GetLayerByName(layer_key)
+                if ogr_layer is None:
+                    continue
+                # OGR は地物を読みながらデコードするため、その時間は convert に入る
+                with self.metrics.phase("convert"):
+                    added = sum(
+                        receiver.add_ogr_layer(
+                            ogr_layer, regions, check_extent, tile_id
+                        )
+                        for receiver, check_extent in receivers
                     )
-
-            except Exception as e:
-                feedback.pushInfo(f"Error processing tile {x}/{y}/{z}: {str(e)}")
-                import traceback
-
-                feedback.pushInfo(f"Traceback: {traceback.format_exc()}")
-                continue
-
-        feedback.setProgress(90)
-        feedback.pushInfo(f"Download completed. Total valid layers: {len(pbflayers)}")
-
-        if not pbflayers:
+                feedback.count("features", added)
+                feedback.pushDebugInfo(f"Added {added} features to '{layer_key}'")
+
+    def stitch_sinks(self, sinks, zoom_level, feedback):
+        """タイルの境界で分割された地物を結合し、重複した点を除く"""
+        size = tile_size(zoom_level)
+        # タイル内の座標の1単位（extent 4096）までのずれは同じ位置とみなす
+        grid = TileGrid(size, size / 4096)
+        for layer_key, sink in sinks.items():
+            if feedback.isCanceled():
+                break
+            with self.metrics.phase("stitch"):
+                removed = sink.stitch(grid)
             feedback.pushInfo(
-                "No valid PBF layers found. Check the debug messages above."
+                f"Merged features split at tile boundaries for '{layer_key}': "
+                f"{removed} features removed"
             )
-            return None
-        elif len(pbflayers) == 1:
-            mergedlayer = pbflayers[0]
-            feedback.pushInfo("Using single layer")
-        else:
-            feedback.pushInfo(f"Merging {len(pbflayers)} layers")
-            merged_result = processing.run(
-                "native:mergevectorlayers",
-                {
-                    "LAYERS": pbflayers,
-                    "OUTPUT": "TEMPORARY_OUTPUT",
-                },
+
+    def flush_sinks(self, sinks, manifest=None):
+        """全出力先を書き出し、マニフェストにチェックポイントを記録する"""
+        for sink in sinks.values():
+            sink.flush()
+        if manifest is not None:
+            # 出力は同期せずに書き込むので、チェックポイントの前にディスクに確定させる
+            for sink in sinks.values():
+                sink.sync()
+            manifest.checkpoint(
+                {sink.layer_name: sink.last_fid() for sink in sinks.values()}
             )
-            mergedlayer = merged_result["OUTPUT"]
 
-        feedback.setProgress(100)
-        return mergedlayer
-
-    def make_xyz_dirs(self, tileindex):
-        for xyz in tileindex:
-            x = str(xyz[0])
-            z = str(xyz[2])
-            os.makedirs(os.path.join(TMP_PATH, z, x), exist_ok=True)
-
-    def translate_gsitype_to_geometry(self, gsitype):
-        if gsitype == "点":
-            return "Point"
-        elif gsitype == "線":
-            return "LineString"
-        else:
-            return "Polygon"
-
-    def clip_vlayer(self, bbox, vlayer):
-        cliped = processing.run(
-            "qgis:extractbyextent",
-            {
-                "INPUT": vlayer,
-                "CLIP": False,
-                "EXTENT": "%s,%s,%s,%s" % (bbox[0], bbox[1], bbox[2], bbox[3]),
-                "OUTPUT": "memory:",
-            },
-        )["OUTPUT"]
-        return cliped
+    @contextlib.contextmanager
+    def open_tile(self, cache, xyz):
+        """キャッシュのタイルを OGR の MVT ドライバで開く
+
+        ファイルとして保存されていないタイル（MBTiles）は /vsimem に展開して開く。
+        タイル座標はパスから推定させず、オープンオプションで明示する。
+        """
+        x, y, z = xyz
+        path = cache.tile_path(xyz)
+        vsimem_path = None
+        if path is None:
+            vsimem_path = f"/vsimem/vtdownloader/{z}/{x}/{y}.pbf"
+            gdal.FileFromMemBuffer(vsimem_path, cache.read(xyz))
+            path = vsimem_path
+
+        ds = gdal.OpenEx(
+            path,
+            gdal.OF_VECTOR,
+            allowed_drivers=["MVT"],
+            open_options=[f"X={x}", f"Y={y}", f"Z={z}"],
+        )
+        try:
+            yield ds
+        finally:
+            ds = None
+            if vsimem_path is not None:
+                gdal.Unlink(vsimem_path)
+
+    def create_tile_cache(self):
+        """settings.TILE_CACHE_BACKEND に応じたタイルキャッシュを作る"""
+        return create_tile_cache()
+
+    def report_failed_tiles(self, failed_tiles, feedback, resumable):
+        """ダウンロードできなかったタイルを報告する"""
+        shown = ", ".join(f"{x}/{y}/{z}" for x, y, z in failed_tiles[:20])
+        if len(failed_tiles) > 20:
+            shown += f", ... ({len(failed_tiles) - 20} more)"
+        feedback.reportError(
+            f"{len(failed_tiles)} tiles could not be downloaded: {shown}"
+        )
+        if resumable:
+            feedback.reportError(
+                "Run the algorithm again with the same parameters "
+                "to download only the missing tiles."
+            )
+
+    def fetch_tiles(self, tileindex, cache, feedback, fetcher=None, revalidate=False):
+        """tile_download.fetch_tiles() をフェーズ "fetch" として計測して呼ぶ"""
+        with self.metrics.phase("fetch"):
+            return fetch_tiles(
+                tileindex, cache, feedback, fetcher, revalidate, self.metrics
+            )
 
     def name(self):
         return "gsi_vt_downloader"
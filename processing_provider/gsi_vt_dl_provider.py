@@ -3,12 +3,14 @@ from pathlib import Path
 from qgis.core import QgsProcessingProvider
 from qgis.PyQt.QtGui import QIcon
 
+from .gsi_vt_batch_algorithm import GSIVectorTileBatchDownloadAlgorithm
 from .gsi_vt_dl_algorithm import GSIVectorTileDownloadAlgorithm
 
 
 class GSIVectorTileProvider(QgsProcessingProvider):
     def loadAlgorithms(self, *args, **kwargs):
         self.addAlgorithm(GSIVectorTileDownloadAlgorithm())
+        self.addAlgorithm(GSIVectorTileBatchDownloadAlgorithm())
 
     def id(self, *args, **kwargs):
         return "gsivtdl"
@@ -0,0 +1,145 @@
+"""ダウンロードジョブのマニフェスト
+
+JSON Lines の1行目がジョブのパラメータ、以降がチェックポイント、最後が完了の記録。
+書き込み途中で中断された行は読み込み時に無視する。
+"""
+
+import json
+import os
+import time
+
+MANIFEST_FILENAME = "vtdownloader_job.jsonl"
+VERSION = 3
+
+
+def tile_key(xyz):
+    """タイルを表す文字列 "z/x/y"（出力のタイル ID にも使う）"""
+    x, y, z = xyz
+    return f"{z}/{x}/{y}"
+
+
+class JobManifest:
+    def __init__(self, path, params):
+        """params（JSON に変換できる dict）が同じ未完了のジョブがあれば再開する"""
+        self.path = path
+        self.params = params
+        self.completed = set()
+        self.last_fids = {}
+        self.finished = False
+        self.resumed = False
+        # 同じパラメータの前回の完了したジョブのタイルのダイジェスト（差分更新用）
+        self.previous_digests = {}
+        # 地物が無いため出力を削除したレイヤ。出力が無くても失われたとはみなさない
+        self.empty_layers = set()
+        self._pending = []
+        self._pending_digests = {}
+
+        if self._load():
+            self.resumed = True
+        else:
+            self.restart()
+
+    def _load(self):
+        """同じパラメータの未完了ジョブがあれば状態を読み込み True を返す"""
+        if not os.path.exists(self.path):
+            return False
+
+        records = []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+
+        if not records:
+            return False
+        header = records[0]
+        if header.get("version") != VERSION or header.get("params") != self.params:
+            return False
+
+        completed = set()
+        last_fids = {}
+        digests = {}
+        empty_layers = set()
+        for record in records[1:]:
+            if record.get("finished"):
+                self.previous_digests = digests
+                self.empty_layers = empty_layers
+                return False
+            completed.update(tuple(xyz) for xyz in record.get("tiles", []))
+            last_fids.update(record.get("last_fids", {}))
+            digests.update(record.get("digests", {}))
+            # 再開後に地物を書き込んだレイヤは空でなくなる
+            empty_layers.difference_update(
+                name for name, fid in record.get("last_fids", {}).items() if fid
+            )
+            empty_layers.update(record.get("empty_layers", []))
+
+        self.empty_layers = empty_layers
+
+        self.completed = completed
+        self.last_fids = last_fids
+        return True
+
+    def _append(self, record):
+        with open(self.path, mode="a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def restart(self):
+        """マニフェストを作り直し、新しいジョブとして開始する"""
+        self.completed = set()
+        self.last_fids = {}
+        self.finished = False
+        self.resumed = False
+        self._pending = []
+        self._pending_digests = {}
+        with open(self.path, mode="w", encoding="utf-8") as f:
+            f.write(
+                json.dumps(
+                    {
+                        "version": VERSION,
+                        "params": self.params,
+                        "created_at": time.time(),
+                    },
+                    ensure_ascii=False,
+                )
+                + "\n"
+            )
+
+    def is_completed(self, xyz):
+        return tuple(xyz) in self.completed
+
+    def add(self, xyz, digest=None):
+        """処理したタイルと内容のダイジェスト（存在しないタイルは ""）を記録する
+
+        checkpoint() を呼ぶまで確定しない。
+        """
+        self._pending.append(list(xyz))
+        if digest is not None:
+            self._pending_digests[tile_key(xyz)] = digest
+
+    def checkpoint(self, last_fids):
+        """処理済みタイルと出力レイヤ名ごとの書き込み済みの最大の fid を確定する
+
+        地物数ではなく fid を記録するのは、GeoPackage の fid が削除後も詰められないため。
+        """
+        record = {"tiles": self._pending, "last_fids": last_fids}
+        if self._pending_digests:
+            record["digests"] = self._pending_digests
+        self._append(record)
+        self.completed.update(tuple(xyz) for xyz in self._pending)
+        self.last_fids.update(last_fids)
+        self._pending = []
+        self._pending_digests = {}
+
+    def record_empty_layers(self, layer_names):
+        """地物が無いため出力を削除するレイヤを記録する"""
+        self._append({"empty_layers": sorted(layer_names)})
+        self.empty_layers.update(layer_names)
+
+    def finish(self):
+        self._append({"finished": True, "finished_at": time.time()})
+        self.finished = True
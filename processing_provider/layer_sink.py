@@ -0,0 +1,745 @@
+"""ソースレイヤごとの出力先
+
+タイルから読んだ地物を中間レイヤを作らずに1つのレイヤへ直接追加する。
+フィールドはタイルをまたいで名前で揃え、DOUBLE_FIELDS は Double に固定する。
+GeoPackageSink は地物をメモリに溜めず、一定件数ごとに出力ファイルへ書き込む。
+"""
+
+import contextlib
+import os
+
+from osgeo import gdal, ogr
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransformContext,
+    QgsExpression,
+    QgsFeature,
+    QgsFeatureRequest,
+    QgsField,
+    QgsFields,
+    QgsGeometry,
+    QgsVectorDataProvider,
+    QgsVectorFileWriter,
+    QgsVectorLayer,
+    QgsWkbTypes,
+)
+from qgis.PyQt.QtCore import QVariant
+
+from .stitching import duplicate_points, line_groups, polygon_groups
+
+# GSI のデータ型と、受け付ける OGR ジオメトリ型・出力するジオメトリ型の対応
+_GEOMETRY_TYPES = {
+    "点": ((ogr.wkbPoint, ogr.wkbMultiPoint), "MultiPoint"),
+    "線": ((ogr.wkbLineString, ogr.wkbMultiLineString), "MultiLineString"),
+    "面": ((ogr.wkbPolygon, ogr.wkbMultiPolygon), "MultiPolygon"),
+}
+
+# GSI のデータ型と MVT のジオメトリ型（mvt_decoder）の対応
+_MVT_GEOMETRY_TYPES = {"点": 1, "線": 2, "面": 3}
+
+_OGR_FIELD_TYPES = {
+    ogr.OFTInteger: QVariant.LongLong,
+    ogr.OFTInteger64: QVariant.LongLong,
+    ogr.OFTReal: QVariant.Double,
+    ogr.OFTString: QVariant.String,
+}
+
+
+def _value_type(value):
+    """デコーダが返した値に対応するフィールドの型"""
+    if isinstance(value, bool):
+        return QVariant.Bool
+    if isinstance(value, int):
+        return QVariant.LongLong
+    if isinstance(value, float):
+        return QVariant.Double
+    return QVariant.String
+
+
+def _merge_types(a, b):
+    """1つのレイヤ内で型が混在するフィールドの型（OGR の MVT ドライバに合わせる）"""
+    if a == b:
+        return a
+    if {a, b} <= {QVariant.LongLong, QVariant.Double}:
+        return QVariant.Double
+    return QVariant.String
+
+
+def convert_value(value, field_type):
+    """値を出力フィールドの型に合わせる。変換できない場合は None"""
+    if value is None:
+        return None
+    try:
+        if field_type == QVariant.Double:
+            return float(value)
+        if field_type == QVariant.LongLong:
+            if isinstance(value, float) and not value.is_integer():
+                return None
+            return int(value)
+        if field_type == QVariant.Bool:
+            return bool(value)
+    except (TypeError, ValueError):
+        return None
+    if field_type == QVariant.String and not isinstance(value, str):
+        return str(value)
+    return value
+
+
+class LayerSink:
+    """1つのソースレイヤの地物を集める出力先"""
+
+    # 書き込みをまとめる地物数（0 の場合は受け取るたびに書き込む）
+    batch_size = 0
+    # run_metrics.RunMetrics。指定すると切り取りと書き込みの時間を計測する
+    metrics = None
+
+    def __init__(
+        self,
+        layer_key,
+        datatype,
+        double_fields=(),
+        extent=None,
+        clip=False,
+        aoi=None,
+        tile_id_field=None,
+    ):
+        """extent・aoi（EPSG:3857）に掛からない地物を除き、clip の場合は切り取る"""
+        self.layer_key = layer_key
+        self.double_fields = set(double_fields)
+        self.extent = extent
+        self.clip = clip
+        self.aoi = aoi
+        self._aoi_engine = None
+        if aoi is not None:
+            self._aoi_engine = QgsGeometry.createGeometryEngine(aoi.constGet())
+            self._aoi_engine.prepareGeometry()
+        self.accepted_types, self.wkb_type_name = _GEOMETRY_TYPES.get(
+            datatype, _GEOMETRY_TYPES["面"]
+        )
+        self.mvt_type = _MVT_GEOMETRY_TYPES.get(datatype, _MVT_GEOMETRY_TYPES["面"])
+        self.feature_count = 0
+        self.written_count = 0
+        self._buffer = []
+        self.layer = self._create_layer()
+        self.provider = self.layer.dataProvider()
+        self.fields = self.provider.fields()
+
+        # 地物の元のタイル（"z/x/y"）を記録するフィールド（差分更新用）
+        self.tile_id_field = tile_id_field
+        self.tile_id_index = None
+        if tile_id_field:
+            created = self.fields.indexFromName(tile_id_field) < 0
+            self.tile_id_index = self._ensure_columns(
+                [(tile_id_field, QVariant.String)]
+            )[0][0]
+            # タイルごとの削除で全件を走査しないよう索引を作る
+            if created and (
+                self.provider.capabilities()
+                & QgsVectorDataProvider.CreateAttributeIndex
+            ):
+                self.provider.createAttributeIndex(self.tile_id_index)
+
+    def _create_layer(self):
+        return QgsVectorLayer(
+            f"{self.wkb_type_name}?crs=EPSG:3857", self.layer_key, "memory"
+        )
+
+    def _field_type(self, ogr_field_defn):
+        if ogr_field_defn.GetSubType() == ogr.OFSTBoolean:
+            return QVariant.Bool
+        return _OGR_FIELD_TYPES.get(ogr_field_defn.GetType(), QVariant.String)
+
+    def _add_fields(self, new_fields):
+        # 書き込み待ちの地物は旧スキーマのまま書き出しておく
+        self.flush()
+        self.provider.addAttributes(new_fields)
+        self.layer.updateFields()
+        self.fields = self.provider.fields()
+
+    def _ensure_columns(self, columns):
+        """(名前, 型) のフィールドを出力スキーマに揃え、出力側の (インデックス, 型) を返す"""
+        new_fields = []
+        for name, field_type in columns:
+            if self.fields.indexFromName(name) < 0 and name not in {
+                f.name() for f in new_fields
+            }:
+                if name in self.double_fields:
+                    field_type = QVariant.Double
+                new_fields.append(QgsField(name, field_type))
+        if new_fields:
+            self._add_fields(new_fields)
+
+        targets = []
+        for name, _ in columns:
+            index = self.fields.indexFromName(name)
+            targets.append((index, self.fields.at(index).type()))
+        return targets
+
+    def ensure_fields(self, ogr_layer_defn):
+        """タイルのフィールドを出力スキーマに揃え、(タイル側, 出力側, 型) のリストを返す"""
+        columns = []
+        for i in range(ogr_layer_defn.GetFieldCount()):
+            field_defn = ogr_layer_defn.GetFieldDefn(i)
+            name = field_defn.GetName()
+            columns.append((name, self._field_type(field_defn)))
+        targets = self._ensure_columns(columns)
+        return [(i, index, field_type) for i, (index, field_type) in enumerate(targets)]
+
+    def _phase(self, name):
+        if self.metrics is None:
+            return contextlib.nullcontext()
+        return self.metrics.phase(name)
+
+    def covers(self, rect):
+        """rect（タイルの範囲など）の全体が出力範囲に含まれるか"""
+        if self.extent is not None and not self.extent.contains(rect):
+            return False
+        return self._aoi_engine is None or self._aoi_engine.contains(
+            QgsGeometry.fromRect(rect).constGet()
+        )
+
+    def intersects(self, rect):
+        """rect（タイルの範囲など）が出力範囲に掛かるか"""
+        if self.extent is not None and not self.extent.intersects(rect):
+            return False
+        return self._aoi_engine is None or self._aoi_engine.intersects(
+            QgsGeometry.fromRect(rect).constGet()
+        )
+
+    def receivers(self, rect):
+        """rect の範囲の地物を受け取る出力先のリスト"""
+        return [self]
+
+    def _clip_to_aoi(self, geometry):
+        geometry = geometry.intersection(self.aoi)
+        if QgsWkbTypes.flatType(geometry.wkbType()) == QgsWkbTypes.GeometryCollection:
+            # 辺で接する部分など、次元の違う部分は捨てる
+            geometry.convertGeometryCollectionToSubclass(
+                QgsWkbTypes.geometryType(QgsWkbTypes.parseType(self.wkb_type_name))
+            )
+        return geometry
+
+    def _filter_geometry(self, geometry, check_extent, regions):
+        """範囲外のジオメトリは None、範囲の境界に掛かるものは必要なら切り取って返す"""
+        if not check_extent and regions is None:
+            return geometry
+
+        bbox = geometry.boundingBox()
+        if regions is not None and not any(bbox.intersects(r) for r in regions):
+            return None
+        if not check_extent or self.extent is None:
+            return geometry
+        if not bbox.intersects(self.extent):
+            return None
+        if self._aoi_engine is not None:
+            if not self._aoi_engine.intersects(geometry.constGet()):
+                return None
+            if self.clip and not self._aoi_engine.contains(geometry.constGet()):
+                with self._phase("clip"):
+                    geometry = self._clip_to_aoi(geometry)
+                if geometry.isEmpty():
+                    return None
+            return geometry
+        if self.clip and not self.extent.contains(bbox):
+            with self._phase("clip"):
+                geometry = geometry.clipped(self.extent)
+            if geometry.isEmpty():
+                return None
+        return geometry
+
+    def convert_ogr_feature(
+        self, ogr_feature, mapping, regions=None, check_extent=True, tile_id=None
+    ):
+        """OGR の地物を出力スキーマの QgsFeature に変換する。対象外の地物は None
+
+        regions を指定するといずれかに掛かる地物だけを残す。check_extent=False は
+        出力範囲に収まるタイル用で、範囲との判定を省く。
+        """
+        ogr_geometry = ogr_feature.GetGeometryRef()
+        if ogr_geometry is None:
+            return None
+        if ogr.GT_Flatten(ogr_geometry.GetGeometryType()) not in self.accepted_types:
+            return None
+
+        geometry = QgsGeometry()
+        geometry.fromWkb(ogr_geometry.ExportToIsoWkb())
+        geometry = self._filter_geometry(geometry, check_extent, regions)
+        if geometry is None:
+            return None
+        geometry.convertToMultiType()
+
+        attributes = [None] * self.fields.count()
+        for source_index, sink_index, field_type in mapping:
+            if ogr_feature.IsFieldSetAndNotNull(source_index):
+                attributes[sink_index] = convert_value(
+                    ogr_feature.GetField(source_index), field_type
+                )
+        if self.tile_id_index is not None:
+            attributes[self.tile_id_index] = tile_id
+
+        feature = QgsFeature(self.fields)
+        feature.setGeometry(geometry)
+        feature.setAttributes(attributes)
+        return feature
+
+    def add_ogr_layer(self, ogr_layer, regions=None, check_extent=True, tile_id=None):
+        """タイルの OGR レイヤから地物を読み、出力先に追加する。追加件数を返す"""
+        mapping = self.ensure_fields(ogr_layer.GetLayerDefn())
+
+        features = []
+        ogr_layer.ResetReading()
+        for ogr_feature in ogr_layer:
+            feature = self.convert_ogr_feature(
+                ogr_feature, mapping, regions, check_extent, tile_id
+            )
+            if feature is not None:
+                features.append(feature)
+
+        return self.add_features(features)
+
+    def add_decoded_layer(
+        self, decoded_layer, regions=None, check_extent=True, tile_id=None
+    ):
+        """mvt_decoder でデコードしたレイヤの地物を出力先に追加する。追加件数を返す"""
+        features = [f for f in decoded_layer.features if f.geom_type == self.mvt_type]
+        if not features:
+            return 0
+
+        # レイヤ内の値からフィールドの型を決める
+        column_types = {}
+        for feature in features:
+            for name, value in feature.properties.items():
+                if value is None:
+                    continue
+                value_type = _value_type(value)
+                column_types[name] = _merge_types(
+                    column_types.get(name, value_type), value_type
+                )
+        columns = list(column_types.items())
+        targets = dict(zip(column_types, self._ensure_columns(columns)))
+
+        converted = []
+        for decoded in features:
+            geometry = QgsGeometry()
+            geometry.fromWkb(decoded.wkb)
+            geometry = self._filter_geometry(geometry, check_extent, regions)
+            if geometry is None:
+                continue
+            geometry.convertToMultiType()
+
+            attributes = [None] * self.fields.count()
+            for name, value in decoded.properties.items():
+                target = targets.get(name)
+                if target is not None:
+                    attributes[target[0]] = convert_value(value, target[1])
+            if self.tile_id_index is not None:
+                attributes[self.tile_id_index] = tile_id
+
+            feature = QgsFeature(self.fields)
+            feature.setGeometry(geometry)
+            feature.setAttributes(attributes)
+            converted.append(feature)
+
+        return self.add_features(converted)
+
+    def add_features(self, features):
+        """地物を書き込みバッファに追加する。書き出しは flush() で行う"""
+        if not features:
+            return 0
+        self._buffer.extend(features)
+        self.feature_count += len(features)
+        return len(features)
+
+    def delete_tile_features(self, tile_id):
+        """tile_id のタイルから読んだ書き込み済みの地物を削除し、削除件数を返す"""
+        request = QgsFeatureRequest()
+        request.setFilterExpression(
+            QgsExpression.createFieldEqualityExpression(self.tile_id_field, tile_id)
+        )
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setNoAttributes()
+        with self._phase("write"):
+            fids = [feature.id() for feature in self.provider.getFeatures(request)]
+            if fids:
+                self.provider.deleteFeatures(fids)
+        if fids:
+            self.feature_count -= len(fids)
+            self.written_count -= len(fids)
+        return len(fids)
+
+    def needs_flush(self):
+        return len(self._buffer) >= max(self.batch_size, 1)
+
+    def flush(self):
+        if self._buffer:
+            with self._phase("write"):
+                self.provider.addFeatures(self._buffer)
+            self.written_count += len(self._buffer)
+            self._buffer = []
+
+    def _touches_boundary(self, geometry, grid):
+        bbox = geometry.boundingBox()
+        return any(
+            grid.boundary(value) is not None
+            for value in (
+                bbox.xMinimum(),
+                bbox.xMaximum(),
+                bbox.yMinimum(),
+                bbox.yMaximum(),
+            )
+        )
+
+    def _boundary_features(self, grid, to_coordinates):
+        """タイルの境界に接する地物を (ID, 属性のキー, 座標) として返す
+
+        属性のキーには主キー（GeoPackage の fid）を含めない。地物ごとに異なるため。
+        """
+        primary_keys = set(self.provider.pkAttributeIndexes())
+        for feature in self.provider.getFeatures():
+            geometry = feature.geometry()
+            if geometry.isNull() or not self._touches_boundary(geometry, grid):
+                continue
+            attributes = [
+                value
+                for i, value in enumerate(feature.attributes())
+                if i not in primary_keys
+            ]
+            yield (feature.id(), repr(attributes), to_coordinates(geometry))
+
+    def stitch(self, grid):
+        """タイルの境界で分割された断片を結合し、重複した点を除く。減った地物数を返す"""
+        self.flush()
+        before = self.provider.featureCount()
+
+        if self.mvt_type == _MVT_GEOMETRY_TYPES["点"]:
+            duplicates = duplicate_points(
+                self._boundary_features(
+                    grid, lambda g: [(p.x(), p.y()) for p in g.asMultiPoint()]
+                ),
+                grid,
+            )
+            if duplicates:
+                self.provider.deleteFeatures(duplicates)
+        else:
+            if self.mvt_type == _MVT_GEOMETRY_TYPES["線"]:
+                groups = line_groups(
+                    self._boundary_features(
+                        grid,
+                        lambda g: [
+                            [(p.x(), p.y()) for p in line]
+                            for line in g.asMultiPolyline()
+                        ],
+                    ),
+                    grid,
+                )
+            else:
+                groups = polygon_groups(
+                    self._boundary_features(
+                        grid,
+                        lambda g: [
+                            [[(p.x(), p.y()) for p in ring] for ring in polygon]
+                            for polygon in g.asMultiPolygon()
+                        ],
+                    ),
+                    grid,
+                )
+
+            primary_keys = self.provider.pkAttributeIndexes()
+            merged = []
+            merged_fids = []
+            for group in groups:
+                request = QgsFeatureRequest()
+                request.setFilterFids(group)
+                features = list(self.provider.getFeatures(request))
+                geometries = [feature.geometry() for feature in features]
+                if self.mvt_type == _MVT_GEOMETRY_TYPES["線"]:
+                    geometry = QgsGeometry.collectGeometry(geometries).mergeLines()
+                else:
+                    geometry = QgsGeometry.unaryUnion(geometries)
+                if geometry.isNull():
+                    continue
+                geometry.convertToMultiType()
+
+                feature = QgsFeature(self.fields)
+                feature.setGeometry(geometry)
+                attributes = features[0].attributes()
+                # 主キーは書き込み時に振り直させる
+                for i in primary_keys:
+                    attributes[i] = None
+                feature.setAttributes(attributes)
+                merged.append(feature)
+                merged_fids.extend(group)
+
+            if merged_fids:
+                self.provider.deleteFeatures(merged_fids)
+                self.provider.addFeatures(merged)
+
+        self.written_count = self.feature_count = self.provider.featureCount()
+        return before - self.feature_count
+
+    def sync(self):
+        """書き出した地物をディスクに確定させる（メモリレイヤでは何もしない）"""
+
+    def close(self):
+        """書き込み待ちの地物を書き出す"""
+        self.flush()
+
+    def discard(self):
+        """出力を破棄する"""
+        self._buffer = []
+
+
+@contextlib.contextmanager
+def gdal_config_options(options):
+    """with の間だけ、このスレッドで GDAL の構成オプションを設定する
+
+    他のスレッドで QGIS が開くデータソースには影響しない。
+    """
+    previous = {key: gdal.GetThreadLocalConfigOption(key) for key in options}
+    for key, value in options.items():
+        gdal.SetThreadLocalConfigOption(key, str(value))
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            gdal.SetThreadLocalConfigOption(key, value)
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+class GeoPackageSink(LayerSink):
+    """地物を GeoPackage へ直接書き込む出力先
+
+    地物は batch_size 件ごとに1トランザクションで追記する。索引は挿入のたびに
+    更新せず、close() で書き込みを終えてから作る。write_options（GDAL の構成
+    オプション）はファイルを開くときに適用され、開いている間の書き込みに効く。
+    """
+
+    def __init__(
+        self,
+        layer_key,
+        datatype,
+        output_path,
+        layer_name,
+        double_fields=(),
+        extent=None,
+        batch_size=5000,
+        append=False,
+        clip=False,
+        aoi=None,
+        new_file=True,
+        tile_id_field=None,
+        spatial_index=True,
+        index_fields=(),
+        write_options=None,
+    ):
+        self.output_path = output_path
+        self.new_file = new_file
+        self.spatial_index = spatial_index
+        self.index_fields = list(index_fields)
+        self.write_options = write_options or {}
+        self.layer_name = layer_name
+        self.batch_size = batch_size
+        self.append = append
+        super().__init__(
+            layer_key, datatype, double_fields, extent, clip, aoi, tile_id_field
+        )
+        if append:
+            self.written_count = self.feature_count = self.provider.featureCount()
+
+    def _open_layer(self):
+        layer = QgsVectorLayer(
+            f"{self.output_path}|layername={self.layer_name}", self.layer_name, "ogr"
+        )
+        if not layer.isValid():
+            raise RuntimeError(f"Failed to open {self.output_path}")
+        return layer
+
+    def _create_layer(self):
+        with gdal_config_options(self.write_options):
+            if self.append:
+                return self._open_layer()
+            return self._create_file()
+
+    def _create_file(self):
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = "GPKG"
+        options.layerName = self.layer_name
+        # 空間索引は書き込み後に作る
+        options.layerOptions = ["SPATIAL_INDEX=NO"]
+        if self.new_file or not os.path.exists(self.output_path):
+            options.actionOnExistingFile = QgsVectorFileWriter.CreateOrOverwriteFile
+        else:
+            options.actionOnExistingFile = QgsVectorFileWriter.CreateOrOverwriteLayer
+
+        writer = QgsVectorFileWriter.create(
+            self.output_path,
+            QgsFields(),
+            QgsWkbTypes.parseType(self.wkb_type_name),
+            QgsCoordinateReferenceSystem("EPSG:3857"),
+            QgsCoordinateTransformContext(),
+            options,
+        )
+        if writer.hasError() != QgsVectorFileWriter.NoError:
+            raise RuntimeError(
+                f"Failed to create {self.output_path}: {writer.errorMessage()}"
+            )
+        # ファイルを確定させてから OGR プロバイダで開き直す
+        del writer
+        return self._open_layer()
+
+    def last_fid(self):
+        """書き込み済みの地物の最大の fid。地物が無ければ 0"""
+        primary_keys = self.provider.pkAttributeIndexes()
+        if not primary_keys:
+            return 0
+        value = self.provider.maximumValue(primary_keys[0])
+        return int(value) if value else 0
+
+    def truncate(self, last_fid):
+        """fid が last_fid より大きい（チェックポイント後に書き込まれた）地物を削除する"""
+        self._buffer = []
+        request = QgsFeatureRequest()
+        request.setFilterExpression(f'"fid" > {int(last_fid)}')
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setNoAttributes()
+        fids = [feature.id() for feature in self.provider.getFeatures(request)]
+        if fids:
+            self.provider.deleteFeatures(fids)
+        self.written_count = self.feature_count = self.provider.featureCount()
+
+    def _sync_options(self):
+        """write_options の同期だけを FULL にした構成オプション"""
+        return dict(self.write_options, OGR_SQLITE_SYNCHRONOUS="FULL")
+
+    def sync(self):
+        """書き出した地物をディスクに確定させる
+
+        書き込み中の接続は同期しないため、別の接続から同期して WAL の内容を
+        データベースへ移す。読み込み中の接続があって移せない場合は WAL を同期する。
+        """
+        with gdal_config_options(self._sync_options()):
+            ds = ogr.Open(self.output_path, 1)
+        if ds is None:
+            return
+        busy = self._query_value(ds, "PRAGMA wal_checkpoint(FULL)")
+        ds = None
+        wal_path = f"{self.output_path}-wal"
+        if busy and os.path.exists(wal_path):
+            with open(wal_path, "r+b") as f:
+                os.fsync(f.fileno())
+
+    def close(self):
+        super().close()
+        self.sync()
+        self.provider = None
+        self.layer = None
+        with self._phase("index"):
+            self._create_indexes()
+
+    def _create_indexes(self):
+        """空間索引と属性索引を作る（既にあるものは作らない）
+
+        索引が無くても出力は使えるため、開けない場合は何もしない。
+        """
+        if not self.spatial_index and not self.index_fields:
+            return
+        with gdal_config_options(self._sync_options()):
+            ds = ogr.Open(self.output_path, 1)
+        layer = ds.GetLayerByName(self.layer_name) if ds is not None else None
+        if layer is None:
+            return
+
+        table = self.layer_name.replace("'", "''")
+        column = layer.GetGeometryColumn().replace("'", "''")
+        if self.spatial_index and not self._query_value(
+            ds, f"SELECT HasSpatialIndex('{table}', '{column}')"
+        ):
+            self._query_value(ds, f"SELECT CreateSpatialIndex('{table}', '{column}')")
+
+        layer_defn = layer.GetLayerDefn()
+        for field in self.index_fields:
+            if layer_defn.GetFieldIndex(field) < 0:
+                continue
+            ds.ExecuteSQL(
+                f"CREATE INDEX IF NOT EXISTS {_quote(f'{self.layer_name}_{field}_idx')} "
+                f"ON {_quote(self.layer_name)} ({_quote(field)})"
+            )
+        ds = None
+
+    def _query_value(self, ds, sql):
+        """1行1列を返す SQL を実行して値を返す"""
+        result = ds.ExecuteSQL(sql)
+        if result is None:
+            return None
+        try:
+            feature = result.GetNextFeature()
+            return feature.GetField(0) if feature is not None else None
+        finally:
+            ds.ReleaseResultSet(result)
+
+    def discard(self):
+        super().discard()
+        self.provider = None
+        self.layer = None
+        if not os.path.exists(self.output_path):
+            return
+
+        # 他のレイヤと共有するファイルからはこのレイヤだけを削除する
+        ds = ogr.Open(self.output_path, 1)
+        remaining = 0
+        if ds is not None:
+            for i in range(ds.GetLayerCount()):
+                if ds.GetLayer(i).GetName() == self.layer_name:
+                    ds.DeleteLayer(i)
+                    break
+            remaining = ds.GetLayerCount()
+            ds = None
+        if remaining == 0:
+            os.remove(self.output_path)
+
+
+class SinkGroup:
+    """同じソースレイヤの複数の出力先（バッチ処理の範囲ごとの出力）をまとめる
+
+    download_tiles() からは1つの LayerSink と同じように扱える。
+    """
+
+    def __init__(self, layer_key, sinks):
+        self.layer_key = layer_key
+        self.sinks = list(sinks)
+
+    @property
+    def feature_count(self):
+        return sum(sink.feature_count for sink in self.sinks)
+
+    @property
+    def written_count(self):
+        return sum(sink.written_count for sink in self.sinks)
+
+    def receivers(self, rect):
+        return [sink for sink in self.sinks if sink.intersects(rect)]
+
+    def needs_flush(self):
+        return any(sink.needs_flush() for sink in self.sinks)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def sync(self):
+        for sink in self.sinks:
+            sink.sync()
+
+    def stitch(self, grid):
+        return sum(sink.stitch(grid) for sink in self.sinks)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    def discard(self):
+        for sink in self.sinks:
+            sink.discard()
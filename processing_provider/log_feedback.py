@@ -0,0 +1,86 @@
+"""詳細度に応じたメッセージの間引き
+
+タイルごとのメッセージは大きなジョブでは数万行になり、GUI のログの更新だけで
+処理が遅くなるため、"summary" では件数に集計して一定間隔でまとめて書き出す。
+"""
+
+import time
+
+
+class LogFeedback:
+    def __init__(self, feedback, level="summary", interval=5.0, clock=time.monotonic):
+        """level は "summary" または "debug"。他の呼び出しは feedback へそのまま渡す"""
+        self.feedback = feedback
+        self.level = level
+        self.interval = interval
+        self._clock = clock
+        self.counts = {}
+        self._last_summary_time = None
+        self._last_progress = None
+
+    def __getattr__(self, name):
+        return getattr(self.feedback, name)
+
+    @property
+    def debug(self):
+        return self.level == "debug"
+
+    def pushDebugInfo(self, info):
+        """タイルごとの詳細。debug の場合だけ書き出す"""
+        if self.debug:
+            self.feedback.pushInfo(info)
+
+    def count(self, name, value=1):
+        """次の pushSummary() でまとめて書き出す件数を加える"""
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def pushSummary(self, message, force=False):
+        """message に前回から数えた件数を付けて、interval 秒ごとに書き出す"""
+        now = self._clock()
+        if (
+            not force
+            and self._last_summary_time is not None
+            and now - self._last_summary_time < self.interval
+        ):
+            return
+        self._last_summary_time = now
+        counts = ", ".join(f"{value} {name}" for name, value in self.counts.items())
+        self.counts = {}
+        self.feedback.pushInfo(f"{message}: {counts}" if counts else message)
+
+    def setProgress(self, progress):
+        """進捗は整数のパーセントが変わったときだけ渡す"""
+        value = int(progress)
+        if value == self._last_progress:
+            return
+        self._last_progress = value
+        self.feedback.setProgress(progress)
+
+
+class BufferedFeedback:
+    """別スレッドの処理のメッセージを溜め、replay() で処理のスレッドの feedback へ渡す
+
+    QGIS の出力やログは処理のスレッドから書き込む。進捗は受け取った側で計算するので捨てる。
+    """
+
+    def __init__(self, is_canceled):
+        self.isCanceled = is_canceled
+        self._calls = []
+
+    def pushInfo(self, info):
+        self._calls.append(("pushInfo", info))
+
+    def pushDebugInfo(self, info):
+        self._calls.append(("pushDebugInfo", info))
+
+    def count(self, name, value=1):
+        self._calls.append(("count", name, value))
+
+    def setProgress(self, progress):
+        pass
+
+    def replay(self, feedback):
+        """溜めたメッセージを feedback へ渡す"""
+        calls, self._calls = self._calls, []
+        for method, *args in calls:
+            getattr(feedback, method)(*args)
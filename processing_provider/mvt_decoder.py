@@ -0,0 +1,584 @@
+"""MVT（Mapbox Vector Tile）のデコーダ
+
+タイルの protobuf を直接読み、ジオメトリを EPSG:3857 の WKB（Multi* 型）にする。
+OGR の MVT ドライバ（CLIP=YES）と同様に、ジオメトリはタイルの範囲で切り取る。
+"""
+
+import collections
+import struct
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Web メルカトル（EPSG:3857）の原点から端までの距離
+_ORIGIN_SHIFT = 20037508.342789244
+
+# MVT のジオメトリ型
+POINT = 1
+LINESTRING = 2
+POLYGON = 3
+
+_MOVE_TO = 1
+_LINE_TO = 2
+_CLOSE_PATH = 7
+
+# WKB のジオメトリ型
+_WKB_MULTI_TYPES = {POINT: 4, LINESTRING: 5, POLYGON: 6}
+
+DecodedFeature = collections.namedtuple(
+    "DecodedFeature", ["id", "geom_type", "wkb", "properties"]
+)
+DecodedFeature.__doc__ = """デコードした地物
+
+geom_type は MVT のジオメトリ型（POINT, LINESTRING, POLYGON）、
+wkb は EPSG:3857 の Multi* 型の WKB、properties は dict。
+"""
+
+DecodedLayer = collections.namedtuple("DecodedLayer", ["name", "extent", "features"])
+
+
+def _read_varint(buf, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _iter_fields(buf, pos, end):
+    """メッセージのフィールドを (番号, 値) として返す。長さ付きの値は (開始, 終了)"""
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _read_varint(buf, pos)
+        elif wire_type == 2:
+            length, pos = _read_varint(buf, pos)
+            value = (pos, pos + length)
+            pos += length
+        elif wire_type == 1:
+            value = buf[pos : pos + 8]
+            pos += 8
+        elif wire_type == 5:
+            value = buf[pos : pos + 4]
+            pos += 4
+        else:
+            raise ValueError(f"Unsupported wire type: {wire_type}")
+        yield field, value
+    if pos != end:
+        raise ValueError("Truncated message")
+
+
+def _unpack_varints(buf, pos, end):
+    """packed フィールドの varint 列を展開する"""
+    values = []
+    while pos < end:
+        value, pos = _read_varint(buf, pos)
+        values.append(value)
+    return values
+
+
+def _varints_numpy(data):
+    """uint8 配列に並んだ varint 列を一度に展開する"""
+    # 最上位ビットが立っていないバイトが各値の最後のバイト
+    last = np.flatnonzero(data < 0x80)
+    first = np.empty_like(last)
+    first[:1] = 0
+    first[1:] = last[:-1] + 1
+    index = np.repeat(np.arange(len(last)), last - first + 1)
+    shift = ((np.arange(len(data)) - first[index]) * 7).astype(np.uint64)
+    payload = (data & 0x7F).astype(np.uint64) << shift
+    return np.add.reduceat(payload, first).astype(np.int64)
+
+
+def _zigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def _parse_value(buf, pos, end):
+    for field, value in _iter_fields(buf, pos, end):
+        if field == 1:
+            return bytes(buf[value[0] : value[1]]).decode("utf-8")
+        if field == 2:
+            return struct.unpack("<f", value)[0]
+        if field == 3:
+            return struct.unpack("<d", value)[0]
+        if field == 4:
+            return value - (1 << 64) if value >= 1 << 63 else value
+        if field == 5:
+            return value
+        if field == 6:
+            return _zigzag(value)
+        if field == 7:
+            return bool(value)
+    return None
+
+
+def _command_structure(commands, start, end):
+    """commands[start:end] のコマンドの位置とパスごとの頂点数を返す（座標は読まない）"""
+    positions = []
+    path_sizes = []
+    i = start
+    while i < end:
+        header = commands[i]
+        command, count = header & 7, header >> 3
+        positions.append(i)
+        i += 1
+        if command == _MOVE_TO:
+            # 複数の点を持つ MoveTo（MultiPoint）は1点ずつのパスとする
+            path_sizes.extend([1] * count)
+            i += 2 * count
+        elif command == _LINE_TO:
+            if not path_sizes:
+                raise ValueError("LineTo before MoveTo")
+            path_sizes[-1] += count
+            i += 2 * count
+        elif command != _CLOSE_PATH:
+            raise ValueError(f"Unknown geometry command: {command}")
+    if i != end:
+        raise ValueError("Truncated geometry")
+    return positions, path_sizes
+
+
+class _LayerGeometry:
+    """1レイヤ分の全地物のジオメトリ
+
+    各地物のパスを、レイヤ全体で通し番号を振った頂点の範囲 (開始, 終了) で持つ。
+    """
+
+    def __init__(self, extent, origin_x, origin_y, scale):
+        self.extent = extent
+        self.origin_x = origin_x
+        self.origin_y = origin_y
+        self.scale = scale
+        self.feature_paths = []
+
+    def _add_paths(self, vertex, path_sizes):
+        paths = []
+        for size in path_sizes:
+            paths.append((vertex, vertex + size))
+            vertex += size
+        self.feature_paths.append(paths)
+        return vertex
+
+    def transform(self, xs, ys, close=False):
+        """タイル座標のリストを EPSG:3857 に変換し、WKB の座標列にする"""
+        values = []
+        for x, y in zip(xs, ys):
+            values.append(x * self.scale + self.origin_x)
+            values.append(self.origin_y - y * self.scale)
+        if close:
+            values.extend(values[:2])
+        return struct.pack(f"<{len(values)}d", *values)
+
+    def wkb(self, i, geom_type):
+        """i 番目の地物の Multi* 型の WKB。タイル外に消えた場合は None"""
+        paths = self.feature_paths[i]
+        if not paths:
+            return None
+        extent = self.extent
+
+        if geom_type == POINT:
+            if self.inside(i):
+                parts = [b"\x01\x01\x00\x00\x00" + self.coords(s, e) for s, e in paths]
+            else:
+                parts = []
+                for s, e in paths:
+                    (x,), (y,) = self.tile_coords(s, e)
+                    if 0 <= x <= extent and 0 <= y <= extent:
+                        parts.append(b"\x01\x01\x00\x00\x00" + self.transform([x], [y]))
+
+        elif geom_type == LINESTRING:
+            paths = [(s, e) for s, e in paths if e - s >= 2]
+            if self.inside(i):
+                parts = [
+                    struct.pack("<BII", 1, 2, e - s) + self.coords(s, e)
+                    for s, e in paths
+                ]
+            else:
+                parts = [
+                    struct.pack("<BII", 1, 2, len(lx)) + self.transform(lx, ly)
+                    for s, e in paths
+                    for lx, ly in _clip_line(*self.tile_coords(s, e), extent)
+                ]
+
+        elif geom_type == POLYGON:
+            polygons = []
+            for (s, e), area in zip(paths, self.ring_areas(paths)):
+                if e - s < 3 or area == 0:
+                    continue
+                # 外周（正の面積）から新しいポリゴンを始める。先頭が内周の場合も外周とみなす
+                if area > 0 or not polygons:
+                    polygons.append([(s, e)])
+                else:
+                    polygons[-1].append((s, e))
+
+            parts = []
+            inside = self.inside(i)
+            for rings in polygons:
+                if inside:
+                    ring_bytes = [
+                        struct.pack("<I", e - s + 1) + self.coords(s, e, close=True)
+                        for s, e in rings
+                    ]
+                else:
+                    clipped = [
+                        _clip_ring(*self.tile_coords(s, e), extent) for s, e in rings
+                    ]
+                    if clipped[0] is None:
+                        continue
+                    ring_bytes = [
+                        struct.pack("<I", len(rx) + 1)
+                        + self.transform(rx, ry, close=True)
+                        for rx, ry in (ring for ring in clipped if ring is not None)
+                    ]
+                parts.append(
+                    struct.pack("<BII", 1, 3, len(ring_bytes)) + b"".join(ring_bytes)
+                )
+
+        else:
+            return None
+
+        if not parts:
+            return None
+        return struct.pack(
+            "<BII", 1, _WKB_MULTI_TYPES[geom_type], len(parts)
+        ) + b"".join(parts)
+
+
+class _PythonLayerGeometry(_LayerGeometry):
+    """地物ごとに Python でコマンド列を展開する"""
+
+    def __init__(self, buf, geometry_ranges, extent, origin_x, origin_y, scale):
+        super().__init__(extent, origin_x, origin_y, scale)
+        self.xs = []
+        self.ys = []
+        vertex = 0
+        for pos, end in geometry_ranges:
+            commands = _unpack_varints(buf, pos, end)
+            try:
+                positions, path_sizes = _command_structure(commands, 0, len(commands))
+            except ValueError:
+                path_sizes = []
+                positions = range(len(commands))
+
+            command_positions = set(positions)
+            params = [v for j, v in enumerate(commands) if j not in command_positions]
+            x = y = 0
+            for j in range(0, len(params), 2):
+                x += _zigzag(params[j])
+                y += _zigzag(params[j + 1])
+                self.xs.append(x)
+                self.ys.append(y)
+            vertex = self._add_paths(vertex, path_sizes)
+
+    def inside(self, i):
+        paths = self.feature_paths[i]
+        s, e = paths[0][0], paths[-1][1]
+        xs = self.xs[s:e]
+        ys = self.ys[s:e]
+        return (
+            min(xs) >= 0
+            and min(ys) >= 0
+            and max(xs) <= self.extent
+            and max(ys) <= self.extent
+        )
+
+    def tile_coords(self, s, e):
+        return self.xs[s:e], self.ys[s:e]
+
+    def coords(self, s, e, close=False):
+        return self.transform(self.xs[s:e], self.ys[s:e], close)
+
+    def ring_areas(self, paths):
+        return [_ring_area(self.xs[s:e], self.ys[s:e]) for s, e in paths]
+
+
+class _NumPyLayerGeometry(_LayerGeometry):
+    """レイヤ全体のコマンド列を NumPy でまとめて展開する
+
+    地物ごとに Python で行うのはコマンドの走査と WKB の組み立てだけにする。
+    """
+
+    def __init__(self, buf, geometry_ranges, extent, origin_x, origin_y, scale):
+        super().__init__(extent, origin_x, origin_y, scale)
+        data = np.frombuffer(buf, dtype=np.uint8)
+        starts = np.array([pos for pos, _ in geometry_ranges], dtype=np.int64)
+        lengths = np.array([end - pos for pos, end in geometry_ranges], dtype=np.int64)
+        byte_offsets = np.concatenate(([0], np.cumsum(lengths)))
+        raw = data[
+            np.repeat(starts - byte_offsets[:-1], lengths) + np.arange(byte_offsets[-1])
+        ]
+        if len(raw) and raw[-1] >= 0x80:
+            raise ValueError("Truncated varint")
+
+        # 地物ごとの値の範囲（最後のバイトの数を数える）
+        terminal = np.concatenate(([0], np.cumsum(raw < 0x80)))
+        value_offsets = terminal[byte_offsets].tolist()
+        values = _varints_numpy(raw) if len(raw) else np.zeros(0, dtype=np.int64)
+        commands = values.tolist()
+
+        is_param = np.ones(len(values), dtype=bool)
+        vertex = 0
+        for j in range(len(geometry_ranges)):
+            start, end = value_offsets[j], value_offsets[j + 1]
+            try:
+                positions, path_sizes = _command_structure(commands, start, end)
+            except ValueError:
+                path_sizes = []
+                positions = slice(start, end)
+            is_param[positions] = False
+            vertex = self._add_paths(vertex, path_sizes)
+
+        params = _zigzag(values[is_param])
+        tx = np.cumsum(params[0::2])
+        ty = np.cumsum(params[1::2])
+        # カーソルは地物ごとに原点から始まるので、地物の開始前までの累積を引く
+        counts = np.array(
+            [
+                paths[-1][1] - paths[0][0] if paths else 0
+                for paths in self.feature_paths
+            ],
+            dtype=np.int64,
+        )
+        first_vertex = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        before = np.where(first_vertex > 0, first_vertex - 1, 0)
+        if len(tx):
+            tx -= np.repeat(np.where(first_vertex > 0, tx[before], 0), counts)
+            ty -= np.repeat(np.where(first_vertex > 0, ty[before], 0), counts)
+        self.tx = tx
+        self.ty = ty
+
+        # タイルごとに1つのアフィン変換で EPSG:3857 にする
+        self.xy = np.empty((len(tx), 2), dtype="<f8")
+        self.xy[:, 0] = tx * scale + origin_x
+        self.xy[:, 1] = origin_y - ty * scale
+
+        # 地物ごとにタイルの範囲に収まっているか
+        self._inside = np.ones(len(counts), dtype=bool)
+        nonempty = np.flatnonzero(counts)
+        if len(nonempty):
+            at = first_vertex[nonempty]
+            self._inside[nonempty] = (
+                (np.minimum.reduceat(tx, at) >= 0)
+                & (np.minimum.reduceat(ty, at) >= 0)
+                & (np.maximum.reduceat(tx, at) <= extent)
+                & (np.maximum.reduceat(ty, at) <= extent)
+            )
+        self._inside = self._inside.tolist()
+        self._areas = None
+
+    def inside(self, i):
+        return self._inside[i]
+
+    def tile_coords(self, s, e):
+        return self.tx[s:e].tolist(), self.ty[s:e].tolist()
+
+    def coords(self, s, e, close=False):
+        if close:
+            return self.xy[s:e].tobytes() + self.xy[s].tobytes()
+        return self.xy[s:e].tobytes()
+
+    def ring_areas(self, paths):
+        if self._areas is None:
+            self._areas = self._all_ring_areas()
+        return [self._areas[s] for s, _ in paths]
+
+    def _all_ring_areas(self):
+        """レイヤの全パスの符号付き面積の2倍を一度に求め、開始頂点 -> 面積で返す"""
+        paths = [path for feature in self.feature_paths for path in feature]
+        if not paths:
+            return {}
+        starts = np.array([s for s, _ in paths], dtype=np.int64)
+        ends = np.array([e for _, e in paths], dtype=np.int64)
+        # 各頂点の次の頂点（パスの最後は先頭に戻る）
+        following = np.arange(1, len(self.tx) + 1)
+        following[ends - 1] = starts
+        terms = self.tx * self.ty[following] - self.tx[following] * self.ty
+        return dict(zip(starts.tolist(), np.add.reduceat(terms, starts).tolist()))
+
+
+def _ring_area(xs, ys):
+    """タイル座標（y は下向き）での符号付き面積の2倍。外周は正になる"""
+    n = len(xs)
+    return sum(xs[i] * ys[(i + 1) % n] - xs[(i + 1) % n] * ys[i] for i in range(n))
+
+
+def _clip_line(xs, ys, extent):
+    """折れ線をタイルの範囲 [0, extent] で切り、範囲内の部分のリストを返す"""
+    parts = []
+    current = None
+    for i in range(len(xs) - 1):
+        segment = _clip_segment(xs[i], ys[i], xs[i + 1], ys[i + 1], extent)
+        if segment is None:
+            current = None
+            continue
+        x0, y0, x1, y1 = segment
+        if current is None or (current[0][-1], current[1][-1]) != (x0, y0):
+            current = ([x0], [y0])
+            parts.append(current)
+        current[0].append(x1)
+        current[1].append(y1)
+    # 範囲の角や辺に触れただけの長さ 0 の部分は除く
+    return [(px, py) for px, py in parts if len(set(zip(px, py))) >= 2]
+
+
+def _clip_segment(x0, y0, x1, y1, extent):
+    """Liang-Barsky 法で線分を切る。範囲外なら None"""
+    t0, t1 = 0.0, 1.0
+    dx, dy = x1 - x0, y1 - y0
+    for p, q in ((-dx, x0), (dx, extent - x0), (-dy, y0), (dy, extent - y0)):
+        if p == 0:
+            if q < 0:
+                return None
+            continue
+        t = q / p
+        if p < 0:
+            if t > t1:
+                return None
+            t0 = max(t0, t)
+        else:
+            if t < t0:
+                return None
+            t1 = min(t1, t)
+    return (x0 + t0 * dx, y0 + t0 * dy, x0 + t1 * dx, y0 + t1 * dy)
+
+
+def _clip_ring(xs, ys, extent):
+    """Sutherland-Hodgman 法でリングをタイルの範囲で切る"""
+    points = list(zip(xs, ys))
+    for axis, limit, keep_below in (
+        (0, 0, False),
+        (0, extent, True),
+        (1, 0, False),
+        (1, extent, True),
+    ):
+        if not points:
+            break
+
+        def inside(point):
+            return point[axis] <= limit if keep_below else point[axis] >= limit
+
+        clipped = []
+        previous = points[-1]
+        for point in points:
+            if inside(point):
+                if not inside(previous):
+                    clipped.append(_intersect(previous, point, axis, limit))
+                clipped.append(point)
+            elif inside(previous):
+                clipped.append(_intersect(previous, point, axis, limit))
+            previous = point
+        points = clipped
+
+    if len(points) < 3:
+        return None
+    return [p[0] for p in points], [p[1] for p in points]
+
+
+def _intersect(a, b, axis, limit):
+    t = (limit - a[axis]) / (b[axis] - a[axis])
+    other = 1 - axis
+    point = [0.0, 0.0]
+    point[axis] = limit
+    point[other] = a[other] + t * (b[other] - a[other])
+    return tuple(point)
+
+
+def _decode_layer(buf, pos, end, xyz):
+    name = None
+    extent = 4096
+    keys = []
+    values = []
+    feature_ranges = []
+    for field, value in _iter_fields(buf, pos, end):
+        if field == 1:
+            name = bytes(buf[value[0] : value[1]]).decode("utf-8")
+        elif field == 2:
+            feature_ranges.append(value)
+        elif field == 3:
+            keys.append(bytes(buf[value[0] : value[1]]).decode("utf-8"))
+        elif field == 4:
+            values.append(_parse_value(buf, *value))
+        elif field == 5:
+            extent = value
+
+    # タイル座標 -> EPSG:3857 のアフィン変換（タイルごとに1つ）
+    x, y, z = xyz
+    tile_size = 2 * _ORIGIN_SHIFT / (1 << z)
+    origin_x = -_ORIGIN_SHIFT + x * tile_size
+    origin_y = _ORIGIN_SHIFT - y * tile_size
+    scale = tile_size / extent
+
+    parsed = []
+    for feature_pos, feature_end in feature_ranges:
+        feature_id = None
+        geom_type = 0
+        tags = ()
+        geometry = None
+        for field, value in _iter_fields(buf, feature_pos, feature_end):
+            if field == 1:
+                feature_id = value
+            elif field == 2:
+                tags = value
+            elif field == 3:
+                geom_type = value
+            elif field == 4:
+                geometry = value
+        if geometry is not None:
+            parsed.append((feature_id, geom_type, tags, geometry))
+
+    layer_geometry_class = (
+        _NumPyLayerGeometry if np is not None else _PythonLayerGeometry
+    )
+    geometries = layer_geometry_class(
+        buf, [f[3] for f in parsed], extent, origin_x, origin_y, scale
+    )
+
+    features = []
+    for i, (feature_id, geom_type, tags, _) in enumerate(parsed):
+        wkb = geometries.wkb(i, geom_type)
+        if wkb is None:
+            continue
+
+        tags = _unpack_varints(buf, *tags) if tags else ()
+        properties = {}
+        for j in range(0, len(tags) - 1, 2):
+            properties[keys[tags[j]]] = values[tags[j + 1]]
+        features.append(DecodedFeature(feature_id, geom_type, wkb, properties))
+
+    return DecodedLayer(name, extent, features)
+
+
+def decode_tile(data, xyz, layer_names=None):
+    """タイルの bytes をデコードし、レイヤ名 -> DecodedLayer の dict を返す"""
+    if data[:2] == b"\x1f\x8b":
+        import gzip
+
+        data = gzip.decompress(data)
+
+    buf = memoryview(data)
+    wanted = None if layer_names is None else set(layer_names)
+    layers = {}
+    for field, value in _iter_fields(buf, 0, len(buf)):
+        if field != 3:
+            continue
+        # レイヤ名を先に読み、対象外のレイヤは地物を読まずに飛ばす
+        name = _layer_name(buf, *value)
+        if wanted is not None and name not in wanted:
+            continue
+        layers[name] = _decode_layer(buf, value[0], value[1], xyz)
+    return layers
+
+
+def _layer_name(buf, pos, end):
+    for field, value in _iter_fields(buf, pos, end):
+        if field == 1:
+            return bytes(buf[value[0] : value[1]]).decode("utf-8")
+    return None
@@ -0,0 +1,135 @@
+"""段階ごとにスレッドを分けた処理のパイプライン
+
+Stage の入力に別の Stage を渡せば段階をつないで同時に進められる。段階の間の
+キューは depth 個までに抑えるため、メモリの使用量は depth で頭打ちになる。
+"""
+
+import contextlib
+import queue
+import threading
+
+_DONE = object()
+
+
+class Stage:
+    def __init__(self, items, func, depth=2, is_canceled=None):
+        """items の各要素に func を適用する。depth=0 の場合は呼び出し側のスレッドで処理する"""
+        self.items = items
+        self.func = func
+        self.depth = depth
+        self.is_canceled = is_canceled
+        self._stop = threading.Event()
+        self._lock = threading.RLock()
+        # 入力から取り出して、まだ呼び出し側が次の結果を求めていない要素
+        self._in_flight = []
+        self._queue = None
+        self._thread = None
+        self._iterator = None
+        self._started = False
+
+    def _canceled(self):
+        return self._stop.is_set() or (
+            self.is_canceled is not None and self.is_canceled()
+        )
+
+    def _take(self, iterator):
+        """入力から次の要素を取り出して処理中に加える。無ければ _DONE"""
+        if self._canceled():
+            return _DONE
+        item = next(iterator, _DONE)
+        if item is not _DONE:
+            with self._lock:
+                self._in_flight.append(item)
+        return item
+
+    def _put(self, entry):
+        """キューに空きができるまで待って入れる。中止された場合は False"""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        iterator = iter(self.items)
+        try:
+            while True:
+                item = self._take(iterator)
+                if item is _DONE:
+                    break
+                if not self._put((self.func(item), None)):
+                    return
+        except BaseException as e:
+            self._put((None, e))
+            return
+        self._put((_DONE, None))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        # 前回返した要素は、呼び出し側が次を求めた時点で処理済みとする
+        with self._lock:
+            if self._started and self._in_flight:
+                self._in_flight.pop(0)
+        self._started = True
+
+        if self.depth <= 0:
+            if self._iterator is None:
+                self._iterator = iter(self.items)
+            item = self._take(self._iterator)
+            if item is _DONE:
+                raise StopIteration
+            return self.func(item)
+
+        if self._thread is None:
+            self._queue = queue.Queue(maxsize=self.depth)
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        while True:
+            try:
+                result, error = self._queue.get(timeout=0.1)
+                break
+            except queue.Empty:
+                if self._stop.is_set():
+                    raise StopIteration
+        if error is not None:
+            raise error
+        if result is _DONE:
+            raise StopIteration
+        return result
+
+    def in_flight(self):
+        """入力から取り出したが、呼び出し側がまだ処理を終えていない要素"""
+        with self._lock:
+            return list(self._in_flight)
+
+    @contextlib.contextmanager
+    def paused(self):
+        """with の間は要素の処理を始めさせない（in_flight() を見て資源を解放する間）"""
+        with self._lock:
+            yield
+
+    def close(self):
+        """スレッドを止める。入力が Stage の場合はそれも止める"""
+        stages = [self]
+        while isinstance(stages[-1].items, Stage):
+            stages.append(stages[-1].items)
+        # 先に全段階を止めてから待つ（前の段階の結果を待っているスレッドも抜けさせる）
+        for stage in stages:
+            stage._stop.set()
+        for stage in stages:
+            stage._join()
+
+    def _join(self):
+        if self._thread is None:
+            return
+        # 結果を入れようとして待っているスレッドを解放する
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self._thread.join()
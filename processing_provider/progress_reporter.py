@@ -0,0 +1,80 @@
+"""コマンドライン実行時の進捗とメッセージの出力（テキストまたは JSON Lines）"""
+
+import json
+import time
+
+
+class ProgressReporter:
+    def __init__(
+        self, stream, json_lines=False, min_interval=1.0, clock=time.monotonic
+    ):
+        """進捗は min_interval 秒ごとに書き出す（100% は常に書き出す）"""
+        self.stream = stream
+        self.json_lines = json_lines
+        self.min_interval = min_interval
+        self._clock = clock
+        self.errors = 0
+        self.canceled = False
+        self._last_progress = None
+        self._last_progress_time = None
+
+    def _emit(self, event, **fields):
+        if self.json_lines:
+            line = json.dumps({"event": event, **fields}, ensure_ascii=False)
+        elif event == "progress":
+            line = f"[progress] {fields['progress']}%"
+        elif "message" in fields:
+            line = f"[{event}] {fields['message']}"
+        else:
+            line = f"[{event}] " + ", ".join(f"{k}={v}" for k, v in fields.items())
+        self.stream.write(line + "\n")
+        self.stream.flush()
+
+    def info(self, message):
+        self._emit("info", message=message)
+
+    def warning(self, message):
+        self._emit("warning", message=message)
+
+    def error(self, message):
+        self.errors += 1
+        self._emit("error", message=message)
+
+    def progress(self, value):
+        """進捗（0-100）。同じ値や min_interval 未満の間隔の更新は書き出さない"""
+        value = max(0, min(100, int(value)))
+        if value == self._last_progress:
+            return
+        now = self._clock()
+        if (
+            value < 100
+            and self._last_progress_time is not None
+            and now - self._last_progress_time < self.min_interval
+        ):
+            return
+        self._last_progress = value
+        self._last_progress_time = now
+        self._emit("progress", progress=value)
+
+    def metrics(self, report):
+        """実行レポート（run_metrics.RunMetrics.report()）を書き出す"""
+        if self.json_lines:
+            self._emit("metrics", **report)
+            return
+        rates = report.get("rates", {})
+        self._emit(
+            "metrics",
+            elapsed=report["elapsed"],
+            tiles_per_second=rates.get("tiles_per_second"),
+            features_per_second=rates.get("features_per_second"),
+        )
+
+    def cancel(self):
+        self.canceled = True
+
+    def is_canceled(self):
+        return self.canceled
+
+    def finished(self, exit_code, **fields):
+        """終了状態を書き出す"""
+        self._emit("finished", exit_code=exit_code, errors=self.errors, **fields)
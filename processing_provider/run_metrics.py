@@ -0,0 +1,94 @@
+"""ジョブの計測（フェーズごとの所要時間とカウンタを JSON の実行レポートにまとめる）
+
+内側のフェーズの時間は外側に含めない。フェーズはスレッドごとに計測するため、
+パイプラインで段階が同時に進むと合計が全体の所要時間を超える。
+"""
+
+import contextlib
+import json
+import threading
+import time
+
+REPORT_FILENAME = "vtdownloader_report.json"
+VERSION = 1
+
+
+class RunMetrics:
+    def __init__(self, clock=time.perf_counter, wall_clock=time.time):
+        self._clock = clock
+        self.started_at = wall_clock()
+        self._start = clock()
+        self.timings = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def _stack(self):
+        """このスレッドで計測中のフェーズの [名前, 再開した時刻] のリスト"""
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _stop(self, stack, now):
+        name, resumed = stack[-1]
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + now - resumed
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """with ブロックの所要時間を name のフェーズに加える"""
+        stack = self._stack
+        now = self._clock()
+        if stack:
+            self._stop(stack, now)
+        stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = self._clock()
+            self._stop(stack, now)
+            stack.pop()
+            if stack:
+                stack[-1][1] = now
+
+    def add(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def elapsed(self):
+        return self._clock() - self._start
+
+    def report(self, **extra):
+        """extra（パラメータなど）を加えた実行レポート（JSON に変換できる dict）"""
+        elapsed = self.elapsed()
+        with self._lock:
+            counters = dict(self.counters)
+            timings = dict(self.timings)
+
+        def per_second(value, seconds):
+            return round(value / seconds, 3) if seconds > 0 else None
+
+        rates = {
+            "tiles_per_second": per_second(counters.get("tiles_processed", 0), elapsed),
+            "features_per_second": per_second(
+                counters.get("features_written", 0), elapsed
+            ),
+            "download_bytes_per_second": per_second(
+                counters.get("bytes_downloaded", 0), timings.get("fetch", 0.0)
+            ),
+        }
+        return {
+            "version": VERSION,
+            "started_at": self.started_at,
+            "elapsed": round(elapsed, 3),
+            "phases": {name: round(t, 3) for name, t in timings.items()},
+            "counters": counters,
+            "rates": rates,
+            **extra,
+        }
+
+    def write(self, path, report):
+        with open(path, mode="w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
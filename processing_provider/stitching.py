@@ -0,0 +1,141 @@
+"""タイル境界で分割された地物の結合と重複の除去
+
+断片は (属性, 境界線, 境界上の位置) をキーにしたハッシュで突き合わせるので、
+処理時間は地物数にほぼ比例する。ジオメトリの結合は呼び出し側で行う。
+"""
+
+import math
+
+from .tile_index import ORIGIN_SHIFT
+
+# 面の境界上の辺を突き合わせる区間の数（タイルの一辺あたり）
+_CELLS_PER_TILE = 256
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        parent = self.parent.setdefault(item, item)
+        if parent != item:
+            parent = self.parent[item] = self.find(parent)
+        return parent
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[root_b] = root_a
+
+    def groups(self):
+        """2つ以上の要素を持つグループのリスト"""
+        groups = {}
+        for item in self.parent:
+            groups.setdefault(self.find(item), []).append(item)
+        return [sorted(group) for group in groups.values() if len(group) > 1]
+
+
+class TileGrid:
+    """ズームレベルのタイル境界と、座標を同一とみなす許容誤差"""
+
+    def __init__(self, tile_size, tolerance):
+        self.tile_size = tile_size
+        self.tolerance = tolerance
+
+    def boundary(self, value):
+        """value がタイルの境界上にあれば境界の番号、無ければ None"""
+        index = round((value + ORIGIN_SHIFT) / self.tile_size)
+        if abs(index * self.tile_size - ORIGIN_SHIFT - value) <= self.tolerance:
+            return index
+        return None
+
+    def boundary_keys(self, point):
+        """境界上の点のキー (軸, 境界の番号, 境界に沿った位置) のリスト"""
+        keys = []
+        for axis in (0, 1):
+            index = self.boundary(point[axis])
+            if index is not None:
+                position = round(point[1 - axis] / self.tolerance)
+                keys.append((axis, index, position))
+        return keys
+
+
+def duplicate_points(points, grid):
+    """(地物 ID, 属性のキー, 点のリスト) のうち、同じ位置・同じ属性の2件目以降の ID"""
+    seen = set()
+    duplicates = []
+    for fid, attributes, coordinates in points:
+        key = (
+            attributes,
+            tuple(
+                (round(x / grid.tolerance), round(y / grid.tolerance))
+                for x, y in coordinates
+            ),
+        )
+        if key in seen:
+            duplicates.append(fid)
+        else:
+            seen.add(key)
+    return duplicates
+
+
+def line_groups(lines, grid):
+    """タイルの境界上で端点を共有し、属性が同じ線の地物 ID のグループを返す"""
+    union_find = _UnionFind()
+    endpoints = {}
+    for fid, attributes, parts in lines:
+        for part in parts:
+            if len(part) < 2:
+                continue
+            for point in (part[0], part[-1]):
+                for axis, index, position in grid.boundary_keys(point):
+                    # 丸めの境目をまたいだ端点も見つけられるよう隣の位置も調べる
+                    for neighbor in (position - 1, position, position + 1):
+                        other = endpoints.get((attributes, axis, index, neighbor))
+                        if other is not None and other != fid:
+                            union_find.union(other, fid)
+                    endpoints.setdefault((attributes, axis, index, position), fid)
+    return union_find.groups()
+
+
+def polygon_groups(polygons, grid):
+    """タイルの境界上で辺を共有し、境界の両側にある属性が同じ面の地物 ID のグループを返す"""
+    cell = grid.tile_size / _CELLS_PER_TILE
+    union_find = _UnionFind()
+    buckets = {}
+    for fid, attributes, parts in polygons:
+        points = [point for rings in parts for ring in rings for point in ring]
+        if not points:
+            continue
+        center = (
+            (min(p[0] for p in points) + max(p[0] for p in points)) / 2,
+            (min(p[1] for p in points) + max(p[1] for p in points)) / 2,
+        )
+        for rings in parts:
+            for ring in rings:
+                for p, q in zip(ring, ring[1:]):
+                    for axis in (0, 1):
+                        index = grid.boundary(p[axis])
+                        if index is None or grid.boundary(q[axis]) != index:
+                            continue
+                        line = index * grid.tile_size - ORIGIN_SHIFT
+                        side = center[axis] > line
+                        low, high = sorted((p[1 - axis], q[1 - axis]))
+                        if high - low <= grid.tolerance:
+                            continue
+                        for position in range(
+                            math.floor(low / cell), math.floor(high / cell) + 1
+                        ):
+                            bucket = buckets.setdefault(
+                                (attributes, axis, index, position), ([], [])
+                            )
+                            bucket[side].append((fid, low, high))
+
+    # 同じ区間にある境界の両側の辺のうち、端で接するだけでなく重なるものを結ぶ
+    for low_side, high_side in buckets.values():
+        for fid, low, high in low_side:
+            for other, other_low, other_high in high_side:
+                overlap = min(high, other_high) - max(low, other_low)
+                if overlap > grid.tolerance:
+                    union_find.union(fid, other)
+    return union_find.groups()
@@ -0,0 +1,377 @@
+"""永続タイルキャッシュ（上限サイズを超えた分は参照の古い順に削除する）"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+INDEX_FILENAME = "cache.sqlite"
+MBTILES_FILENAME = "tiles.mbtiles"
+
+# 索引への書き込みをまとめてコミットする件数
+_COMMIT_INTERVAL = 200
+
+
+class CacheEntry:
+    def __init__(self, xyz, path, size, etag, last_modified, fetched_at):
+        self.xyz = xyz
+        self.path = path
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+
+class TileCache:
+    """サイズ上限付き・LRU 削除・有効期限付きのタイルキャッシュ"""
+
+    # キャッシュ管理情報のテーブル名
+    info_table = "tiles"
+
+    def __init__(self, cache_dir, max_bytes=None, ttl=None, clock=time.time):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.db = sqlite3.connect(self._database_path(), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self._create_schema()
+        self.db.commit()
+
+    def _database_path(self):
+        return os.path.join(self.cache_dir, INDEX_FILENAME)
+
+    def _create_schema(self):
+        self.db.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.info_table} (
+                z INTEGER NOT NULL,
+                x INTEGER NOT NULL,
+                y INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (z, x, y)
+            )
+            """
+        )
+        self.db.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.info_table}_accessed_at "
+            f"ON {self.info_table} (accessed_at)"
+        )
+
+    def tile_path(self, xyz):
+        """タイルファイルのパス。ファイルとして保存しない場合は None"""
+        x, y, z = xyz
+        return os.path.join(self.cache_dir, str(z), str(x), f"{y}.pbf")
+
+    def read(self, xyz):
+        with open(self.tile_path(xyz), mode="rb") as f:
+            return f.read()
+
+    def _commit_later(self):
+        self._pending += 1
+        if self._pending >= _COMMIT_INTERVAL:
+            self.db.commit()
+            self._pending = 0
+
+    def _select_entry(self, xyz):
+        x, y, z = xyz
+        return self.db.execute(
+            "SELECT size, etag, last_modified, fetched_at "
+            f"FROM {self.info_table} WHERE z = ? AND x = ? AND y = ?",
+            (z, x, y),
+        ).fetchone()
+
+    def _delete_entries(self, zxy_list):
+        self.db.executemany(
+            f"DELETE FROM {self.info_table} WHERE z = ? AND x = ? AND y = ?",
+            zxy_list,
+        )
+
+    def lookup(self, xyz):
+        """キャッシュ済みのタイルを返す。無い場合は None"""
+        x, y, z = xyz
+        path = self.tile_path(xyz)
+        with self._lock:
+            row = self._select_entry(xyz)
+
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stat = None
+
+            if stat is None or stat.st_size == 0:
+                if row is not None:
+                    self._delete_entries([(z, x, y)])
+                    self._commit_later()
+                if stat is not None:
+                    os.remove(path)
+                return None
+
+            if row is None:
+                # 索引に無いファイル（以前のバージョンが置いたもの等）は取り込む
+                row = (stat.st_size, None, None, stat.st_mtime)
+                self.db.execute(
+                    f"INSERT INTO {self.info_table} "
+                    "VALUES (?, ?, ?, ?, NULL, NULL, ?, ?)",
+                    (z, x, y, stat.st_size, stat.st_mtime, self.clock()),
+                )
+                self._commit_later()
+
+        return CacheEntry(xyz, path, *row)
+
+    def is_fresh(self, entry):
+        if self.ttl is None:
+            return True
+        return self.clock() - entry.fetched_at < self.ttl
+
+    def conditional_headers(self, entry):
+        """再検証用の条件付きリクエストヘッダ"""
+        headers = {}
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def _write_data(self, xyz, data):
+        path = self.tile_path(xyz)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # 書き込み途中のファイルを読まないよう一時ファイルから置き換える
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, mode="wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _delete_data(self, zxy_list):
+        for z, x, y in zxy_list:
+            try:
+                os.remove(self.tile_path([x, y, z]))
+            except OSError:
+                pass
+
+    def store(self, xyz, data, headers=None):
+        """ダウンロードしたタイルを保存し、タイルのパスを返す"""
+        headers = _lower_keys(headers)
+        x, y, z = xyz
+
+        now = self.clock()
+        with self._lock:
+            self._write_data(xyz, data)
+            self.db.execute(
+                f"INSERT OR REPLACE INTO {self.info_table} "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    z,
+                    x,
+                    y,
+                    len(data),
+                    headers.get("etag"),
+                    headers.get("last-modified"),
+                    now,
+                    now,
+                ),
+            )
+            self._commit_later()
+        return self.tile_path(xyz)
+
+    def revalidated(self, xyz, headers=None):
+        """304 Not Modified を受けたタイルの有効期限を延長する"""
+        headers = _lower_keys(headers)
+        x, y, z = xyz
+        now = self.clock()
+        with self._lock:
+            self.db.execute(
+                f"UPDATE {self.info_table} SET fetched_at = ?, accessed_at = ?, "
+                "etag = COALESCE(?, etag), "
+                "last_modified = COALESCE(?, last_modified) "
+                "WHERE z = ? AND x = ? AND y = ?",
+                (
+                    now,
+                    now,
+                    headers.get("etag"),
+                    headers.get("last-modified"),
+                    z,
+                    x,
+                    y,
+                ),
+            )
+            self._commit_later()
+
+    def remove(self, xyz):
+        """タイルを削除する（上流で削除され 404 になったタイル）"""
+        x, y, z = xyz
+        with self._lock:
+            self._delete_data([(z, x, y)])
+            self._delete_entries([(z, x, y)])
+            self.db.commit()
+            self._pending = 0
+
+    def touch(self, tileindex):
+        """タイルの参照時刻を更新する（LRU 用）"""
+        now = self.clock()
+        with self._lock:
+            self.db.executemany(
+                f"UPDATE {self.info_table} SET accessed_at = ? "
+                "WHERE z = ? AND x = ? AND y = ?",
+                [(now, z, x, y) for x, y, z in tileindex],
+            )
+            self.db.commit()
+            self._pending = 0
+
+    def total_bytes(self):
+        with self._lock:
+            return self.db.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM {self.info_table}"
+            ).fetchone()[0]
+
+    def evict(self, protect=()):
+        """上限を超えた分を protect 以外から参照の古い順に削除し、削除したタイル数を返す"""
+        if self.max_bytes is None:
+            return 0
+
+        excess = self.total_bytes() - self.max_bytes
+        if excess <= 0:
+            return 0
+
+        protected = {(z, x, y) for x, y, z in protect}
+        removed = []
+        with self._lock:
+            rows = self.db.execute(
+                f"SELECT z, x, y, size FROM {self.info_table} ORDER BY accessed_at ASC"
+            ).fetchall()
+            for z, x, y, size in rows:
+                if excess <= 0:
+                    break
+                if (z, x, y) in protected:
+                    continue
+                removed.append((z, x, y))
+                excess -= size
+
+            self._delete_data(removed)
+            self._delete_entries(removed)
+            self.db.commit()
+            self._pending = 0
+        return len(removed)
+
+    def close(self):
+        with self._lock:
+            self.db.commit()
+            self.db.close()
+
+
+class MBTilesTileCache(TileCache):
+    """タイルを1つの MBTiles ファイルに保存するタイルキャッシュ
+
+    tiles テーブルは仕様どおり TMS の行番号で持ち、GDAL の MBTiles ドライバで開ける。
+    """
+
+    info_table = "tile_cache"
+
+    def __init__(
+        self,
+        cache_dir,
+        max_bytes=None,
+        ttl=None,
+        clock=time.time,
+        vector_layers=(),
+        minzoom=0,
+        maxzoom=16,
+    ):
+        # metadata の json に記載するレイヤ名（GDAL が読むために必要）
+        self.vector_layers = list(vector_layers)
+        self.minzoom = minzoom
+        self.maxzoom = maxzoom
+        super().__init__(cache_dir, max_bytes, ttl, clock)
+
+    def _database_path(self):
+        return os.path.join(self.cache_dir, MBTILES_FILENAME)
+
+    def _create_schema(self):
+        super()._create_schema()
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)"
+        )
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tiles (
+                zoom_level INTEGER NOT NULL,
+                tile_column INTEGER NOT NULL,
+                tile_row INTEGER NOT NULL,
+                tile_data BLOB
+            )
+            """
+        )
+        self.db.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS tile_index "
+            "ON tiles (zoom_level, tile_column, tile_row)"
+        )
+        metadata = {
+            "name": "gsi-vt-downloader cache",
+            "format": "pbf",
+            "type": "overlay",
+            "bounds": "-180.0,-85.0511,180.0,85.0511",
+            "minzoom": str(self.minzoom),
+            "maxzoom": str(self.maxzoom),
+            "json": json.dumps(
+                {
+                    "vector_layers": [
+                        {"id": layer_id, "fields": {}}
+                        for layer_id in self.vector_layers
+                    ]
+                }
+            ),
+        }
+        self.db.executemany(
+            "INSERT OR REPLACE INTO metadata VALUES (?, ?)", metadata.items()
+        )
+
+    def tile_path(self, xyz):
+        return None
+
+    def _tile_row(self, y, z):
+        return (1 << z) - 1 - y
+
+    def read(self, xyz):
+        x, y, z = xyz
+        with self._lock:
+            row = self.db.execute(
+                "SELECT tile_data FROM tiles "
+                "WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (z, x, self._tile_row(y, z)),
+            ).fetchone()
+        return None if row is None else bytes(row[0])
+
+    def lookup(self, xyz):
+        with self._lock:
+            row = self._select_entry(xyz)
+        if row is None or row[0] == 0:
+            return None
+        return CacheEntry(xyz, None, *row)
+
+    def _write_data(self, xyz, data):
+        x, y, z = xyz
+        self.db.execute(
+            "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)",
+            (z, x, self._tile_row(y, z), sqlite3.Binary(data)),
+        )
+
+    def _delete_data(self, zxy_list):
+        self.db.executemany(
+            "DELETE FROM tiles "
+            "WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            [(z, x, self._tile_row(y, z)) for z, x, y in zxy_list],
+        )
+
+
+def _lower_keys(headers):
+    return {k.lower(): v for k, v in (headers or {}).items()}
@@ -0,0 +1,124 @@
+"""タイルの取得とキャッシュ（QGIS の無い環境からコマンドラインでも使う）"""
+
+from .. import settings
+from .tile_cache import MBTilesTileCache, TileCache
+from .tile_fetcher import TileFetcher
+
+
+def create_tile_cache():
+    """settings.TILE_CACHE_BACKEND に応じたタイルキャッシュを作る"""
+    if settings.TILE_CACHE_BACKEND == "mbtiles":
+        return MBTilesTileCache(
+            settings.TILE_CACHE_DIR,
+            max_bytes=settings.TILE_CACHE_MAX_BYTES,
+            ttl=settings.TILE_CACHE_TTL,
+            vector_layers=settings.SOURCE_LAYERS.keys(),
+            minzoom=settings.DEFAULT_MIN_ZOOM,
+            maxzoom=settings.DEFAULT_MAX_ZOOM,
+        )
+    return TileCache(
+        settings.TILE_CACHE_DIR,
+        max_bytes=settings.TILE_CACHE_MAX_BYTES,
+        ttl=settings.TILE_CACHE_TTL,
+    )
+
+
+def create_tile_fetcher():
+    """settings のダウンロード設定で TileFetcher を作る"""
+    return TileFetcher(
+        settings.GIS_VECTOR_TILE_URL,
+        max_workers=settings.DOWNLOAD_WORKERS,
+        timeout=settings.GIS_DOWNLOAD_TIMEOUT,
+        max_retries=settings.DOWNLOAD_MAX_RETRIES,
+        backoff=settings.DOWNLOAD_BACKOFF,
+        rate_limit=settings.DOWNLOAD_RATE_LIMIT,
+    )
+
+
+def fetch_tiles(
+    tileindex, cache, feedback, fetcher=None, revalidate=False, metrics=None
+):
+    """キャッシュに無いタイルをダウンロードし、期限切れのタイルは再検証する
+
+    ダウンロードに失敗し、キャッシュにも無いタイルの set を返す（404 のタイルは含めない）。
+    revalidate=True の場合は期限内のタイルも再検証する（差分更新用）。
+    """
+    total_tiles = len(tileindex)
+    missing = []
+    stale = {}
+    for xyz in tileindex:
+        entry = cache.lookup(xyz)
+        if entry is None:
+            missing.append(xyz)
+        elif revalidate or not cache.is_fresh(entry):
+            stale[tuple(xyz)] = cache.conditional_headers(entry)
+
+    done = total_tiles - len(missing) - len(stale)
+    count = metrics.add if metrics is not None else lambda name, value=1: None
+    count("cache_hits", done)
+    count("cache_misses", len(missing))
+    count("cache_revalidations", len(stale))
+    feedback.count("cached", done)
+    feedback.pushDebugInfo(
+        f"{done} tiles found in cache, {len(stale)} tiles to revalidate, "
+        f"{len(missing)} tiles to download"
+    )
+    feedback.setProgress(int(done * 100 / total_tiles))
+    failed = set()
+    if not missing and not stale:
+        return failed
+
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = create_tile_fetcher()
+    requests = [list(xyz) for xyz in stale] + missing
+    try:
+        for result in fetcher.fetch(
+            requests, feedback.isCanceled, lambda xyz: stale.get(tuple(xyz))
+        ):
+            done += 1
+            feedback.setProgress(int(done * 100 / total_tiles))
+
+            x, y, z = result.xyz
+            if result.error is not None or result.status not in (200, 304, 404):
+                count("fetch_errors")
+            if result.status == 304:
+                count("tiles_not_modified")
+                cache.revalidated(result.xyz, result.headers)
+                feedback.count("not modified")
+                feedback.pushDebugInfo(f"Tile not modified (304): {x}/{y}/{z}")
+            elif result.error is not None:
+                feedback.count("download errors")
+                feedback.pushDebugInfo(
+                    f"Download error for tile {x}/{y}/{z}: {result.error}"
+                )
+                if tuple(result.xyz) not in stale:
+                    failed.add(tuple(result.xyz))
+            elif result.status == 404:
+                count("tiles_not_found")
+                if tuple(result.xyz) in stale:
+                    # 上流で削除されたタイルは古い内容を使わず、存在しないタイルとする
+                    cache.remove(result.xyz)
+                feedback.count("not found")
+                feedback.pushDebugInfo(f"Tile not found (404): {x}/{y}/{z}")
+            elif result.status != 200:
+                feedback.count("download errors")
+                feedback.pushDebugInfo(
+                    f"HTTP error {result.status} for tile {x}/{y}/{z}"
+                )
+                if tuple(result.xyz) not in stale:
+                    failed.add(tuple(result.xyz))
+            elif not result.data:
+                feedback.pushDebugInfo(f"Empty response for tile {x}/{y}/{z}")
+            else:
+                count("tiles_downloaded")
+                count("bytes_downloaded", len(result.data))
+                cache.store(result.xyz, result.data, result.headers)
+                feedback.count("downloaded")
+                feedback.pushDebugInfo(
+                    f"Downloaded {len(result.data)} bytes for tile {x}/{y}/{z}"
+                )
+    finally:
+        if own_fetcher:
+            fetcher.close()
+    return failed
@@ -0,0 +1,288 @@
+"""タイルの並列ダウンロード"""
+
+import collections
+import http.client
+import queue
+import random
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+USER_AGENT = "gsi-vt-downloader"
+
+# キャンセル確認の間隔（秒）
+_POLL_INTERVAL = 0.2
+
+# 一時的な失敗とみなして再試行する HTTP ステータス
+RETRYABLE_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+FetchResult = collections.namedtuple(
+    "FetchResult", ["xyz", "status", "data", "headers", "error"]
+)
+FetchResult.__doc__ = (
+    """1タイル分のダウンロード結果（通信エラーの場合は status が None）"""
+)
+
+
+class HTTPConnectionPool:
+    """1ホストへの keep-alive 接続を使い回すコネクションプール"""
+
+    def __init__(self, scheme, host, port=None, timeout=10, maxsize=8):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=maxsize)
+        self._proxy = self._find_proxy()
+
+    def _find_proxy(self):
+        """環境変数のプロキシ設定を urllib と同じ規則で解決する"""
+        proxy = urllib.request.getproxies().get(self.scheme)
+        if not proxy or urllib.request.proxy_bypass(self.host):
+            return None
+        return urllib.parse.urlsplit(proxy)
+
+    def _new_connection(self):
+        connection_class = (
+            http.client.HTTPSConnection
+            if self.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        if self._proxy is None:
+            return connection_class(self.host, self.port, timeout=self.timeout)
+
+        proxy_class = (
+            http.client.HTTPSConnection
+            if self._proxy.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        if self.scheme == "https":
+            # HTTPS は CONNECT でトンネルを張る
+            connection = connection_class(
+                self._proxy.hostname, self._proxy.port, timeout=self.timeout
+            )
+            connection.set_tunnel(self.host, self.port)
+            return connection
+        return proxy_class(self._proxy.hostname, self._proxy.port, timeout=self.timeout)
+
+    def _request_target(self, path):
+        if self._proxy is not None and self.scheme == "http":
+            netloc = self.host if self.port is None else f"{self.host}:{self.port}"
+            return f"http://{netloc}{path}"
+        return path
+
+    def request(self, path, headers=None):
+        """GET リクエストを送り (status, headers, body) を返す"""
+        request_headers = {"User-Agent": USER_AGENT, "Connection": "keep-alive"}
+        if headers:
+            request_headers.update(headers)
+
+        try:
+            connection = self._idle.get_nowait()
+            reused = True
+        except queue.Empty:
+            connection = self._new_connection()
+            reused = False
+
+        try:
+            connection.request(
+                "GET", self._request_target(path), headers=request_headers
+            )
+            response = connection.getresponse()
+            body = response.read()
+        except (http.client.HTTPException, ConnectionError):
+            connection.close()
+            if not reused:
+                raise
+            # サーバ側で閉じられた keep-alive 接続だった場合は張り直して1度だけ再送
+            connection = self._new_connection()
+            try:
+                connection.request(
+                    "GET", self._request_target(path), headers=request_headers
+                )
+                response = connection.getresponse()
+                body = response.read()
+            except BaseException:
+                connection.close()
+                raise
+        except BaseException:
+            connection.close()
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            try:
+                self._idle.put_nowait(connection)
+            except queue.Full:
+                connection.close()
+
+        return response.status, dict(response.getheaders()), body
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class RateLimiter:
+    """トークンバケットによるリクエスト数の制限（スレッドセーフ）"""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, self.rate))
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """トークンを1つ予約し、使えるようになるまでの待ち時間（秒）を返す"""
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        delay = self._reserve()
+        if delay > 0:
+            self.sleep(delay)
+
+
+class TileFetcher:
+    """タイル URL テンプレートに対して並列数を制限してダウンロードする"""
+
+    def __init__(
+        self,
+        url_template,
+        max_workers=8,
+        timeout=10,
+        max_retries=0,
+        backoff=0.5,
+        max_backoff=30.0,
+        rate_limit=None,
+    ):
+        self.url_template = url_template
+        self.max_workers = max(1, int(max_workers))
+        self.timeout = timeout
+        self.max_retries = max(0, int(max_retries))
+        # 再試行までの待ち時間は backoff * 2**attempt（上限 max_backoff）以下の一様乱数
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # 再試行を含む全リクエストを1秒あたり rate_limit 回に抑える
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+        self._canceled = threading.Event()
+        # 再試行した回数の合計（計測用）
+        self.retries = 0
+        self._retries_lock = threading.Lock()
+
+        url = urllib.parse.urlsplit(url_template.format(z=0, x=0, y=0))
+        self.pool = HTTPConnectionPool(
+            url.scheme,
+            url.hostname,
+            url.port,
+            timeout=timeout,
+            maxsize=self.max_workers,
+        )
+
+    def tile_url(self, xyz):
+        x, y, z = xyz
+        return self.url_template.format(z=z, x=x, y=y)
+
+    def _request(self, xyz, path, headers):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        try:
+            status, response_headers, body = self.pool.request(path, headers)
+        except Exception as e:
+            return FetchResult(xyz, None, None, {}, str(e))
+
+        data = body if status == 200 else None
+        return FetchResult(xyz, status, data, response_headers, None)
+
+    def _retry_delay(self, attempt, result):
+        """attempt 回目の再試行までの待ち時間（秒）"""
+        retry_after = _retry_after(result.headers)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    def fetch_one(self, xyz, headers=None):
+        """1タイルをダウンロードする。一時的な失敗は再試行し、最後の結果を返す"""
+        url = urllib.parse.urlsplit(self.tile_url(xyz))
+        path = url.path + (f"?{url.query}" if url.query else "")
+
+        attempt = 0
+        while True:
+            result = self._request(xyz, path, headers)
+            retryable = result.error is not None or result.status in RETRYABLE_STATUSES
+            if not retryable or attempt >= self.max_retries:
+                return result
+            # キャンセルされた場合は待たずに諦める
+            if self._canceled.wait(self._retry_delay(attempt, result)):
+                return result
+            attempt += 1
+            with self._retries_lock:
+                self.retries += 1
+
+    def fetch(self, tileindex, is_canceled=None, headers_for=None):
+        """タイルを並列にダウンロードし、完了した順に FetchResult を返すジェネレータ"""
+        tiles = iter(tileindex)
+        pending = set()
+        self._canceled.clear()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            exhausted = False
+            while True:
+                # 投入するタスクは max_workers の2倍までに抑え、キャンセルで破棄する量を減らす
+                while not exhausted and len(pending) < self.max_workers * 2:
+                    xyz = next(tiles, None)
+                    if xyz is None:
+                        exhausted = True
+                        break
+                    headers = headers_for(xyz) if headers_for is not None else None
+                    pending.add(executor.submit(self.fetch_one, xyz, headers))
+
+                if not pending:
+                    break
+
+                done, pending = wait(
+                    pending, timeout=_POLL_INTERVAL, return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    yield future.result()
+
+                if is_canceled is not None and is_canceled():
+                    break
+        finally:
+            if pending:
+                # 再試行の待機中のタスクも打ち切る
+                self._canceled.set()
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def close(self):
+        self.pool.close()
+
+
+def _retry_after(headers):
+    """Retry-After ヘッダの秒数。無い場合や日時形式の場合は None"""
+    for key, value in headers.items():
+        if key.lower() == "retry-after":
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                return None
+    return None
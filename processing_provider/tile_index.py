@@ -0,0 +1,325 @@
+"""タイルインデックスの操作（NumPy があれば配列でまとめて計算する）"""
+
+import bisect
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Web メルカトル（EPSG:3857）の原点から端までの距離
+ORIGIN_SHIFT = 20037508.342789244
+
+# TileSet のキーのビット配置: z (6 bit) | x (29 bit) | y (29 bit)。
+# キーの大小は (z, x, y) の辞書順と一致する
+_XY_BITS = 29
+_XY_MASK = (1 << _XY_BITS) - 1
+
+
+def split_into_blocks(tileindex, block_size):
+    """タイルを block_size x block_size タイルの空間ブロックに分ける（北西から行ごと）"""
+    block_size = max(1, int(block_size))
+    blocks = {}
+    for xyz in tileindex:
+        x, y, _ = xyz
+        blocks.setdefault((y // block_size, x // block_size), []).append(xyz)
+    return [blocks[key] for key in sorted(blocks)]
+
+
+def parent_tile(xyz):
+    """1つ上のズームレベルで xyz を含むタイル"""
+    x, y, z = xyz
+    return (x >> 1, y >> 1, z - 1)
+
+
+def tile_size(zoom_level):
+    """タイルの一辺の長さ（EPSG:3857 のメートル）"""
+    return 2 * ORIGIN_SHIFT / (1 << zoom_level)
+
+
+def tile_bounds(xyz):
+    """タイルの範囲 (xmin, ymin, xmax, ymax)（EPSG:3857）"""
+    x, y, z = xyz
+    size = tile_size(z)
+    xmin = -ORIGIN_SHIFT + x * size
+    ymax = ORIGIN_SHIFT - y * size
+    return (xmin, ymax - size, xmin + size, ymax)
+
+
+def lonlat_to_tile_xy(lon, lat, zoom_level):
+    """緯度経度からタイル座標（小数）を計算"""
+    lat_rad = math.radians(lat)
+    n = 2.0**zoom_level
+
+    tile_x = (lon + 180.0) / 360.0 * n
+    tile_y = (
+        (1.0 - math.log(math.tan(lat_rad) + (1 / math.cos(lat_rad))) / math.pi)
+        / 2.0
+        * n
+    )
+
+    return tile_x, tile_y
+
+
+def _math(*values):
+    """values に NumPy の配列があれば numpy、無ければ math"""
+    if np is not None and any(isinstance(v, np.ndarray) for v in values):
+        return np
+    return math
+
+
+def lonlat_to_webmercator(lon, lat):
+    """緯度経度を EPSG:3857 の座標にする（NumPy の配列も可）"""
+    m = _math(lon, lat)
+    x = lon * ORIGIN_SHIFT / 180.0
+    y = m.log(m.tan((90.0 + lat) * math.pi / 360.0)) * ORIGIN_SHIFT / math.pi
+    return x, y
+
+
+def webmercator_to_lonlat(x, y):
+    """EPSG:3857 の座標を緯度経度にする（NumPy の配列も可）"""
+    m = _math(x, y)
+    lon = x * 180.0 / ORIGIN_SHIFT
+    lat = m.atan(m.exp(y * math.pi / ORIGIN_SHIFT)) * 360.0 / math.pi - 90.0
+    return lon, lat
+
+
+def webmercator_to_tile_xy(x, y, zoom_level):
+    """EPSG:3857 の座標をタイル座標（小数）にする（NumPy の配列も可）"""
+    size = tile_size(zoom_level)
+    return (x + ORIGIN_SHIFT) / size, (ORIGIN_SHIFT - y) / size
+
+
+def tile_xy_to_webmercator(tile_x, tile_y, zoom_level):
+    """タイル座標（小数）を EPSG:3857 の座標にする（NumPy の配列も可）"""
+    size = tile_size(zoom_level)
+    return tile_x * size - ORIGIN_SHIFT, ORIGIN_SHIFT - tile_y * size
+
+
+def _tile_range(start, end, zoom_level):
+    """タイル座標（小数）の区間に掛かるタイルの番号の範囲（世界の範囲内に限る）"""
+    limit = 1 << zoom_level
+    return range(max(0, math.floor(start)), min(limit - 1, math.floor(end)) + 1)
+
+
+def bbox_tile_cover(leftbottom_lonlat, righttop_lonlat, zoom_level):
+    """緯度経度の矩形とズームレベルをカバーするタイルインデックスを作成"""
+    return TileSet.from_bbox(leftbottom_lonlat, righttop_lonlat, zoom_level).tiles()
+
+
+def pack_tile(xyz):
+    """タイル座標を TileSet のキー（整数）にする"""
+    x, y, z = xyz
+    return (z << (2 * _XY_BITS)) | (x << _XY_BITS) | y
+
+
+def unpack_tile(key):
+    """TileSet のキーをタイル座標 [x, y, z] に戻す"""
+    return [(key >> _XY_BITS) & _XY_MASK, key & _XY_MASK, key >> (2 * _XY_BITS)]
+
+
+class TileSet:
+    """タイルの集合。pack_tile() のキーのソート済みの配列で持つ
+
+    数十万タイルでも Python のオブジェクトを作らずに和・差・積を計算できる。
+    """
+
+    def __init__(self, keys=()):
+        if np is not None:
+            self.keys = np.unique(np.asarray(keys, dtype=np.int64))
+        else:
+            self.keys = sorted(set(keys))
+        self._bounds = None
+
+    @classmethod
+    def _from_sorted(cls, keys):
+        tile_set = cls.__new__(cls)
+        tile_set.keys = keys
+        tile_set._bounds = None
+        return tile_set
+
+    @classmethod
+    def from_tiles(cls, tileindex):
+        """[x, y, z] の列から作る"""
+        if np is None:
+            return cls(pack_tile(xyz) for xyz in tileindex)
+        tiles = np.asarray(list(tileindex), dtype=np.int64).reshape(-1, 3)
+        return cls(
+            (tiles[:, 2] << (2 * _XY_BITS)) | (tiles[:, 0] << _XY_BITS) | tiles[:, 1]
+        )
+
+    @classmethod
+    def from_bbox(cls, leftbottom_lonlat, righttop_lonlat, zoom_level):
+        """緯度経度の矩形に掛かるタイルから作る"""
+        lon_min, lat_min = leftbottom_lonlat
+        lon_max, lat_max = righttop_lonlat
+        x_start, y_start = lonlat_to_tile_xy(lon_min, lat_max, zoom_level)
+        x_end, y_end = lonlat_to_tile_xy(lon_max, lat_min, zoom_level)
+        xs = _tile_range(x_start, x_end, zoom_level)
+        ys = _tile_range(y_start, y_end, zoom_level)
+
+        if np is None:
+            return cls._from_sorted(
+                [pack_tile((x, y, zoom_level)) for x in xs for y in ys]
+            )
+        # x ごとに y が並ぶので、キーは作った時点でソート済み
+        x = np.arange(xs.start, xs.stop, dtype=np.int64)
+        y = np.arange(ys.start, ys.stop, dtype=np.int64)
+        keys = (
+            (zoom_level << (2 * _XY_BITS)) | (x[:, None] << _XY_BITS) | y[None, :]
+        ).ravel()
+        return cls._from_sorted(keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        return iter(self.tiles())
+
+    def __contains__(self, xyz):
+        key = pack_tile(xyz)
+        if np is None:
+            i = bisect.bisect_left(self.keys, key)
+        else:
+            i = int(np.searchsorted(self.keys, key))
+        return i < len(self.keys) and self.keys[i] == key
+
+    def __eq__(self, other):
+        if not isinstance(other, TileSet):
+            return NotImplemented
+        return list(self.keys) == list(other.keys)
+
+    def union(self, other):
+        if np is None:
+            return TileSet(set(self.keys) | set(other.keys))
+        return TileSet._from_sorted(np.union1d(self.keys, other.keys))
+
+    def difference(self, other):
+        if np is None:
+            return TileSet._from_sorted(sorted(set(self.keys) - set(other.keys)))
+        return TileSet._from_sorted(
+            np.setdiff1d(self.keys, other.keys, assume_unique=True)
+        )
+
+    def intersection(self, other):
+        if np is None:
+            return TileSet._from_sorted(sorted(set(self.keys) & set(other.keys)))
+        return TileSet._from_sorted(
+            np.intersect1d(self.keys, other.keys, assume_unique=True)
+        )
+
+    __or__ = union
+    __sub__ = difference
+    __and__ = intersection
+
+    def xyz(self):
+        """タイル座標の x・y・z の配列（NumPy が無い場合はリスト）"""
+        if np is None:
+            tiles = [unpack_tile(key) for key in self.keys]
+            return tuple([tile[i] for tile in tiles] for i in range(3))
+        return (
+            (self.keys >> _XY_BITS) & _XY_MASK,
+            self.keys & _XY_MASK,
+            self.keys >> (2 * _XY_BITS),
+        )
+
+    def tiles(self):
+        """[x, y, z] のリスト"""
+        if np is None:
+            return [unpack_tile(key) for key in self.keys]
+        return np.stack(self.xyz(), axis=1).tolist()
+
+    def bounds(self):
+        """各タイルの範囲 (xmin, ymin, xmax, ymax)（EPSG:3857）。1度だけ計算する"""
+        if self._bounds is None:
+            if np is None:
+                self._bounds = [tile_bounds(xyz) for xyz in self.tiles()]
+            else:
+                x, y, z = self.xyz()
+                size = 2 * ORIGIN_SHIFT / (np.int64(1) << z)
+                xmin = x * size - ORIGIN_SHIFT
+                ymax = ORIGIN_SHIFT - y * size
+                self._bounds = np.stack([xmin, ymax - size, xmin + size, ymax], axis=1)
+        return self._bounds
+
+
+def _to_tile_space(point, zoom_level):
+    """EPSG:3857 の座標をタイル座標（小数）にする"""
+    return webmercator_to_tile_xy(point[0], point[1], zoom_level)
+
+
+def _edge_tiles(p, q, tiles, limit):
+    """線分 p-q が通る全タイルを tiles に加える（グリッド走査）"""
+    x0, y0 = p
+    x1, y1 = q
+    tx, ty = math.floor(x0), math.floor(y0)
+    end_x, end_y = math.floor(x1), math.floor(y1)
+    dx, dy = x1 - x0, y1 - y0
+    step_x = 1 if dx > 0 else -1
+    step_y = 1 if dy > 0 else -1
+    # 次の縦・横のグリッド線に達するまでの線分上の位置（0-1）とその間隔
+    if dx != 0:
+        next_x = ((tx + (step_x > 0)) - x0) / dx
+        delta_x = abs(1 / dx)
+    else:
+        next_x = delta_x = math.inf
+    if dy != 0:
+        next_y = ((ty + (step_y > 0)) - y0) / dy
+        delta_y = abs(1 / dy)
+    else:
+        next_y = delta_y = math.inf
+
+    while True:
+        if 0 <= tx < limit and 0 <= ty < limit:
+            tiles.add((tx, ty))
+        if (tx, ty) == (end_x, end_y) or min(next_x, next_y) > 1:
+            break
+        if next_x < next_y:
+            tx += step_x
+            next_x += delta_x
+        else:
+            ty += step_y
+            next_y += delta_y
+
+
+def polygon_tile_cover(polygons, zoom_level):
+    """ポリゴン（EPSG:3857 のリングのリスト）と交わるタイルを過不足なく求める
+
+    境界が通らないタイルは全体が内側か外側にあるので、中心で判定できる。
+    """
+    limit = 1 << zoom_level
+    rings = []
+    for rings_of_polygon in polygons:
+        for ring in rings_of_polygon:
+            points = [_to_tile_space(point, zoom_level) for point in ring]
+            if len(points) >= 2:
+                rings.append(points)
+
+    tiles = set()
+    edges = []
+    for points in rings:
+        for p, q in zip(points, points[1:] + points[:1]):
+            _edge_tiles(p, q, tiles, limit)
+            if p[1] != q[1]:
+                edges.append((p, q))
+    if not edges:
+        return []
+
+    y_min = max(0, math.floor(min(min(p[1], q[1]) for p, q in edges)))
+    y_max = min(limit - 1, math.floor(max(max(p[1], q[1]) for p, q in edges)))
+    for ty in range(y_min, y_max + 1):
+        center = ty + 0.5
+        crossings = sorted(
+            p[0] + (center - p[1]) * (q[0] - p[0]) / (q[1] - p[1])
+            for p, q in edges
+            if min(p[1], q[1]) <= center < max(p[1], q[1])
+        )
+        # 偶奇規則で内側の区間を埋める（穴や複数のポリゴンにも対応する）
+        for start, end in zip(crossings[0::2], crossings[1::2]):
+            first = max(0, math.ceil(start - 0.5))
+            last = min(limit - 1, math.floor(end - 0.5))
+            for tx in range(first, last + 1):
+                tiles.add((tx, ty))
+
+    return [[x, y, zoom_level] for x, y in sorted(tiles)]
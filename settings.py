@@ -1,3 +1,5 @@
+import os
+
 GIS_VECTOR_TILE_URL = (
     "https://cyberjapandata.gsi.go.jp/xyz/experimental_bvmap/{z}/{x}/{y}.pbf"
 )
@@ -58,5 +60,66 @@ DOUBLE_FIELDS = ["arrngAgl", "alti", "depth"]
 DEFAULT_MIN_ZOOM = 4
 DEFAULT_MAX_ZOOM = 16
 
-# ダウンロード可能のタイル数
+# ダウンロード可能のタイル数（出力フォルダを指定せずメモリレイヤに出力する場合）
 TILES_LIMIT = 5000
+
+# 出力フォルダ指定時に1度に取得・変換・書き出しするブロックの一辺のタイル数
+TILE_BLOCK_SIZE = 16
+
+# タイルの同時ダウンロード数
+DOWNLOAD_WORKERS = 8
+# 国土地理院サーバへの1秒あたりの最大リクエスト数（再試行を含む）
+DOWNLOAD_RATE_LIMIT = 20
+# 通信エラー・タイムアウト・5xx 等の一時的な失敗を再試行する回数
+DOWNLOAD_MAX_RETRIES = 4
+# 再試行までの待ち時間の基準（秒）。再試行ごとに2倍にし、ランダムなジッタを掛ける
+DOWNLOAD_BACKOFF = 1.0
+
+# 取得・デコードを変換・書き出しより先に進めるブロック数（0 の場合は1ブロックずつ順に処理する）
+PIPELINE_DEPTH = 2
+
+# GeoPackageへ1トランザクションで書き込む地物数
+WRITE_BATCH_SIZE = 5000
+# GeoPackage へ書き込む間の SQLite の設定（GDAL の構成オプション）。
+# 地物の追加では同期を省き、ページとキャッシュを大きくして書き込みを速くする。
+# WAL は自動ではデータベースへ移さず、マニフェストのチェックポイントと出力を閉じるときに
+# 同期してから移す。OS が停止しても失われるのは最後のチェックポイント以降の地物だけで、
+# それらは再開時に書き直す
+GPKG_WRITE_OPTIONS = {
+    "OGR_SQLITE_SYNCHRONOUS": "OFF",
+    "OGR_SQLITE_JOURNAL": "WAL",  # QGIS が GeoPackage の編集に使うのと同じ
+    "OGR_SQLITE_CACHE": "256",  # MB
+    "OGR_SQLITE_PRAGMA": "page_size=65536,wal_autocheckpoint=0",
+}
+# GeoPackage の空間索引（R-tree）を作るか。作る場合も書き込みを終えてから作る
+GPKG_SPATIAL_INDEX = True
+# 書き込み後に属性索引を作るフィールド名の既定値（出力に無いフィールドは無視する）
+GPKG_INDEX_FIELDS = ["ftCode", "rvrCls"]
+
+# バッチ処理で同時に開く出力ファイルの上限。範囲をこの数の出力ごとのグループに分けて処理する
+BATCH_MAX_OPEN_SINKS = 64
+
+# 差分更新で地物の元のタイル（"z/x/y"）を記録するフィールド名
+TILE_ID_FIELD = "vt_tile"
+
+# ログの詳細度（環境変数 GSI_VT_LOG_LEVEL で変更可）。
+# "summary": タイルごとのメッセージは件数に集計して一定間隔で書き出す, "debug": すべて書き出す
+LOG_LEVEL = os.environ.get("GSI_VT_LOG_LEVEL") or "summary"
+# summary で集計したメッセージを書き出す最小間隔（秒）
+LOG_SUMMARY_INTERVAL = 5.0
+
+# タイルのデコード方法。"ogr": OGR の MVT ドライバ, "python": 内蔵デコーダ（NumPy があれば使う）
+MVT_DECODER = "ogr"
+# タイルをデコードするプロセス数（MVT_DECODER = "python" の場合）。0 の場合は処理のスレッドでデコードする
+DECODE_WORKERS = 0
+
+# タイルキャッシュの保存先（環境変数 GSI_VT_CACHE_DIR で変更可）
+TILE_CACHE_DIR = os.environ.get("GSI_VT_CACHE_DIR") or os.path.join(
+    os.path.expanduser("~"), ".cache", "gsi-vt-downloader"
+)
+# タイルキャッシュの保存形式。"files": {z}/{x}/{y}.pbf, "mbtiles": 1つの MBTiles ファイル
+TILE_CACHE_BACKEND = "files"
+# タイルキャッシュの上限サイズ（バイト）。超えた分は参照の古いタイルから削除する
+TILE_CACHE_MAX_BYTES = 2 * 1024**3
+# タイルの有効期限（秒）。過ぎたタイルは ETag/Last-Modified で再検証する
+TILE_CACHE_TTL = 7 * 24 * 60 * 60
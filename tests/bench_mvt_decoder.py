@@ -0,0 +1,119 @@
+"""MVT デコーダのマイクロベンチマーク
+
+合成したタイルを内蔵デコーダ（NumPy あり・なし）と OGR の MVT ドライバで
+デコードし、1秒あたりのタイル数と地物数を比べる。
+
+    python -m tests.bench_mvt_decoder [--tiles N] [--repeat N]
+"""
+
+import argparse
+import random
+import time
+from unittest import mock
+
+from processing_provider import mvt_decoder
+
+from .mvt_builder import LINESTRING, POINT, POLYGON, encode_tile
+
+try:
+    from osgeo import gdal
+except ImportError:
+    gdal = None
+
+
+def make_tile(rng):
+    """建物・道路・注記を含む z16 相当のタイルを作る"""
+    buildings = []
+    for _ in range(800):
+        x, y = rng.randrange(-50, 4100), rng.randrange(-50, 4100)
+        w, h = rng.randrange(10, 80), rng.randrange(10, 80)
+        ring = [(x, y), (x + w, y), (x + w, y + h), (x, y + h)]
+        buildings.append((POLYGON, [ring], {"ftCode": 3101, "lvOrder": 0}))
+
+    roads = []
+    for _ in range(150):
+        x, y = rng.randrange(0, 4096), rng.randrange(0, 4096)
+        path = [(x, y)]
+        for _ in range(40):
+            x += rng.randrange(-60, 61)
+            y += rng.randrange(-60, 61)
+            path.append((x, y))
+        roads.append((LINESTRING, [path], {"rdCtg": 2, "rnkWidth": 1.5}))
+
+    labels = [
+        (
+            POINT,
+            [[(rng.randrange(0, 4096), rng.randrange(0, 4096))]],
+            {"knj": f"地名{i}", "arrngAgl": 0.0},
+        )
+        for i in range(100)
+    ]
+    return encode_tile({"building": buildings, "road": roads, "label": labels})
+
+
+def bench_builtin(tiles):
+    features = 0
+    for xyz, data in tiles:
+        for layer in mvt_decoder.decode_tile(data, xyz).values():
+            features += len(layer.features)
+    return features
+
+
+def bench_ogr(tiles):
+    features = 0
+    for xyz, data in tiles:
+        x, y, z = xyz
+        path = f"/vsimem/bench/{z}/{x}/{y}.pbf"
+        gdal.FileFromMemBuffer(path, data)
+        ds = gdal.OpenEx(
+            path,
+            gdal.OF_VECTOR,
+            allowed_drivers=["MVT"],
+            open_options=[f"X={x}", f"Y={y}", f"Z={z}"],
+        )
+        for i in range(ds.GetLayerCount()):
+            layer = ds.GetLayer(i)
+            for feature in layer:
+                feature.GetGeometryRef().ExportToIsoWkb()
+                feature.items()
+                features += 1
+        ds = None
+        gdal.Unlink(path)
+    return features
+
+
+def run(name, func, tiles, repeat):
+    best = None
+    features = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        features = func(tiles)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(
+        f"{name:<16} {len(tiles) / best:10.1f} tiles/s "
+        f"{features / best:12.0f} features/s ({features} features, {best:.3f}s)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tiles", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    tiles = [([58210 + i, 25803, 16], make_tile(rng)) for i in range(args.tiles)]
+
+    if mvt_decoder.np is not None:
+        run("builtin (numpy)", bench_builtin, tiles, args.repeat)
+    with mock.patch.object(mvt_decoder, "np", None):
+        run("builtin (python)", bench_builtin, tiles, args.repeat)
+    if gdal is not None:
+        run("ogr", bench_ogr, tiles, args.repeat)
+    else:
+        print("ogr              skipped (GDAL is not installed)")
+
+
+if __name__ == "__main__":
+    main()
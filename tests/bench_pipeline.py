@@ -0,0 +1,407 @@
+"""ダウンロードから書き出しまでのパイプラインのベンチマーク
+
+ローカルのタイルサーバ（tests/tile_server.py）に対して、レイヤ数・タイル数・
+キャッシュの状態（cold: 空, warm: 取得済み）の組み合わせごとにダウンロードを実行し、
+タイル/秒・地物/秒・最大メモリ使用量（RSS）・フェーズごとの時間を表示する。
+
+各シナリオは別プロセスで実行する（最大 RSS をシナリオごとに測るため）。
+QGIS があればアルゴリズム（gsi_vt_downloader）で GeoPackage まで書き出し、
+無ければ取得と内蔵デコーダでのデコードだけを測る。
+
+    python -m tests.bench_pipeline [--layers 1,10,20] [--tiles 100,1000,5000]
+        [--cache cold,warm] [--latency 0.02] [--error-rate 0.01]
+        [--fixtures DIR] [--save-baseline FILE] [--baseline FILE]
+
+--fixtures には記録したタイル（{z}/{x}/{y}.pbf。タイルキャッシュのフォルダ）を
+指定できる。省略した場合は全ソースレイヤを含むタイルを合成する。
+結果は基準値（既定は tests/bench_pipeline_baseline.json、--baseline で変更、
+"" で比較しない）とタイル/秒を比べ、--tolerance を超えて遅くなったシナリオが
+あれば終了コード 1 を返す。基準値は測定方法（QGIS で書き出しまで行ったか）が
+同じシナリオとだけ比べる。マシンを変えた場合は --save-baseline で取り直す。
+"""
+
+import argparse
+import importlib
+import io
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from .mvt_builder import LINESTRING, POINT, POLYGON, encode_tile
+from .tile_server import TileServer, fixture_tiles
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "bench_pipeline_baseline.json"
+)
+# settings の相対 import を解決するため、プラグインをパッケージとして読み込む
+PACKAGE = os.path.basename(ROOT)
+
+# ベンチマークの範囲の左上のタイル（z16、東京駅付近）
+ZOOM_LEVEL = 16
+ORIGIN_X, ORIGIN_Y = 58210, 25803
+
+GEOMETRY_TYPES = {"点": POINT, "線": LINESTRING, "面": POLYGON}
+
+
+def plugin_module(name):
+    if os.path.dirname(ROOT) not in sys.path:
+        sys.path.insert(0, os.path.dirname(ROOT))
+    return importlib.import_module(f"{PACKAGE}.{name}")
+
+
+def scenario_tiles(count):
+    """count 枚以上のタイルを含む正方形に近い範囲のタイル"""
+    width = math.ceil(math.sqrt(count))
+    height = math.ceil(count / width)
+    return [
+        [ORIGIN_X + i, ORIGIN_Y + j, ZOOM_LEVEL]
+        for j in range(height)
+        for i in range(width)
+    ]
+
+
+def make_tile(rng, source_layers, features_per_layer):
+    """全ソースレイヤの地物を含むタイルを合成する"""
+    layers = {}
+    for layer_key, layer_info in source_layers.items():
+        geom_type = GEOMETRY_TYPES[layer_info["datatype"]]
+        features = []
+        for i in range(features_per_layer):
+            x, y = rng.randrange(-50, 4100), rng.randrange(-50, 4100)
+            if geom_type == POINT:
+                paths = [[(x, y)]]
+            elif geom_type == LINESTRING:
+                path = [(x, y)]
+                for _ in range(20):
+                    x += rng.randrange(-60, 61)
+                    y += rng.randrange(-60, 61)
+                    path.append((x, y))
+                paths = [path]
+            else:
+                w, h = rng.randrange(10, 80), rng.randrange(10, 80)
+                paths = [[(x, y), (x + w, y), (x + w, y + h), (x, y + h)]]
+            features.append(
+                (geom_type, paths, {"ftCode": 1000 + i % 50, "name": f"{layer_key}{i}"})
+            )
+        layers[layer_key] = features
+    return encode_tile(layers)
+
+
+def synthetic_tiles(source_layers, features_per_layer, variants=16):
+    rng = random.Random(0)
+    tiles = [make_tile(rng, source_layers, features_per_layer) for _ in range(variants)]
+
+    def get(xyz):
+        x, y, _ = xyz
+        return tiles[(x * 31 + y) % len(tiles)]
+
+    return get
+
+
+class _QuietFeedback:
+    """メッセージを捨てる feedback（tile_download.fetch_tiles() 用）"""
+
+    def pushInfo(self, info):
+        pass
+
+    def pushDebugInfo(self, info):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+    def setProgress(self, progress):
+        pass
+
+    def isCanceled(self):
+        return False
+
+
+def run_fetch_decode(config, layer_keys, tileindex):
+    """QGIS の無い環境: キャッシュへの取得と内蔵デコーダでのデコードを測る"""
+    decode_pool = plugin_module("processing_provider.decode_pool")
+    mvt_decoder = plugin_module("processing_provider.mvt_decoder")
+    pipeline = plugin_module("processing_provider.pipeline")
+    run_metrics = plugin_module("processing_provider.run_metrics")
+    tile_download = plugin_module("processing_provider.tile_download")
+    tile_index = plugin_module("processing_provider.tile_index")
+    settings = plugin_module("settings")
+
+    metrics = run_metrics.RunMetrics()
+    feedback = _QuietFeedback()
+    cache = tile_download.create_tile_cache()
+    fetcher = tile_download.create_tile_fetcher()
+    pool = None
+    fetch_stage = None
+    if settings.DECODE_WORKERS > 0:
+        pool = decode_pool.DecodePool(settings.DECODE_WORKERS)
+    try:
+
+        def fetch_block(block):
+            with metrics.phase("fetch"):
+                tile_download.fetch_tiles(
+                    block, cache, feedback, fetcher, False, metrics
+                )
+            return block
+
+        blocks = tile_index.split_into_blocks(tileindex, settings.TILE_BLOCK_SIZE)
+        # アルゴリズムと同じく、取得は settings.PIPELINE_DEPTH ブロック先まで進める
+        fetch_stage = pipeline.Stage(blocks, fetch_block, settings.PIPELINE_DEPTH)
+        for block in fetch_stage:
+            tiles = [
+                (xyz, cache.read(xyz)) for xyz in block if cache.lookup(xyz) is not None
+            ]
+            with metrics.phase("decode"):
+                if pool is not None:
+                    decoded = [
+                        layers for _, layers, _ in pool.decode(tiles, layer_keys)
+                    ]
+                else:
+                    decoded = [
+                        mvt_decoder.decode_tile(data, xyz, layer_keys)
+                        for xyz, data in tiles
+                    ]
+            for layers in decoded:
+                metrics.add("tiles_processed")
+                metrics.add(
+                    "features_written",
+                    sum(len(layer.features) for layer in (layers or {}).values()),
+                )
+    finally:
+        if fetch_stage is not None:
+            fetch_stage.close()
+        metrics.add("retries", fetcher.retries)
+        fetcher.close()
+        if pool is not None:
+            pool.close()
+        cache.close()
+    return metrics.report(mode="fetch-decode")
+
+
+def run_algorithm(config, layer_keys, tileindex, settings):
+    """QGIS のある環境: アルゴリズムで GeoPackage まで書き出す"""
+    cli = plugin_module("processing_provider.cli")
+    progress_reporter = plugin_module("processing_provider.progress_reporter")
+    tile_index = plugin_module("processing_provider.tile_index")
+
+    xs = [xyz[0] for xyz in tileindex]
+    ys = [xyz[1] for xyz in tileindex]
+    xmin, ymin, _, _ = tile_index.tile_bounds([min(xs), max(ys), ZOOM_LEVEL])
+    _, _, xmax, ymax = tile_index.tile_bounds([max(xs), min(ys), ZOOM_LEVEL])
+    # 隣のタイルを含めないよう、範囲を少し内側にする
+    margin = 0.01
+    all_keys = list(settings.SOURCE_LAYERS.keys())
+    parameters = {
+        "INPUT_EXTENT": f"{xmin + margin},{xmax - margin},"
+        f"{ymin + margin},{ymax - margin} [EPSG:3857]",
+        "SOURCE_LAYER": [all_keys.index(key) for key in layer_keys],
+        "ZOOM_LEVEL": ZOOM_LEVEL,
+        "OUTPUT_FOLDER": config["output"],
+    }
+    stream = io.StringIO()
+    reporter = progress_reporter.ProgressReporter(stream, json_lines=True)
+    exit_code = cli.run_algorithm("gsi_vt_downloader", parameters, reporter)
+    for line in stream.getvalue().splitlines():
+        event = json.loads(line)
+        if event.pop("event") == "metrics":
+            return {**event, "mode": "algorithm", "exit_code": exit_code}
+    raise RuntimeError(f"the algorithm did not report metrics (exit {exit_code})")
+
+
+def run_scenario(config):
+    """子プロセスで1つのシナリオを実行し、結果を返す"""
+    settings = plugin_module("settings")
+    settings.GIS_VECTOR_TILE_URL = config["url"]
+    settings.TILE_CACHE_DIR = config["cache_dir"]
+    settings.TILE_CACHE_BACKEND = config["cache_backend"]
+    settings.MVT_DECODER = config["decoder"]
+    settings.DECODE_WORKERS = config["decode_workers"]
+    settings.PIPELINE_DEPTH = config["pipeline_depth"]
+    settings.LOG_LEVEL = "summary"
+    # ローカルのサーバなので速度は制限せず、再試行の待ち時間も短くする
+    settings.DOWNLOAD_RATE_LIMIT = None
+    settings.DOWNLOAD_BACKOFF = 0.05
+
+    layer_keys = list(settings.SOURCE_LAYERS.keys())[: config["layers"]]
+    tileindex = scenario_tiles(config["tiles"])
+
+    try:
+        importlib.import_module("qgis.core")
+        has_qgis = not config["no_qgis"]
+    except ImportError:
+        has_qgis = False
+    if has_qgis:
+        report = run_algorithm(config, layer_keys, tileindex, settings)
+    else:
+        report = run_fetch_decode(config, layer_keys, tileindex)
+    report["mode"] = "algorithm" if has_qgis else "fetch_decode"
+
+    if resource is not None:
+        # Linux は KiB、macOS はバイト
+        scale = 1 if sys.platform == "darwin" else 1024
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+        report["peak_rss_mb"] = round(peak / 1024**2, 1)
+    return report
+
+
+def scenario_name(layers, tiles, cache):
+    return f"layers={layers} tiles={tiles} cache={cache}"
+
+
+def print_result(name, report):
+    rates = report["rates"]
+    phases = ", ".join(f"{phase} {t:.2f}s" for phase, t in report["phases"].items())
+    peak = report.get("peak_rss_mb")
+    print(
+        f"{name:<36} {rates['tiles_per_second'] or 0:9.1f} tiles/s "
+        f"{rates['features_per_second'] or 0:11.0f} features/s "
+        f"{peak if peak is not None else '-':>7} MB  {report['elapsed']:.2f}s ({phases})"
+    )
+
+
+def compare(results, baseline, tolerance):
+    """tiles/s が基準値より tolerance を超えて下がったシナリオの名前を返す"""
+    regressions = []
+    print(f"\ncompared with the baseline (tolerance {tolerance:.0%}):")
+    for name, report in results.items():
+        if name not in baseline:
+            print(f"{name:<36} not in the baseline")
+            continue
+        if baseline[name].get("mode") != report.get("mode"):
+            print(f"{name:<36} measured differently ({report.get('mode')})")
+            continue
+        current = report["rates"]["tiles_per_second"] or 0
+        reference = baseline[name]["rates"]["tiles_per_second"] or 0
+        if not reference:
+            continue
+        ratio = current / reference
+        regressed = ratio < 1 - tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<36} {ratio:6.2f}x" + ("  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def _numbers(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--layers", type=_numbers, default=[1, 10, 20])
+    parser.add_argument("--tiles", type=_numbers, default=[100, 1000, 5000])
+    parser.add_argument("--cache", default="cold,warm", help="cold, warm or cold,warm")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="0-1")
+    parser.add_argument("--features-per-layer", type=int, default=30)
+    parser.add_argument("--fixtures", help="folder of recorded {z}/{x}/{y}.pbf tiles")
+    parser.add_argument("--decoder", choices=("ogr", "python"), default="python")
+    parser.add_argument(
+        "--decode-workers", type=int, default=0, help="decode in worker processes"
+    )
+    parser.add_argument(
+        "--pipeline-depth",
+        type=int,
+        default=2,
+        help="blocks fetched ahead of decoding (0: sequential)",
+    )
+    parser.add_argument(
+        "--cache-backend", choices=("files", "mbtiles"), default="files"
+    )
+    parser.add_argument(
+        "--no-qgis", action="store_true", help="measure fetch and decode only"
+    )
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--save-baseline", help="write the results as the baseline")
+    parser.add_argument(
+        "--baseline",
+        default=DEFAULT_BASELINE,
+        help='compare with a saved baseline ("" to skip)',
+    )
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        print(json.dumps(run_scenario(json.loads(args.scenario))))
+        return 0
+
+    settings = plugin_module("settings")
+    if args.fixtures:
+        tiles = fixture_tiles(args.fixtures)
+    else:
+        tiles = synthetic_tiles(settings.SOURCE_LAYERS, args.features_per_layer)
+    caches = [cache for cache in args.cache.split(",") if cache]
+
+    results = {}
+    with TileServer(tiles, args.latency, args.error_rate) as server:
+        for layers in args.layers:
+            layers = min(layers, len(settings.SOURCE_LAYERS))
+            for tile_count in args.tiles:
+                workdir = tempfile.mkdtemp(prefix="vt-bench-")
+                try:
+                    for cache in ("cold", "warm"):
+                        if cache == "warm" and "warm" not in caches:
+                            break
+                        config = {
+                            "url": server.url_template,
+                            "cache_dir": os.path.join(workdir, "cache"),
+                            "cache_backend": args.cache_backend,
+                            "decoder": args.decoder,
+                            "decode_workers": args.decode_workers,
+                            "pipeline_depth": args.pipeline_depth,
+                            "output": os.path.join(workdir, f"out-{cache}"),
+                            "layers": layers,
+                            "tiles": tile_count,
+                            "no_qgis": args.no_qgis,
+                        }
+                        # warm は cold で取得したキャッシュをそのまま使う
+                        completed = subprocess.run(
+                            [
+                                sys.executable,
+                                "-m",
+                                "tests.bench_pipeline",
+                                "--scenario",
+                                json.dumps(config),
+                            ],
+                            cwd=ROOT,
+                            stdout=subprocess.PIPE,
+                            check=True,
+                            text=True,
+                        )
+                        if cache not in caches:
+                            continue
+                        name = scenario_name(layers, tile_count, cache)
+                        report = json.loads(completed.stdout.splitlines()[-1])
+                        results[name] = report
+                        print_result(name, report)
+                finally:
+                    shutil.rmtree(workdir, ignore_errors=True)
+        print(f"\n{server.requests} requests served")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, mode="w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
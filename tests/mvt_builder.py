@@ -0,0 +1,111 @@
+"""テスト・ベンチマーク用の MVT エンコーダ"""
+
+import struct
+
+POINT = 1
+LINESTRING = 2
+POLYGON = 3
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _field(number, wire_type, payload):
+    key = _varint((number << 3) | wire_type)
+    if wire_type == 2:
+        return key + _varint(len(payload)) + payload
+    return key + payload
+
+
+def _packed(values):
+    return b"".join(_varint(v) for v in values)
+
+
+def _command(command, count):
+    return (count << 3) | command
+
+
+def encode_geometry(geom_type, paths):
+    """パス（タイル座標の点のリスト）のリストをコマンド列にする"""
+    commands = []
+    x = y = 0
+
+    def move(px, py):
+        nonlocal x, y
+        commands.extend([_zigzag(px - x), _zigzag(py - y)])
+        x, y = px, py
+
+    if geom_type == POINT:
+        points = [point for path in paths for point in path]
+        commands.append(_command(1, len(points)))
+        for px, py in points:
+            move(px, py)
+        return commands
+
+    for path in paths:
+        commands.append(_command(1, 1))
+        move(*path[0])
+        commands.append(_command(2, len(path) - 1))
+        for px, py in path[1:]:
+            move(px, py)
+        if geom_type == POLYGON:
+            commands.append(_command(7, 1))
+    return commands
+
+
+def _encode_value(value):
+    if isinstance(value, bool):
+        return _field(7, 0, _varint(int(value)))
+    if isinstance(value, int):
+        return _field(4, 0, _varint(value & 0xFFFFFFFFFFFFFFFF))
+    if isinstance(value, float):
+        return _field(3, 1, struct.pack("<d", value))
+    return _field(1, 2, str(value).encode("utf-8"))
+
+
+def encode_layer(name, features, extent=4096):
+    """features: (geom_type, paths, properties) のリスト"""
+    keys = []
+    values = []
+    body = _field(15, 0, _varint(2)) + _field(1, 2, name.encode("utf-8"))
+    for feature_id, (geom_type, paths, properties) in enumerate(features, 1):
+        tags = []
+        for key, value in properties.items():
+            if key not in keys:
+                keys.append(key)
+            # True と 1 を区別するため型と組にして重複を除く
+            typed_value = (type(value), value)
+            if typed_value not in values:
+                values.append(typed_value)
+            tags.extend([keys.index(key), values.index(typed_value)])
+        feature = (
+            _field(1, 0, _varint(feature_id))
+            + _field(2, 2, _packed(tags))
+            + _field(3, 0, _varint(geom_type))
+            + _field(4, 2, _packed(encode_geometry(geom_type, paths)))
+        )
+        body += _field(2, 2, feature)
+    for key in keys:
+        body += _field(3, 2, key.encode("utf-8"))
+    for _, value in values:
+        body += _field(4, 2, _encode_value(value))
+    body += _field(5, 0, _varint(extent))
+    return _field(3, 2, body)
+
+
+def encode_tile(layers):
+    """layers: dict レイヤ名 -> features（encode_layer() を参照）"""
+    return b"".join(encode_layer(name, features) for name, features in layers.items())
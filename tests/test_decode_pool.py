@@ -0,0 +1,52 @@
+import unittest
+
+from processing_provider import mvt_decoder
+from processing_provider.decode_pool import DecodePool
+
+from .mvt_builder import LINESTRING, POINT, POLYGON, encode_tile
+
+
+def make_tile(i):
+    return encode_tile(
+        {
+            "building": [
+                (POLYGON, [[(i, 0), (i + 10, 0), (i + 10, 10), (i, 10)]], {"id": i})
+            ],
+            "road": [(LINESTRING, [[(0, i), (100, i)]], {"rdCtg": i})],
+            "label": [(POINT, [[(i, i)]], {"knj": f"地名{i}"})],
+        }
+    )
+
+
+class TestDecodePool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = DecodePool(2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    def test_same_as_decode_tile_in_order(self):
+        tiles = [([58210 + i, 25803, 16], make_tile(i)) for i in range(10)]
+
+        results = list(self.pool.decode(tiles, ["building", "road"]))
+
+        self.assertEqual([xyz for xyz, _, _ in results], [xyz for xyz, _ in tiles])
+        for (xyz, data), (_, layers, error) in zip(tiles, results):
+            self.assertIsNone(error)
+            self.assertEqual(
+                layers, mvt_decoder.decode_tile(data, xyz, ["building", "road"])
+            )
+
+    def test_error_is_returned(self):
+        results = list(self.pool.decode([([0, 0, 0], b"\x0a\xff")]))
+
+        self.assertEqual(len(results), 1)
+        _, layers, error = results[0]
+        self.assertIsNone(layers)
+        self.assertIsInstance(error, str)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import tempfile
+import unittest
+
+from processing_provider.job_manifest import JobManifest
+
+PARAMS = {"extent": [139.7, 35.6, 139.8, 35.7], "zoom_level": 16, "layers": ["road"]}
+
+
+class TestJobManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "job.jsonl")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_resume_from_last_checkpoint(self):
+        manifest = JobManifest(self.path, PARAMS)
+        self.assertFalse(manifest.resumed)
+        manifest.add([1, 2, 16])
+        manifest.checkpoint({"road": 10})
+        # チェックポイント前に中断したタイルは再開時に処理し直す
+        manifest.add([1, 3, 16])
+
+        resumed = JobManifest(self.path, PARAMS)
+        self.assertTrue(resumed.resumed)
+        self.assertTrue(resumed.is_completed([1, 2, 16]))
+        self.assertFalse(resumed.is_completed([1, 3, 16]))
+        self.assertEqual(resumed.last_fids, {"road": 10})
+
+    def test_resume_twice(self):
+        manifest = JobManifest(self.path, PARAMS)
+        manifest.add([1, 2, 16])
+        manifest.checkpoint({"road": 10})
+
+        resumed = JobManifest(self.path, PARAMS)
+        resumed.add([1, 3, 16])
+        resumed.checkpoint({"road": 25})
+        resumed.add([1, 4, 16])
+
+        resumed = JobManifest(self.path, PARAMS)
+        self.assertEqual(resumed.completed, {(1, 2, 16), (1, 3, 16)})
+        self.assertEqual(resumed.last_fids, {"road": 25})
+
+    def test_other_params_start_new_job(self):
+        manifest = JobManifest(self.path, PARAMS)
+        manifest.add([1, 2, 16])
+        manifest.checkpoint({"road": 10})
+
+        other = JobManifest(self.path, dict(PARAMS, zoom_level=15))
+        self.assertFalse(other.resumed)
+        self.assertFalse(other.is_completed([1, 2, 16]))
+
+    def test_finished_job_is_not_resumed(self):
+        manifest = JobManifest(self.path, PARAMS)
+        manifest.add([1, 2, 16])
+        manifest.checkpoint({"road": 10})
+        manifest.finish()
+
+        self.assertFalse(JobManifest(self.path, PARAMS).resumed)
+
+    def test_digests_of_finished_job(self):
+        manifest = JobManifest(self.path, PARAMS)
+        manifest.add([1, 2, 16], "abc")
+        manifest.add([1, 3, 16], "")
+        manifest.checkpoint({"road": 10})
+        manifest.finish()
+
+        refreshed = JobManifest(self.path, PARAMS)
+        self.assertFalse(refreshed.resumed)
+        self.assertEqual(refreshed.previous_digests, {"16/1/2": "abc", "16/1/3": ""})
+        # 新しいジョブのマニフェストに置き換わっても前回のダイジェストは残す
+        self.assertFalse(refreshed.is_completed([1, 2, 16]))
+
+        other = JobManifest(self.path, dict(PARAMS, zoom_level=15))
+        self.assertEqual(other.previous_digests, {})
+
+    def test_empty_layers(self):
+        manifest = JobManifest(self.path, PARAMS)
+        manifest.add([1, 2, 16])
+        manifest.checkpoint({"road": 10, "lake": 0})
+        manifest.record_empty_layers(["lake"])
+
+        # 中断後の再開で地物を書き込んだレイヤは空でなくなる
+        resumed = JobManifest(self.path, PARAMS)
+        self.assertEqual(resumed.empty_layers, {"lake"})
+        resumed.add([1, 3, 16])
+        resumed.checkpoint({"road": 20, "lake": 5})
+        self.assertEqual(JobManifest(self.path, PARAMS).empty_layers, set())
+
+    def test_empty_layers_of_finished_job(self):
+        manifest = JobManifest(self.path, PARAMS)
+        manifest.add([1, 2, 16], "abc")
+        manifest.checkpoint({"road": 10, "lake": 0})
+        manifest.record_empty_layers(["lake"])
+        manifest.finish()
+
+        refreshed = JobManifest(self.path, PARAMS)
+        self.assertFalse(refreshed.resumed)
+        self.assertEqual(refreshed.empty_layers, {"lake"})
+
+    def test_torn_line_is_ignored(self):
+        manifest = JobManifest(self.path, PARAMS)
+        manifest.add([1, 2, 16])
+        manifest.checkpoint({"road": 10})
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write('{"tiles": [[1, 3')
+
+        resumed = JobManifest(self.path, PARAMS)
+        self.assertTrue(resumed.resumed)
+        self.assertEqual(resumed.completed, {(1, 2, 16)})
+
+
+if __name__ == "__main__":
+    unittest.main()
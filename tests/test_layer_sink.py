@@ -0,0 +1,121 @@
+import os
+import tempfile
+import unittest
+
+try:
+    from qgis.core import QgsApplication, QgsGeometry
+
+    from processing_provider.layer_sink import GeoPackageSink
+except ImportError:
+    QgsApplication = None
+
+from processing_provider.mvt_decoder import DecodedFeature, DecodedLayer
+from processing_provider.stitching import TileGrid
+from processing_provider.tile_index import ORIGIN_SHIFT, tile_size
+
+SIZE = tile_size(16)
+GRID = TileGrid(SIZE, SIZE / 4096)
+# x = X0 がタイルの境界
+X0 = -ORIGIN_SHIFT + 58210 * SIZE
+Y0 = ORIGIN_SHIFT - 25803 * SIZE
+
+QGIS_APP = None
+
+
+def setUpModule():
+    global QGIS_APP
+    if QgsApplication is not None and QgsApplication.instance() is None:
+        QGIS_APP = QgsApplication([], False)
+        QGIS_APP.initQgis()
+
+
+def decoded_layer(features):
+    """(WKT, 属性の dict) のリストを mvt_decoder.DecodedLayer にする"""
+    decoded = []
+    for i, (wkt, properties) in enumerate(features):
+        geometry = QgsGeometry.fromWkt(wkt)
+        geometry.convertToMultiType()
+        decoded.append(DecodedFeature(i, 2, bytes(geometry.asWkb()), dict(properties)))
+    return DecodedLayer("road", 4096, decoded)
+
+
+@unittest.skipIf(QgsApplication is None, "QGIS is not available")
+class TestGeoPackageSink(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.output_path = os.path.join(self.tmp.name, "road_z16.gpkg")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def create_sink(self, **kwargs):
+        return GeoPackageSink("road", "線", self.output_path, "road_z16", **kwargs)
+
+    def write_lines(self, sink, count):
+        sink.add_decoded_layer(
+            decoded_layer(
+                [
+                    (f"LINESTRING ({X0 + i} {Y0 - 100}, {X0 + i} {Y0 - 200})", {})
+                    for i in range(count)
+                ]
+            ),
+            check_extent=False,
+        )
+        sink.flush()
+
+    def interrupt(self, sink):
+        """close() せずに出力先を手放す（処理の中断）"""
+        sink.layer = sink.provider = None
+
+    def test_truncate_after_two_resumes(self):
+        sink = self.create_sink()
+        self.write_lines(sink, 3)
+        checkpoint = sink.last_fid()
+        self.write_lines(sink, 2)
+        self.interrupt(sink)
+
+        # 1回目の再開: チェックポイント後の2件を消して続きを書く
+        sink = self.create_sink(append=True)
+        sink.truncate(checkpoint)
+        self.assertEqual(sink.feature_count, 3)
+        self.write_lines(sink, 2)
+        checkpoint = sink.last_fid()
+        self.write_lines(sink, 1)
+        self.interrupt(sink)
+
+        # 2回目の再開: チェックポイントまでの5件は残る
+        sink = self.create_sink(append=True)
+        sink.truncate(checkpoint)
+        self.assertEqual(sink.feature_count, 5)
+        sink.close()
+
+    def test_stitch_lines_across_tile_boundary(self):
+        sink = self.create_sink()
+        sink.add_decoded_layer(
+            decoded_layer(
+                [
+                    (
+                        f"LINESTRING ({X0 - 100} {Y0 - 100}, {X0} {Y0 - 150})",
+                        {"ftCode": 2701, "rdCtg": 1},
+                    ),
+                    (
+                        f"LINESTRING ({X0} {Y0 - 150}, {X0 + 100} {Y0 - 200})",
+                        {"ftCode": 2701, "rdCtg": 1},
+                    ),
+                    # 属性が違う
+                    (
+                        f"LINESTRING ({X0} {Y0 - 150}, {X0 + 100} {Y0 - 300})",
+                        {"ftCode": 2701, "rdCtg": 2},
+                    ),
+                ]
+            ),
+            check_extent=False,
+        )
+
+        self.assertEqual(sink.stitch(GRID), 1)
+        features = list(sink.provider.getFeatures())
+        self.assertEqual(len(features), 2)
+        merged = [f for f in features if f["rdCtg"] == 1]
+        self.assertEqual(len(merged), 1)
+        self.assertAlmostEqual(merged[0].geometry().length(), 2 * 12500**0.5, 3)
+        sink.close()
@@ -0,0 +1,103 @@
+import unittest
+
+from processing_provider.log_feedback import BufferedFeedback, LogFeedback
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeFeedback:
+    def __init__(self):
+        self.messages = []
+        self.progress = []
+
+    def pushInfo(self, info):
+        self.messages.append(info)
+
+    def setProgress(self, progress):
+        self.progress.append(progress)
+
+    def isCanceled(self):
+        return False
+
+
+class TestLogFeedback(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.inner = FakeFeedback()
+
+    def create(self, level):
+        return LogFeedback(self.inner, level, interval=5.0, clock=self.clock)
+
+    def test_summary_drops_debug_messages(self):
+        feedback = self.create("summary")
+        feedback.pushDebugInfo("Processing tile 1/1: 0/0/0")
+        feedback.pushInfo("Error processing tile")
+
+        self.assertEqual(self.inner.messages, ["Error processing tile"])
+        self.assertFalse(feedback.isCanceled())
+
+    def test_debug_writes_debug_messages(self):
+        feedback = self.create("debug")
+        feedback.pushDebugInfo("Processing tile 1/1: 0/0/0")
+
+        self.assertEqual(self.inner.messages, ["Processing tile 1/1: 0/0/0"])
+
+    def test_summary_is_throttled(self):
+        feedback = self.create("summary")
+        feedback.count("downloaded", 3)
+        feedback.pushSummary("Processed 3/9 tiles")
+        feedback.count("downloaded", 2)
+        feedback.count("not found")
+        self.clock.now = 1.0
+        feedback.pushSummary("Processed 6/9 tiles")
+        feedback.count("downloaded")
+        feedback.pushSummary("Processed 9/9 tiles", force=True)
+
+        self.assertEqual(
+            self.inner.messages,
+            [
+                "Processed 3/9 tiles: 3 downloaded",
+                "Processed 9/9 tiles: 3 downloaded, 1 not found",
+            ],
+        )
+
+    def test_progress_only_when_percent_changes(self):
+        feedback = self.create("summary")
+        for progress in (0, 0.4, 1.2, 1.9, 2.0, 100):
+            feedback.setProgress(progress)
+
+        self.assertEqual(self.inner.progress, [0, 1.2, 2.0, 100])
+
+
+class TestBufferedFeedback(unittest.TestCase):
+    def test_replay(self):
+        inner = FakeFeedback()
+        feedback = LogFeedback(inner, "summary", interval=0.0, clock=FakeClock())
+        buffered = BufferedFeedback(lambda: True)
+        buffered.pushInfo("Looking for parent tiles")
+        buffered.pushDebugInfo("Tile not found (404): 0/0/0")
+        buffered.count("not found")
+        buffered.setProgress(50)
+
+        self.assertTrue(buffered.isCanceled())
+        self.assertEqual(inner.messages, [])
+
+        buffered.replay(feedback)
+        buffered.replay(feedback)
+        feedback.pushSummary("Processed 1/1 tiles")
+
+        self.assertEqual(
+            inner.messages,
+            ["Looking for parent tiles", "Processed 1/1 tiles: 1 not found"],
+        )
+        self.assertEqual(inner.progress, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,196 @@
+import struct
+import unittest
+from unittest import mock
+
+from processing_provider import mvt_decoder
+from processing_provider.mvt_decoder import LINESTRING, POINT, POLYGON, decode_tile
+
+from .mvt_builder import encode_tile
+
+ORIGIN_SHIFT = 20037508.342789244
+
+
+def read_wkb(wkb):
+    """Multi* 型の WKB をパスの座標のリストに展開する"""
+    _, multi_type, count = struct.unpack_from("<BII", wkb, 0)
+    pos = 9
+    parts = []
+    for _ in range(count):
+        _, part_type = struct.unpack_from("<BI", wkb, pos)
+        pos += 5
+        if part_type == 1:
+            parts.append(struct.unpack_from("<2d", wkb, pos))
+            pos += 16
+            continue
+        ring_count = 1
+        if part_type == 3:
+            (ring_count,) = struct.unpack_from("<I", wkb, pos)
+            pos += 4
+        rings = []
+        for _ in range(ring_count):
+            (n,) = struct.unpack_from("<I", wkb, pos)
+            pos += 4
+            values = struct.unpack_from(f"<{n * 2}d", wkb, pos)
+            pos += n * 16
+            rings.append(list(zip(values[0::2], values[1::2])))
+        parts.append(rings if part_type == 3 else rings[0])
+    return multi_type, parts
+
+
+def tile_to_3857(x, y, extent=4096):
+    """z0 タイルの座標を EPSG:3857 にする"""
+    size = 2 * ORIGIN_SHIFT / extent
+    return (-ORIGIN_SHIFT + x * size, ORIGIN_SHIFT - y * size)
+
+
+class DecoderTests:
+    def test_points_and_properties(self):
+        data = encode_tile(
+            {
+                "label": [
+                    (
+                        POINT,
+                        [[(2048, 2048)], [(0, 4096)]],
+                        {"knj": "東京", "alti": -3, "arrngAgl": 1.5, "flag": True},
+                    ),
+                    (POINT, [[(5000, 10)]], {"knj": "outside"}),
+                ]
+            }
+        )
+
+        layer = decode_tile(data, [0, 0, 0])["label"]
+
+        self.assertEqual(layer.extent, 4096)
+        self.assertEqual(len(layer.features), 1)
+        feature = layer.features[0]
+        self.assertEqual(feature.id, 1)
+        self.assertEqual(feature.geom_type, POINT)
+        self.assertEqual(
+            feature.properties,
+            {"knj": "東京", "alti": -3, "arrngAgl": 1.5, "flag": True},
+        )
+        self.assertIs(feature.properties["flag"], True)
+
+        multi_type, points = read_wkb(feature.wkb)
+        self.assertEqual(multi_type, 4)
+        self.assertEqual(len(points), 2)
+        self.assertAlmostEqual(points[0][0], 0.0)
+        self.assertAlmostEqual(points[0][1], 0.0)
+        self.assertAlmostEqual(points[1][0], -ORIGIN_SHIFT)
+        self.assertAlmostEqual(points[1][1], -ORIGIN_SHIFT)
+
+    def test_tile_offset(self):
+        data = encode_tile({"symbol": [(POINT, [[(0, 0)]], {})]})
+
+        feature = decode_tile(data, [3, 1, 2])["symbol"].features[0]
+
+        _, points = read_wkb(feature.wkb)
+        self.assertAlmostEqual(points[0][0], ORIGIN_SHIFT / 2)
+        self.assertAlmostEqual(points[0][1], ORIGIN_SHIFT / 2)
+
+    def test_lines_are_clipped_to_tile(self):
+        data = encode_tile(
+            {
+                "road": [
+                    (
+                        LINESTRING,
+                        [[(-100, 100), (200, 100), (200, 300)], [(10, 10), (20, 20)]],
+                        {},
+                    ),
+                    (LINESTRING, [[(-100, -100), (-10, -10)]], {}),
+                ]
+            }
+        )
+
+        layer = decode_tile(data, [0, 0, 0])["road"]
+
+        self.assertEqual(len(layer.features), 1)
+        multi_type, lines = read_wkb(layer.features[0].wkb)
+        self.assertEqual(multi_type, 5)
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(len(lines[0]), 3)
+        self.assertAlmostEqual(lines[0][0][0], tile_to_3857(0, 100)[0])
+        self.assertAlmostEqual(lines[0][0][1], tile_to_3857(0, 100)[1])
+        self.assertAlmostEqual(lines[0][2][1], tile_to_3857(200, 300)[1])
+
+    def test_each_feature_starts_at_origin(self):
+        data = encode_tile(
+            {
+                "river": [
+                    (LINESTRING, [[(100, 100), (200, 200)]], {}),
+                    (LINESTRING, [[(300, 400), (500, 600)]], {}),
+                ]
+            }
+        )
+
+        features = decode_tile(data, [0, 0, 0])["river"].features
+
+        _, lines = read_wkb(features[1].wkb)
+        self.assertAlmostEqual(lines[0][0][0], tile_to_3857(300, 400)[0])
+        self.assertAlmostEqual(lines[0][0][1], tile_to_3857(300, 400)[1])
+
+    def test_polygon_rings(self):
+        exterior = [(0, 0), (100, 0), (100, 100), (0, 100)]
+        hole = [(20, 20), (20, 80), (80, 80), (80, 20)]
+        other = [(200, 200), (300, 200), (300, 300), (200, 300)]
+        data = encode_tile({"building": [(POLYGON, [exterior, hole, other], {})]})
+
+        feature = decode_tile(data, [0, 0, 0])["building"].features[0]
+
+        multi_type, polygons = read_wkb(feature.wkb)
+        self.assertEqual(multi_type, 6)
+        self.assertEqual([len(rings) for rings in polygons], [2, 1])
+        # リングは閉じている
+        self.assertEqual(len(polygons[0][0]), 5)
+        self.assertEqual(polygons[0][0][0], polygons[0][0][-1])
+
+    def test_polygon_is_clipped_to_tile(self):
+        exterior = [(-100, -100), (100, -100), (100, 100), (-100, 100)]
+        data = encode_tile({"waterarea": [(POLYGON, [exterior], {})]})
+
+        feature = decode_tile(data, [0, 0, 0])["waterarea"].features[0]
+
+        _, polygons = read_wkb(feature.wkb)
+        xs = [x for x, _ in polygons[0][0]]
+        ys = [y for _, y in polygons[0][0]]
+        self.assertAlmostEqual(min(xs), -ORIGIN_SHIFT)
+        self.assertAlmostEqual(max(ys), ORIGIN_SHIFT)
+        self.assertAlmostEqual(max(xs), tile_to_3857(100, 0)[0])
+
+    def test_only_requested_layers(self):
+        data = encode_tile(
+            {
+                "road": [(LINESTRING, [[(0, 0), (10, 10)]], {})],
+                "river": [(LINESTRING, [[(0, 0), (10, 10)]], {})],
+            }
+        )
+
+        self.assertEqual(list(decode_tile(data, [0, 0, 0], ["river"])), ["river"])
+        self.assertEqual(sorted(decode_tile(data, [0, 0, 0])), ["river", "road"])
+
+    def test_large_coordinates(self):
+        data = encode_tile(
+            {"contour": [(LINESTRING, [[(0, 0), (4096, 4096), (1, 4095)]], {})]}
+        )
+
+        feature = decode_tile(data, [0, 0, 0])["contour"].features[0]
+
+        _, lines = read_wkb(feature.wkb)
+        self.assertAlmostEqual(lines[0][1][0], ORIGIN_SHIFT)
+        self.assertAlmostEqual(lines[0][2][0], tile_to_3857(1, 4095)[0])
+
+
+@unittest.skipIf(mvt_decoder.np is None, "NumPy is not installed")
+class TestDecoderNumPy(DecoderTests, unittest.TestCase):
+    pass
+
+
+class TestDecoderPython(DecoderTests, unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(mvt_decoder, "np", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import threading
+import time
+import unittest
+
+from processing_provider.pipeline import Stage
+
+
+class TestStage(unittest.TestCase):
+    def test_results_in_order(self):
+        for depth in (0, 1, 3):
+            with self.subTest(depth=depth):
+                stage = Stage(range(10), lambda i: i * i, depth)
+                self.assertEqual(list(stage), [i * i for i in range(10)])
+                stage.close()
+
+    def test_depth_zero_runs_in_caller_thread(self):
+        threads = []
+        stage = Stage(range(3), lambda i: threads.append(threading.get_ident()), 0)
+        list(stage)
+
+        self.assertEqual(threads, [threading.get_ident()] * 3)
+
+    def test_backpressure(self):
+        started = []
+        stage = Stage(range(100), started.append, depth=2)
+        next(stage)
+        time.sleep(0.3)
+
+        # 受け取った1件、キューの2件、キューが空くのを待っている1件まで
+        self.assertLessEqual(len(started), 4)
+        stage.close()
+
+    def test_chained_stages_overlap(self):
+        def slow(i):
+            time.sleep(0.05)
+            return i
+
+        first = Stage(range(10), slow, depth=2)
+        second = Stage(first, slow, depth=2)
+        start = time.perf_counter()
+        results = [slow(i) for i in second]
+        elapsed = time.perf_counter() - start
+        second.close()
+
+        self.assertEqual(results, list(range(10)))
+        # 順に処理すると 1.5 秒掛かる
+        self.assertLess(elapsed, 1.0)
+
+    def test_error_is_raised_in_consumer(self):
+        def fail(i):
+            if i == 2:
+                raise ValueError(i)
+            return i
+
+        stage = Stage(range(5), fail, depth=2)
+        self.assertEqual(next(stage), 0)
+        self.assertEqual(next(stage), 1)
+        with self.assertRaises(ValueError):
+            next(stage)
+        stage.close()
+
+    def test_cancel_and_close(self):
+        canceled = threading.Event()
+        first = Stage(range(1000), lambda i: i, 2, canceled.is_set)
+        second = Stage(first, lambda i: i, 2, canceled.is_set)
+        next(second)
+        canceled.set()
+        second.close()
+
+        self.assertFalse(first._thread.is_alive())
+        self.assertFalse(second._thread.is_alive())
+
+    def test_in_flight_until_next_result_is_requested(self):
+        stage = Stage(["a", "b"], str.upper, depth=0)
+
+        self.assertEqual(next(stage), "A")
+        self.assertEqual(stage.in_flight(), ["a"])
+        self.assertEqual(next(stage), "B")
+        self.assertEqual(stage.in_flight(), ["b"])
+        self.assertEqual(list(stage), [])
+        self.assertEqual(stage.in_flight(), [])
+
+    def test_paused_does_not_start_new_items(self):
+        started = []
+
+        def slow(i):
+            started.append(i)
+            time.sleep(0.05)
+            return i
+
+        stage = Stage(range(100), slow, depth=10)
+        next(stage)
+        with stage.paused():
+            before = list(started)
+            in_flight = stage.in_flight()
+            time.sleep(0.3)
+            self.assertEqual(started, before)
+            self.assertEqual(stage.in_flight(), in_flight)
+        time.sleep(0.3)
+        self.assertGreater(len(started), len(before))
+        stage.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
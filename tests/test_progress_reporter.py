@@ -0,0 +1,71 @@
+import io
+import json
+import unittest
+
+from processing_provider.progress_reporter import ProgressReporter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestProgressReporter(unittest.TestCase):
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.clock = FakeClock()
+        self.reporter = ProgressReporter(
+            self.stream, json_lines=True, min_interval=1.0, clock=self.clock
+        )
+
+    def events(self):
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_json_lines(self):
+        self.reporter.info("タイル 1/2")
+        self.reporter.error("failed")
+        self.reporter.finished(1)
+
+        self.assertEqual(
+            self.events(),
+            [
+                {"event": "info", "message": "タイル 1/2"},
+                {"event": "error", "message": "failed"},
+                {"event": "finished", "exit_code": 1, "errors": 1},
+            ],
+        )
+
+    def test_progress_is_throttled(self):
+        self.reporter.progress(1)
+        self.reporter.progress(1.5)
+        self.reporter.progress(2)
+        self.clock.now = 1.0
+        self.reporter.progress(3)
+        self.reporter.progress(100)
+
+        self.assertEqual([event["progress"] for event in self.events()], [1, 3, 100])
+
+    def test_text_format(self):
+        reporter = ProgressReporter(self.stream, clock=self.clock)
+        reporter.progress(50)
+        reporter.warning("slow")
+
+        self.assertEqual(self.stream.getvalue(), "[progress] 50%\n[warning] slow\n")
+
+    def test_metrics(self):
+        report = {"elapsed": 2.0, "phases": {"fetch": 1.5}, "rates": {}}
+        self.reporter.metrics(report)
+
+        self.assertEqual(self.events(), [{"event": "metrics", **report}])
+
+    def test_cancel(self):
+        self.assertFalse(self.reporter.is_canceled())
+        self.reporter.cancel()
+        self.assertTrue(self.reporter.is_canceled())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from processing_provider.run_metrics import RunMetrics
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRunMetrics(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.metrics = RunMetrics(clock=self.clock, wall_clock=lambda: 1000.0)
+
+    def test_nested_phases_are_exclusive(self):
+        with self.metrics.phase("decode"):
+            self.clock.now += 1.0
+            with self.metrics.phase("clip"):
+                self.clock.now += 0.5
+            self.clock.now += 2.0
+        with self.metrics.phase("clip"):
+            self.clock.now += 0.25
+
+        self.assertEqual(self.metrics.timings, {"decode": 3.0, "clip": 0.75})
+
+    def test_phase_is_closed_on_error(self):
+        with self.assertRaises(ValueError):
+            with self.metrics.phase("write"):
+                self.clock.now += 1.0
+                raise ValueError()
+
+        self.assertEqual(self.metrics.timings, {"write": 1.0})
+
+    def test_phases_are_timed_per_thread(self):
+        metrics = RunMetrics()
+
+        def fetch():
+            with metrics.phase("fetch"):
+                pass
+
+        with metrics.phase("convert"):
+            thread = threading.Thread(target=fetch)
+            thread.start()
+            thread.join()
+            # 別スレッドのフェーズは計測中のフェーズの入れ子にならない
+            self.assertEqual([name for name, _ in metrics._stack], ["convert"])
+
+        self.assertEqual(set(metrics.timings), {"convert", "fetch"})
+
+    def test_report(self):
+        with self.metrics.phase("fetch"):
+            self.clock.now += 2.0
+        self.clock.now += 2.0
+        self.metrics.add("tiles_processed", 8)
+        self.metrics.add("features_written", 100)
+        self.metrics.add("bytes_downloaded", 4096)
+        self.metrics.add("tiles_not_found")
+
+        report = self.metrics.report(zoom_levels=[16])
+
+        self.assertEqual(report["elapsed"], 4.0)
+        self.assertEqual(report["started_at"], 1000.0)
+        self.assertEqual(report["phases"], {"fetch": 2.0})
+        self.assertEqual(report["counters"]["tiles_not_found"], 1)
+        self.assertEqual(
+            report["rates"],
+            {
+                "tiles_per_second": 2.0,
+                "features_per_second": 25.0,
+                "download_bytes_per_second": 2048.0,
+            },
+        )
+        self.assertEqual(report["zoom_levels"], [16])
+
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "report.json")
+            self.metrics.write(path, self.metrics.report())
+            with open(path, encoding="utf-8") as f:
+                self.assertEqual(json.load(f)["version"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
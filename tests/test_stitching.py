@@ -0,0 +1,74 @@
+import unittest
+
+from processing_provider.stitching import (
+    TileGrid,
+    duplicate_points,
+    line_groups,
+    polygon_groups,
+)
+from processing_provider.tile_index import ORIGIN_SHIFT, tile_size
+
+SIZE = tile_size(16)
+GRID = TileGrid(SIZE, SIZE / 4096)
+# x = X0 と y = Y0 がタイルの境界
+X0 = -ORIGIN_SHIFT + 58210 * SIZE
+Y0 = ORIGIN_SHIFT - 25803 * SIZE
+
+
+class TestStitching(unittest.TestCase):
+    def test_boundary(self):
+        self.assertEqual(GRID.boundary(X0), 58210)
+        self.assertEqual(GRID.boundary(X0 + SIZE / 8192), 58210)
+        self.assertIsNone(GRID.boundary(X0 + 10))
+
+    def test_duplicate_points(self):
+        points = [
+            (1, "a", [(X0, Y0 - 100)]),
+            (2, "a", [(X0 + 0.01, Y0 - 100)]),
+            (3, "b", [(X0, Y0 - 100)]),
+            (4, "a", [(X0 + 50, Y0 - 100)]),
+        ]
+
+        self.assertEqual(duplicate_points(points, GRID), [2])
+
+    def test_lines_joined_at_boundary(self):
+        lines = [
+            (1, "road", [[(X0 - 100, Y0 - 100), (X0, Y0 - 150)]]),
+            (2, "road", [[(X0 + 0.05, Y0 - 150.05), (X0 + 100, Y0 - 200)]]),
+            # 属性が違う
+            (3, "river", [[(X0, Y0 - 150), (X0 + 100, Y0 - 300)]]),
+            # 境界ではない場所で接する
+            (4, "road", [[(X0 + 100, Y0 - 200), (X0 + 200, Y0 - 200)]]),
+        ]
+
+        self.assertEqual(line_groups(lines, GRID), [[1, 2]])
+
+    def test_lines_across_several_tiles(self):
+        lines = [
+            (1, "road", [[(X0 - 100, Y0 - 100), (X0, Y0 - 100)]]),
+            (2, "road", [[(X0, Y0 - 100), (X0 + SIZE, Y0 - 100)]]),
+            (3, "road", [[(X0 + SIZE, Y0 - 100), (X0 + SIZE + 100, Y0 - 100)]]),
+        ]
+
+        self.assertEqual(line_groups(lines, GRID), [[1, 2, 3]])
+
+    def test_polygons_sharing_boundary_edge(self):
+        def square(x0, x1, y0, y1):
+            return [[[(x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)]]]
+
+        polygons = [
+            (1, "bldg", square(X0 - 30, X0, Y0 - 80, Y0 - 40)),
+            (2, "bldg", square(X0, X0 + 20, Y0 - 80, Y0 - 40)),
+            # 別の建物（境界の同じ側）
+            (3, "bldg", square(X0 - 30, X0, Y0 - 200, Y0 - 150)),
+            # 角で接するだけ
+            (4, "bldg", square(X0, X0 + 20, Y0 - 150, Y0 - 100)),
+            # 属性が違う
+            (5, "pond", square(X0, X0 + 20, Y0 - 200, Y0 - 150)),
+        ]
+
+        self.assertEqual(polygon_groups(polygons, GRID), [[1, 2]])
+
+
+if __name__ == "__main__":
+    unittest.main()
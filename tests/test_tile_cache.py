@@ -0,0 +1,152 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from processing_provider.tile_cache import MBTILES_FILENAME, MBTilesTileCache, TileCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTileCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.clock = FakeClock()
+        self.cache = TileCache(self.tmpdir.name, max_bytes=30, ttl=60, clock=self.clock)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmpdir.cleanup()
+
+    def test_store_and_lookup(self):
+        self.assertIsNone(self.cache.lookup([1, 2, 3]))
+
+        path = self.cache.store([1, 2, 3], b"tile", {"ETag": '"abc"'})
+        self.assertEqual(path, os.path.join(self.tmpdir.name, "3", "1", "2.pbf"))
+
+        entry = self.cache.lookup([1, 2, 3])
+        self.assertEqual(entry.size, 4)
+        self.assertEqual(
+            self.cache.conditional_headers(entry), {"If-None-Match": '"abc"'}
+        )
+
+    def test_expired_tile_is_revalidated(self):
+        self.cache.store([0, 0, 1], b"tile", {"Last-Modified": "yesterday"})
+        self.assertTrue(self.cache.is_fresh(self.cache.lookup([0, 0, 1])))
+
+        self.clock.now += 61
+        entry = self.cache.lookup([0, 0, 1])
+        self.assertFalse(self.cache.is_fresh(entry))
+        self.assertEqual(
+            self.cache.conditional_headers(entry), {"If-Modified-Since": "yesterday"}
+        )
+
+        self.cache.revalidated([0, 0, 1], {})
+        self.assertTrue(self.cache.is_fresh(self.cache.lookup([0, 0, 1])))
+
+    def test_remove(self):
+        path = self.cache.store([0, 0, 1], b"tile")
+        self.cache.remove([0, 0, 1])
+
+        self.assertIsNone(self.cache.lookup([0, 0, 1]))
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.cache.total_bytes(), 0)
+
+    def test_empty_file_is_discarded(self):
+        path = self.cache.store([0, 0, 1], b"tile")
+        open(path, "wb").close()
+
+        self.assertIsNone(self.cache.lookup([0, 0, 1]))
+        self.assertFalse(os.path.exists(path))
+
+    def test_evict_least_recently_used(self):
+        for x in range(4):
+            self.clock.now += 1
+            self.cache.store([x, 0, 1], b"0123456789")
+
+        # x=0 を最近参照したことにする
+        self.clock.now += 1
+        self.cache.touch([[0, 0, 1]])
+
+        evicted = self.cache.evict(protect=[[1, 0, 1]])
+
+        self.assertEqual(evicted, 1)
+        self.assertEqual(self.cache.total_bytes(), 30)
+        self.assertIsNone(self.cache.lookup([2, 0, 1]))
+        self.assertIsNotNone(self.cache.lookup([0, 0, 1]))
+        self.assertIsNotNone(self.cache.lookup([1, 0, 1]))
+
+
+class TestMBTilesTileCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.clock = FakeClock()
+        self.cache = MBTilesTileCache(
+            self.tmpdir.name,
+            max_bytes=30,
+            clock=self.clock,
+            vector_layers=["road", "building"],
+        )
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmpdir.cleanup()
+
+    def test_store_and_read(self):
+        self.assertIsNone(self.cache.tile_path([1, 2, 3]))
+        self.assertIsNone(self.cache.lookup([1, 2, 3]))
+
+        self.cache.store([1, 2, 3], b"tile", {"etag": '"abc"'})
+
+        entry = self.cache.lookup([1, 2, 3])
+        self.assertEqual(entry.size, 4)
+        self.assertEqual(entry.etag, '"abc"')
+        self.assertEqual(self.cache.read([1, 2, 3]), b"tile")
+        self.assertIn(MBTILES_FILENAME, os.listdir(self.tmpdir.name))
+        self.assertNotIn("3", os.listdir(self.tmpdir.name))
+
+    def test_mbtiles_layout(self):
+        self.cache.store([1, 2, 3], b"tile")
+        self.cache.close()
+
+        db = sqlite3.connect(os.path.join(self.tmpdir.name, MBTILES_FILENAME))
+        # tile_row は TMS（南が0）
+        row = db.execute(
+            "SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles"
+        ).fetchone()
+        self.assertEqual(row, (3, 1, 5, b"tile"))
+
+        metadata = dict(db.execute("SELECT name, value FROM metadata"))
+        self.assertEqual(metadata["format"], "pbf")
+        layer_ids = [v["id"] for v in json.loads(metadata["json"])["vector_layers"]]
+        self.assertEqual(layer_ids, ["road", "building"])
+        db.close()
+
+        self.cache = MBTilesTileCache(self.tmpdir.name)
+
+    def test_remove(self):
+        self.cache.store([1, 2, 3], b"tile")
+        self.cache.remove([1, 2, 3])
+
+        self.assertIsNone(self.cache.lookup([1, 2, 3]))
+        self.assertIsNone(self.cache.read([1, 2, 3]))
+
+    def test_evict_removes_tile_data(self):
+        for x in range(4):
+            self.clock.now += 1
+            self.cache.store([x, 0, 1], b"0123456789")
+
+        self.assertEqual(self.cache.evict(), 1)
+        self.assertIsNone(self.cache.lookup([0, 0, 1]))
+        self.assertIsNone(self.cache.read([0, 0, 1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,193 @@
+import http.server
+import socket
+import threading
+import unittest
+
+from processing_provider.tile_fetcher import RateLimiter, TileFetcher
+
+
+class TileHandler(http.server.BaseHTTPRequestHandler):
+    """/{z}/{x}/{y}.pbf に対してタイル座標を本文として返すスタンドインサーバ"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        self.server.clients.add(self.client_address)
+
+        z, x, y = self.path.lstrip("/").replace(".pbf", "").split("/")
+        if self.server.failures.get(self.path, 0) > 0:
+            self.server.failures[self.path] -= 1
+            status, body = 503, b""
+        elif int(y) in self.server.missing_rows:
+            status, body = 404, b""
+        elif self.headers.get("If-None-Match") == '"v1"':
+            status, body = 304, b""
+        else:
+            status, body = 200, f"{z}/{x}/{y}".encode()
+
+        self.send_response(status)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestTileFetcher(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), TileHandler)
+        self.server.requests = []
+        self.server.clients = set()
+        self.server.missing_rows = set()
+        self.server.failures = {}
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        host, port = self.server.server_address
+        self.url_template = f"http://{host}:{port}/{{z}}/{{x}}/{{y}}.pbf"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_fetch_all_tiles(self):
+        self.server.missing_rows = {3}
+        tiles = [[x, y, 10] for x in range(4) for y in range(5)]
+
+        fetcher = TileFetcher(self.url_template, max_workers=4)
+        results = {tuple(r.xyz): r for r in fetcher.fetch(tiles)}
+        fetcher.close()
+
+        self.assertEqual(len(results), len(tiles))
+        self.assertEqual(results[(1, 2, 10)].status, 200)
+        self.assertEqual(results[(1, 2, 10)].data, b"10/1/2")
+        self.assertEqual(results[(1, 3, 10)].status, 404)
+        self.assertIsNone(results[(1, 3, 10)].data)
+
+    def test_conditional_request(self):
+        tiles = [[0, 0, 10], [1, 0, 10]]
+
+        fetcher = TileFetcher(self.url_template, max_workers=2)
+        results = {
+            tuple(r.xyz): r
+            for r in fetcher.fetch(
+                tiles,
+                headers_for=lambda xyz: {"If-None-Match": '"v1"'} if xyz[0] else None,
+            )
+        }
+        fetcher.close()
+
+        self.assertEqual(results[(0, 0, 10)].status, 200)
+        self.assertEqual(results[(0, 0, 10)].headers["ETag"], '"v1"')
+        self.assertEqual(results[(1, 0, 10)].status, 304)
+        self.assertIsNone(results[(1, 0, 10)].data)
+
+    def test_connections_are_reused(self):
+        tiles = [[x, 0, 10] for x in range(40)]
+
+        fetcher = TileFetcher(self.url_template, max_workers=2)
+        list(fetcher.fetch(tiles))
+        fetcher.close()
+
+        self.assertEqual(len(self.server.requests), 40)
+        self.assertLessEqual(len(self.server.clients), 2)
+
+    def test_cancel_stops_fetching(self):
+        tiles = [[x, 0, 10] for x in range(200)]
+        received = []
+
+        fetcher = TileFetcher(self.url_template, max_workers=2)
+        for result in fetcher.fetch(tiles, is_canceled=lambda: len(received) >= 5):
+            received.append(result)
+        fetcher.close()
+
+        self.assertLess(len(received), len(tiles))
+
+    def test_retry_transient_errors(self):
+        self.server.failures = {"/10/0/0.pbf": 2, "/10/1/0.pbf": 5}
+
+        fetcher = TileFetcher(
+            self.url_template, max_workers=2, max_retries=3, backoff=0.01
+        )
+        results = {tuple(r.xyz): r for r in fetcher.fetch([[0, 0, 10], [1, 0, 10]])}
+        fetcher.close()
+
+        self.assertEqual(results[(0, 0, 10)].status, 200)
+        self.assertEqual(results[(0, 0, 10)].data, b"10/0/0")
+        # 再試行の回数を使い切った場合は最後のレスポンスを返す
+        self.assertEqual(results[(1, 0, 10)].status, 503)
+        self.assertEqual(self.server.requests.count("/10/1/0.pbf"), 4)
+        self.assertEqual(fetcher.retries, 2 + 3)
+
+    def test_not_found_is_not_retried(self):
+        self.server.missing_rows = {0}
+
+        fetcher = TileFetcher(self.url_template, max_retries=3, backoff=0.01)
+        result = fetcher.fetch_one([0, 0, 10])
+        fetcher.close()
+
+        self.assertEqual(result.status, 404)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_connection_error(self):
+        # 使われていないポートを確保してから閉じ、接続拒否を起こす
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+
+        fetcher = TileFetcher(
+            f"http://127.0.0.1:{port}/{{z}}/{{x}}/{{y}}.pbf", max_workers=1, timeout=1
+        )
+        result = fetcher.fetch_one([0, 0, 0])
+        fetcher.close()
+
+        self.assertIsNone(result.status)
+        self.assertIsNotNone(result.error)
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_burst_then_steady_rate(self):
+        timer = FakeTimer()
+        limiter = RateLimiter(10, burst=3, clock=timer.clock, sleep=timer.sleep)
+
+        for _ in range(3):
+            limiter.acquire()
+        self.assertEqual(timer.sleeps, [])
+
+        for _ in range(5):
+            limiter.acquire()
+        self.assertEqual(len(timer.sleeps), 5)
+        self.assertAlmostEqual(timer.now, 0.5)
+
+    def test_tokens_refill_while_idle(self):
+        timer = FakeTimer()
+        limiter = RateLimiter(10, burst=2, clock=timer.clock, sleep=timer.sleep)
+        limiter.acquire()
+        limiter.acquire()
+
+        timer.now += 1.0
+        limiter.acquire()
+        limiter.acquire()
+        self.assertEqual(timer.sleeps, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,212 @@
+import unittest
+from unittest import mock
+
+from processing_provider import tile_index
+from processing_provider.tile_index import (
+    TileSet,
+    bbox_tile_cover,
+    lonlat_to_tile_xy,
+    lonlat_to_webmercator,
+    parent_tile,
+    polygon_tile_cover,
+    split_into_blocks,
+    tile_bounds,
+    tile_xy_to_webmercator,
+    webmercator_to_lonlat,
+    webmercator_to_tile_xy,
+)
+
+
+class TestSplitIntoBlocks(unittest.TestCase):
+    def test_blocks_cover_all_tiles(self):
+        tileindex = [[x, y, 16] for x in range(10, 15) for y in range(20, 23)]
+
+        blocks = split_into_blocks(tileindex, 2)
+
+        self.assertEqual(sorted(sum(blocks, [])), sorted(tileindex))
+        for block in blocks:
+            self.assertEqual(len({(x // 2, y // 2) for x, y, _ in block}), 1)
+            self.assertLessEqual(len(block), 4)
+
+    def test_blocks_are_ordered_row_by_row(self):
+        tileindex = [[x, y, 16] for x in range(4) for y in range(4)]
+
+        blocks = split_into_blocks(tileindex, 2)
+
+        self.assertEqual(
+            [block[0] for block in blocks],
+            [[0, 0, 16], [2, 0, 16], [0, 2, 16], [2, 2, 16]],
+        )
+
+    def test_block_size_is_at_least_one(self):
+        self.assertEqual(
+            split_into_blocks([[0, 0, 1], [1, 0, 1]], 0), [[[0, 0, 1]], [[1, 0, 1]]]
+        )
+
+
+class TestTileGeometry(unittest.TestCase):
+    def test_parent_tile(self):
+        self.assertEqual(parent_tile([58210, 25803, 16]), (29105, 12901, 15))
+
+    def test_tile_bounds(self):
+        xmin, ymin, xmax, ymax = tile_bounds([0, 0, 0])
+        self.assertAlmostEqual(xmin, -20037508.342789244)
+        self.assertAlmostEqual(ymax, 20037508.342789244)
+        self.assertAlmostEqual(xmax, -xmin)
+        self.assertAlmostEqual(ymin, -ymax)
+
+    def test_children_are_inside_parent(self):
+        parent = tile_bounds(parent_tile([5, 6, 4]))
+        child = tile_bounds([5, 6, 4])
+        # 境界が一致する辺は丸め誤差を許容する
+        self.assertLessEqual(parent[0], child[0] + 1e-6)
+        self.assertLessEqual(parent[1], child[1] + 1e-6)
+        self.assertGreaterEqual(parent[2] + 1e-6, child[2])
+        self.assertGreaterEqual(parent[3] + 1e-6, child[3])
+
+
+class TestBboxTileCover(unittest.TestCase):
+    def test_covers_bbox(self):
+        tiles = bbox_tile_cover([139.76, 35.67], [139.78, 35.69], 16)
+
+        self.assertIn([58212, 25806, 16], tiles)
+        xs = {x for x, _, _ in tiles}
+        ys = {y for _, y, _ in tiles}
+        self.assertEqual(len(tiles), len(xs) * len(ys))
+
+    def test_point_is_one_tile(self):
+        self.assertEqual(bbox_tile_cover([0.1, 0.1], [0.1, 0.1], 1), [[1, 0, 1]])
+
+    def test_clamped_to_world(self):
+        self.assertEqual(len(bbox_tile_cover([-180, -85], [180, 85], 2)), 16)
+
+
+class TestCoordinateConversion(unittest.TestCase):
+    def test_round_trip(self):
+        x, y = lonlat_to_webmercator(139.767, 35.681)
+        lon, lat = webmercator_to_lonlat(x, y)
+        self.assertAlmostEqual(lon, 139.767)
+        self.assertAlmostEqual(lat, 35.681)
+
+        tile_x, tile_y = webmercator_to_tile_xy(x, y, 16)
+        expected = lonlat_to_tile_xy(139.767, 35.681, 16)
+        self.assertAlmostEqual(tile_x, expected[0], places=6)
+        self.assertAlmostEqual(tile_y, expected[1], places=6)
+        back_x, back_y = tile_xy_to_webmercator(tile_x, tile_y, 16)
+        self.assertAlmostEqual(back_x, x, places=6)
+        self.assertAlmostEqual(back_y, y, places=6)
+
+    @unittest.skipIf(tile_index.np is None, "NumPy is not installed")
+    def test_arrays(self):
+        np = tile_index.np
+        lon = np.array([0.0, 139.767])
+        lat = np.array([0.0, 35.681])
+
+        x, y = lonlat_to_webmercator(lon, lat)
+
+        self.assertEqual(x.shape, (2,))
+        self.assertAlmostEqual(x[1], lonlat_to_webmercator(139.767, 35.681)[0])
+        self.assertAlmostEqual(y[1], lonlat_to_webmercator(139.767, 35.681)[1])
+
+
+class TestTileSet(unittest.TestCase):
+    def test_tiles_are_sorted_and_unique(self):
+        tile_set = TileSet.from_tiles([[3, 1, 16], [1, 2, 16], [3, 1, 16], [0, 0, 15]])
+
+        self.assertEqual(len(tile_set), 3)
+        self.assertEqual(tile_set.tiles(), [[0, 0, 15], [1, 2, 16], [3, 1, 16]])
+        self.assertEqual(list(tile_set), tile_set.tiles())
+        self.assertIn([1, 2, 16], tile_set)
+        self.assertIn((3, 1, 16), tile_set)
+        self.assertNotIn([2, 1, 16], tile_set)
+
+    def test_set_operations(self):
+        a = TileSet.from_tiles([[x, 0, 16] for x in range(5)])
+        b = TileSet.from_tiles([[x, 0, 16] for x in range(3, 8)])
+
+        self.assertEqual((a | b).tiles(), [[x, 0, 16] for x in range(8)])
+        self.assertEqual((a - b).tiles(), [[x, 0, 16] for x in range(3)])
+        self.assertEqual((a & b).tiles(), [[3, 0, 16], [4, 0, 16]])
+        self.assertEqual(len(TileSet() | a), 5)
+        self.assertEqual(len(a - TileSet()), 5)
+
+    def test_from_bbox_matches_tiles(self):
+        tile_set = TileSet.from_bbox([139.76, 35.67], [139.78, 35.69], 16)
+
+        self.assertEqual(tile_set, TileSet.from_tiles(tile_set.tiles()))
+        self.assertIn([58212, 25806, 16], tile_set)
+
+    def test_bounds(self):
+        tile_set = TileSet.from_tiles([[5, 6, 4], [58212, 25806, 16]])
+
+        for xyz, bounds in zip(tile_set.tiles(), tile_set.bounds()):
+            for value, expected in zip(bounds, tile_bounds(xyz)):
+                self.assertAlmostEqual(value, expected, places=6)
+
+
+@unittest.skipIf(tile_index.np is None, "NumPy is not installed")
+class TestTileSetWithoutNumpy(TestTileSet):
+    """NumPy の無い環境でも同じ結果になる"""
+
+    def setUp(self):
+        patcher = mock.patch.object(tile_index, "np", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+def tile_point(x, y, z):
+    """タイル座標（小数）の位置の EPSG:3857 の座標"""
+    xmin, _, xmax, ymax = tile_bounds([0, 0, z])
+    size = xmax - xmin
+    return (xmin + x * size, ymax - y * size)
+
+
+class TestPolygonTileCover(unittest.TestCase):
+    def test_rectangle(self):
+        ring = [
+            tile_point(*p, 10) for p in [(2.5, 3.5), (6.5, 3.5), (6.5, 5.5), (2.5, 5.5)]
+        ]
+
+        tiles = polygon_tile_cover([[ring]], 10)
+
+        self.assertEqual(tiles, [[x, y, 10] for x in range(2, 7) for y in range(3, 6)])
+
+    def test_diagonal_corridor(self):
+        ring = [
+            tile_point(*p, 12)
+            for p in [(0.2, 0.5), (0.5, 0.2), (40.5, 40.2), (40.2, 40.5)]
+        ]
+
+        tiles = {tuple(t) for t in polygon_tile_cover([[ring]], 12)}
+
+        # 41x41 の矩形のうち対角線沿いのタイルだけになる
+        self.assertLess(len(tiles), 41 * 3)
+        for i in range(41):
+            self.assertIn((i, i, 12), tiles)
+        self.assertNotIn((0, 40, 12), tiles)
+        self.assertNotIn((40, 0, 12), tiles)
+
+    def test_hole_and_multiple_polygons(self):
+        outer = [
+            tile_point(*p, 8) for p in [(0.5, 0.5), (9.5, 0.5), (9.5, 9.5), (0.5, 9.5)]
+        ]
+        hole = [
+            tile_point(*p, 8) for p in [(3.2, 3.2), (3.2, 6.8), (6.8, 6.8), (6.8, 3.2)]
+        ]
+        other = [
+            tile_point(*p, 8)
+            for p in [(20.1, 0.1), (20.9, 0.1), (20.9, 0.9), (20.1, 0.9)]
+        ]
+
+        tiles = {tuple(t) for t in polygon_tile_cover([[outer, hole], [other]], 8)}
+
+        self.assertIn((1, 1, 8), tiles)
+        self.assertIn((3, 3, 8), tiles)
+        self.assertNotIn((4, 4, 8), tiles)
+        self.assertNotIn((5, 5, 8), tiles)
+        self.assertIn((20, 0, 8), tiles)
+        self.assertEqual(len(tiles), 100 - 4 + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+"""ベンチマーク用のローカルタイルサーバ
+
+国土地理院のサーバの代わりに /{z}/{x}/{y}.pbf へタイルを返す。応答の遅延と
+一時的なエラー（503）の割合を指定できる。
+"""
+
+import http.server
+import os
+import random
+import threading
+import time
+
+
+class _TileHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        try:
+            z, x, y = (
+                int(v) for v in self.path.lstrip("/").replace(".pbf", "").split("/")
+            )
+        except ValueError:
+            z = x = y = None
+
+        if server.latency:
+            time.sleep(server.latency)
+        with server.lock:
+            server.requests += 1
+            injected_error = server.rng.random() < server.error_rate
+
+        if injected_error:
+            status, body = 503, b""
+        elif z is None:
+            status, body = 400, b""
+        else:
+            body = server.tiles([x, y, z])
+            status = 404 if body is None else 200
+            body = body or b""
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/vnd.mapbox-vector-tile")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TileServer:
+    """別スレッドで動くタイルサーバ（with 文で起動・停止する）
+
+    Args:
+        tiles: タイル座標 [x, y, z] を受け取り、タイルの bytes（無い場合は None）を返す関数
+        latency: 応答ごとの遅延（秒）
+        error_rate: 503 を返す割合（0-1）
+        seed: エラーを決める乱数のシード
+    """
+
+    def __init__(self, tiles, latency=0.0, error_rate=0.0, seed=0):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _TileHandler)
+        self.server.daemon_threads = True
+        self.server.tiles = tiles
+        self.server.latency = latency
+        self.server.error_rate = error_rate
+        self.server.rng = random.Random(seed)
+        self.server.lock = threading.Lock()
+        self.server.requests = 0
+        self._thread = None
+
+    @property
+    def url_template(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/{{z}}/{{x}}/{{y}}.pbf"
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def fixture_tiles(folder):
+    """記録したタイル（folder/{z}/{x}/{y}.pbf、タイルキャッシュと同じ構成）を返す関数
+
+    同じ座標のタイルがあればそれを、無ければ座標から選んだ記録済みのタイルを返す。
+    少数の記録から任意の数のタイルの範囲を作るため。
+    """
+    tiles = {}
+    for root, _, files in os.walk(folder):
+        for filename in files:
+            if not filename.endswith(".pbf"):
+                continue
+            path = os.path.join(root, filename)
+            parts = os.path.relpath(path, folder)[: -len(".pbf")].split(os.sep)
+            try:
+                z, x, y = (int(v) for v in parts[-3:])
+            except ValueError:
+                continue
+            with open(path, "rb") as f:
+                tiles[(x, y, z)] = f.read()
+    if not tiles:
+        raise ValueError(f"no .pbf tiles in {folder}")
+
+    recorded = [tiles[key] for key in sorted(tiles)]
+
+    def get(xyz):
+        x, y, z = xyz
+        return tiles.get((x, y, z)) or recorded[(x * 31 + y) % len(recorded)]
+
+    return get